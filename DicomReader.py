@@ -1,64 +1,57 @@
+import time
+STARTED = time.perf_counter()
+
+import os
+import sys
+import sqlite3
+import threading
 import tkinter as tk
 from tkinter import filedialog, messagebox
 from tkinter import ttk
-import pydicom
-import numpy as np
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import matplotlib.pyplot as plt
-import matplotlib.animation as animation
-from datetime import datetime
-from PyQt5.QtWidgets import QFileDialog, QApplication
-from matplotlib.widgets import Slider, Button
-
-# Create QApplication instance
-app = QApplication([])
-
-def anonymize_dicom(dicom_data, prefix):
-    """Anonymize DICOM file by replacing UIDs and sensitive fields with the provided prefix."""
-    # Define sensitive tags, including SOPClassUID and SOPInstanceUID
-    sensitive_tags = {
-    #"Clean Pixel Data"
-        # Tags that may contain pixel data with identification information
-        (0x0008, 0x0008),  # Image Type
-        (0x0052, 0x0006),  # Procedure Code Sequence
-    #"Clean Recognizable Visual Features"
-        # Tags that may lead to visual identification of individuals
-        (0x0010, 0x0010),  # Patient's Name
-        (0x0010, 0x0020),  # Patient ID
-        (0x0010, 0x0030),  # Patient Birth Date
-        (0x0010, 0x0040),  # Patient Sex
-        (0x0008, 0x0020),  # Study Date
-        (0x0008, 0x0030),  # Study Time
-        (0x0008, 0x0090),  # Referring Physician Name
-        (0x0008, 0x0050),  # Accession Number
-        (0x0010, 0x0024),  # Medical Record Number
-    #"Clean Graphics"
-        # Tags that may contain identification information encoded as graphics or text annotations
-        (0x0008, 0x0070),  # Manufacturer
-        (0x0018, 0x1000),  # Device Serial Number
-    #"Clean Structured Content"
-        # Tags that may contain structured report information
-        (0x0054, 0x0220),  # View Position
-        (0x0054, 0x0222),  # View Position Modifier
-    #"Clean Descriptors"
-        # Tags that contain descriptive information which may include sensitive data
-        (0x0008, 0x1030),  # Study Description
-        (0x0020, 0x4000),  # Image Comments
-}
-
-    # Replace sensitive fields with the prefix
-    for tag in sensitive_tags:
-        if tag in dicom_data:
-            dicom_data[tag].value = prefix  # Replace sensitive information with the prefix
-
-    return dicom_data
+from instrumentation import note, recorder, span, timed
+from profile_overlay import ProfileOverlay
+
+# pydicom, numpy, matplotlib and the viewer modules built on them are imported
+# where they are first used, so the window comes up (and the module can be
+# imported as a library) without loading them. Once the window is idle the
+# GUI-free ones are preloaded on a background thread.
+PRELOAD_MODULES = (
+    "pydicom",
+    "numpy",
+    "dicom_core",
+    "async_loader",
+    "matplotlib.figure",
+)
+PRELOAD_DELAY_MS = 200
+
+# Budget for process start to an idle, interactive main window (see benchmarks.py)
+STARTUP_BUDGET_SECONDS = 0.5
+
+def preload_modules():
+    """Import the heavy non-GUI modules in the background; failures are left for first use."""
+    def run():
+        import importlib
+        for name in PRELOAD_MODULES:
+            try:
+                with span("startup.preload", module=name):
+                    importlib.import_module(name)
+            except ImportError:
+                pass
+    threading.Thread(target=run, name="preload", daemon=True).start()
 
-def import_dicom():
-    global dicom_data
+def clear_loaded_data():
+    """Cancel any running import and clear the data and UI of the previous file."""
+    global document
+
+    # Abandon a load that is still running
+    if load_task is not None and not load_task.finished:
+        load_task.cancel()
 
     # Clear any existing data and UI elements related to the previous file
-    dicom_data = None
-    metadata_text.delete("1.0", tk.END)
+    document = None
+    if metadata_tree is not None:
+        metadata_tree.clear()
+    show_metadata_text("")
     metadata_combobox.set('')
     metadata_combobox['values'] = []
     
@@ -66,96 +59,279 @@ def import_dicom():
     for widget in image_frame.winfo_children():
         widget.destroy()
 
-    # Load the new DICOM file
-    ds, filepath_or_message = load_dicom_file()
-    if ds:
-        dicom_data = ds  # Store the loaded DICOM data
-        messagebox.showinfo("Import Successful", f"Loaded DICOM file: {filepath_or_message}")
-        
-        # Update metadata combobox with available DICOM elements sorted alphabetically
-        metadata_options = sorted([
-            element.name
-            for element in dicom_data
-            if element.tag != (0x7FE0, 0x0010)
-        ])
-        metadata_combobox['values'] = metadata_options
-        
-        # Display the DICOM image after successful import
-        if hasattr(ds, 'NumberOfFrames') and len(ds.pixel_array.shape) == 3:
-            display_3d_grid(ds)  # For 3D DICOM volume
-        elif hasattr(ds, 'NumberOfFrames'):
-            display_m2d(ds)  # For multi-frame DICOM
-        else:
-            display_dicom(ds)  # For single-frame DICOM
-    else:
-        messagebox.showerror("Import Failed", filepath_or_message)
+def set_document(new_document):
+    """Make new_document the loaded file and list its element names, sorted alphabetically."""
+    global document
+    document = new_document
+    # PixelData is still on disk at this point, so this is header work only
+    metadata_combobox['values'] = document.view.names
+
+def show_metadata_text(text):
+    """Replace the metadata panel's contents in a single insert."""
+    if metadata_tree is not None and metadata_tree.winfo_ismapped():
+        metadata_tree.pack_forget()
+        metadata_text.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+    metadata_text.delete("1.0", tk.END)
+    metadata_text.insert(tk.END, text)
+
+def show_metadata_tree():
+    """Show the whole header as a tree whose sequences expand on demand."""
+    global metadata_tree
+    if metadata_tree is None:
+        from metadata_tree import MetadataTree
+        metadata_tree = MetadataTree(top_frame)
+    if not metadata_tree.winfo_ismapped():
+        metadata_text.pack_forget()
+        metadata_tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+    metadata_tree.show(document.view)
 
-def format_dicom_date(date_str):
-    """Format DICOM date strings to YYYY-MM-DD format"""
-    if not date_str or not isinstance(date_str, str):
-        return date_str
-    try:
-        # Remove any dots or separators
-        date_str = date_str.replace('.', '').replace('-', '')
-        # Handle YYYYMMDD format
-        if len(date_str) == 8:
-            return datetime.strptime(date_str, "%Y%m%d").strftime("%Y-%m-%d")
-        return date_str
-    except ValueError:
-        return date_str
-
-def format_dicom_time(time_str):
-    """Format DICOM time strings to HH:MM:SS format"""
-    if not time_str or not isinstance(time_str, str):
-        return time_str
-    try:
-        # Remove any trailing fractional seconds and separators
-        time_str = time_str.split('.')[0].replace(':', '')
-        # Handle HHMMSS format
-        if len(time_str) == 6:
-            return datetime.strptime(time_str, "%H%M%S").strftime("%H:%M:%S")
-        return time_str
-    except ValueError:
-        return time_str
-
-def load_dicom_file():
-    """Opens a file dialog to load a DICOM file."""
-    try:
-        options = QFileDialog.Options()
-        filepath, _ = QFileDialog.getOpenFileName(
-            None, "Open DICOM File", "", 
-            "DICOM Files (*.dcm);;All Files (*)", 
-            options=options)
-        
-        if not filepath:
-            return None, "No file selected."
-        ds = pydicom.dcmread(filepath)
-        return ds, filepath
-    except Exception as e:
-        return None, f"Error loading file: {str(e)}"
+def import_dicom():
+    global load_task
+    from async_loader import DicomLoadTask
 
-def display_dicom(ds):
+    clear_loaded_data()
+
+    # Ask for the new DICOM file; reading and decoding happen on a worker thread
+    filepath = ask_dicom_filepath()
+    if not filepath:
+        messagebox.showerror("Import Failed", "No file selected.")
+        return
+
+    def on_progress(message, percent):
+        status_label.config(text=message)
+        progress_bar['value'] = percent
+
+    def on_metadata(ds):
+        global archive_search_index
+        from dicom_core import DicomDocument
+        set_document(DicomDocument(ds))  # Store the loaded DICOM data
+        archive_search_index = None  # The file was just added to the metadata index
+        status_label.config(text=f"Loaded DICOM file: {filepath} (decoding image...)")
+
+    def on_pixels(ds, provider):
+        status_label.config(text=f"Loaded DICOM file: {filepath}")
+        cancel_button.config(state=tk.DISABLED)
+        display_image(ds, provider)
+
+    def on_error(error):
+        status_label.config(text="Import failed")
+        progress_bar['value'] = 0
+        cancel_button.config(state=tk.DISABLED)
+        messagebox.showerror("Import Failed", f"Error loading file: {error}")
+
+    cancel_button.config(state=tk.NORMAL)
+    load_task = DicomLoadTask(root, filepath, read_and_index, on_metadata, on_pixels,
+                              on_error, on_progress).start()
+
+def import_folder():
+    """Import a folder of DICOM files and open one of its series as a volume."""
+    global load_task
+    from async_loader import CallTask
+    from series_index import load_folder
+
+    clear_loaded_data()
+
+    folder = filedialog.askdirectory(title="Open DICOM Folder")
+    if not folder:
+        return
+
+    def on_done(series_list):
+        cancel_button.config(state=tk.DISABLED)
+        progress_bar['value'] = 100
+        if not series_list:
+            status_label.config(text="No DICOM images found")
+            messagebox.showerror("Import Failed", f"No DICOM images found in {folder}")
+            return
+        status_label.config(text=f"Indexed {sum(len(s) for s in series_list)} files "
+                                 f"in {len(series_list)} series")
+        update_index_in_background(folder)
+        if len(series_list) == 1:
+            open_series(series_list[0])
+        else:
+            choose_series(series_list)
+
+    def on_error(error):
+        cancel_button.config(state=tk.DISABLED)
+        progress_bar['value'] = 0
+        status_label.config(text="Import failed")
+        messagebox.showerror("Import Failed", f"Error indexing folder: {error}")
+
+    # Only the few tags needed to group and sort series are read, in parallel on a worker;
+    # the full metadata index is brought up to date afterwards, in the background
+    status_label.config(text=f"Indexing {folder}...")
+    progress_bar['value'] = 10
+    cancel_button.config(state=tk.NORMAL)
+    load_task = CallTask(root, load_folder, (folder,), on_done, on_error).start()
+
+def update_index_in_background(folder):
+    """Queue an update of the persistent metadata index with every file under folder.
+
+    Updates run one at a time on their own worker, so opening a folder never
+    waits for its elements to be written; indexed-file searches queue behind them.
+    """
+    global index_updates, index_updates_submitted, archive_search_index
+    index = get_metadata_index()
+    if index is None:
+        return
+    if index_updates is None:
+        from concurrent.futures import ThreadPoolExecutor
+        index_updates = ThreadPoolExecutor(max_workers=1, thread_name_prefix="metadata-index")
+
+    def on_updated(future):
+        if not future.cancelled() and future.exception() is not None:
+            print(f"Could not index {folder}: {future.exception()}")
+
+    index_updates_submitted += 1
+    archive_search_index = None  # Rebuilt, after this update, by the next indexed-file search
+    index_updates.submit(index.update_folder, folder).add_done_callback(on_updated)
+
+def choose_series(series_list):
+    """Let the user pick one of several series found in a folder."""
+    chooser = tk.Toplevel()
+    chooser.title("Select Series")
+
+    listbox = tk.Listbox(chooser, width=80, height=min(len(series_list), 15))
+    for series in series_list:
+        listbox.insert(tk.END, series.label)
+    listbox.selection_set(0)
+    listbox.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+
+    def open_selected(event=None):
+        selection = listbox.curselection()
+        if selection:
+            chooser.destroy()
+            open_series(series_list[selection[0]])
+
+    listbox.bind('<Double-Button-1>', open_selected)
+    open_button = tk.Button(chooser, text="Open Series", command=open_selected)
+    open_button.pack(pady=5)
+
+def open_series(series):
+    """Show a sorted series: metadata from its first file, slices as one volume."""
+    from dicom_core import DicomDocument
+    set_document(DicomDocument.from_series(series))
+    display_image(document.ds, document.frames)
+
+def cancel_import():
+    """Cancel the import that is currently running."""
+    if load_task is not None and not load_task.finished:
+        load_task.cancel()
+        status_label.config(text="Import cancelled")
+        progress_bar['value'] = 0
+    cancel_button.config(state=tk.DISABLED)
+
+@timed("ui.display_image")
+def display_image(ds, provider=None):
+    """Display a loaded dataset with the viewer that matches its layout."""
+    from dicom_core import MULTI_FRAME, VOLUME, image_kind
+    # The dispatch is decided from the header so pixels are only decoded by the display function
+    kind = image_kind(ds, provider)
+    if kind == VOLUME:
+        display_3d_grid(ds, provider)  # For 3D DICOM volume
+    elif kind == MULTI_FRAME:
+        display_m2d(ds, provider)  # For multi-frame DICOM
+    else:
+        display_dicom(ds, provider)  # For single-frame DICOM
+
+# Number of mosaic tiles rendered per Tk event-loop step in display_3d_grid
+MOSAIC_TILES_PER_STEP = 16
+
+def get_metadata_index():
+    """Return the persistent metadata index, opening it on first use (None if unavailable)."""
+    global metadata_index
+    if metadata_index is None:
+        from metadata_index import MetadataIndex
+        try:
+            metadata_index = MetadataIndex()
+        except (sqlite3.Error, OSError) as e:
+            print(f"Metadata index unavailable: {e}")
+            return None
+    return metadata_index
+
+def read_and_index(filepath):
+    """Read a file with deferred PixelData and record its header in the metadata index."""
+    from dicom_core import read_dicom
+    ds = read_dicom(filepath)
+    index = get_metadata_index()
+    if index is not None:
+        try:
+            index.add_dataset(filepath, ds)
+        except (sqlite3.Error, OSError) as e:
+            print(f"Could not index {filepath}: {e}")
+    return ds
+
+def ask_dicom_filepath():
+    """Opens a file dialog and returns the chosen DICOM file path ('' if cancelled)."""
+    filepath = filedialog.askopenfilename(
+        title="Open DICOM File",
+        filetypes=[("DICOM Files", "*.dcm"), ("All Files", "*")])
+    return filepath or ""
+
+# Images with a side at least this long are shown through a tile pyramid
+PYRAMID_MIN_SIDE = 4096
+
+def display_dicom(ds, provider=None):
     """Displays a single DICOM image."""
     if ds is None:
         print("No file loaded.")
         return
-    
+    import matplotlib.pyplot as plt
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+    from frame_provider import get_frame_provider
+    provider = provider or get_frame_provider(ds)
+
+    # Clear previous widgets (and release their tile pyramids) in image_frame
+    for widget in image_frame.winfo_children():
+        widget.destroy()
+
     # Create a new figure and canvas
     fig, ax = plt.subplots()
-    ax.imshow(ds.pixel_array, cmap='gray')
     ax.set_title("DICOM Viewer")
     ax.axis('off')
-    
-    # Create a canvas widget and pack it into the image_frame
     canvas = FigureCanvasTkAgg(fig, master=image_frame)
+
+    if max(provider.frame_shape[:2]) >= PYRAMID_MIN_SIDE:
+        # Only the tiles in view are windowed and drawn, at the resolution of the
+        # current zoom; scroll to zoom, use the toolbar to pan
+        from matplotlib.backends.backend_tkagg import NavigationToolbar2Tk
+        from rendering import TiledImageRenderer
+        from tile_pyramid import TilePyramid
+        from windowing import WindowLevel
+        source = provider[0]
+        step = max(1, max(source.shape[:2]) // 1024)
+        window = WindowLevel(ds, source[::step, ::step])
+        renderer = TiledImageRenderer(canvas, ax, TilePyramid(source, transform=window))
+        note("pyramid.levels", renderer.pyramid.levels)
+        canvas.get_tk_widget().bind("<Destroy>", lambda event: renderer.disconnect(), add="+")
+        toolbar = NavigationToolbar2Tk(canvas, image_frame, pack_toolbar=False)
+        toolbar.update()
+        toolbar.pack(side=tk.BOTTOM, fill=tk.X)
+    else:
+        from dicom_core import render_frame
+        # Map stored values through rescale and window/level to display values
+        ax.imshow(render_frame(provider, 0, ds=ds), cmap='gray', vmin=0, vmax=255)
+
+    # Pack the canvas widget into the image_frame
     canvas.draw()
     canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
 
-def display_m2d(ds):
+def display_m2d(ds, provider=None):
     """Displays M2D (multi-frame) DICOM files with a slider."""
+    import matplotlib.pyplot as plt
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+    from matplotlib.widgets import Slider, Button
+    from cine import CinePlayer
+    from frame_cache import FrameCache
+    from frame_provider import get_frame_provider
+    from rendering import BlitImageRenderer
+    from windowing import WindowLevel
     try:
-        frames = ds.pixel_array
-        print(f"Frame shape: {frames.shape}")
+        # Frames are decoded one at a time, windowed to display values through a
+        # single LUT lookup, then cached and prefetched ahead of playback
+        provider = provider or get_frame_provider(ds)
+        window = WindowLevel(ds, provider[0])
+        frames = FrameCache(provider, transform=window)
+        note("m2d.frame_shape", frames.shape)
         
         # Clear previous widgets in image_frame
         for widget in image_frame.winfo_children():
@@ -163,11 +339,24 @@ def display_m2d(ds):
             
         fig, ax = plt.subplots(figsize=(15, 12))
         plt.subplots_adjust(bottom=0.2)
-        
-        im = ax.imshow(frames[0])
-        ax.set_title(f"Frame 1/{len(frames)}")
-        ax.axis('off')
-        
+
+        # Create a canvas widget and pack it into the image_frame
+        canvas = FigureCanvasTkAgg(fig, master=image_frame)
+        canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+
+        # Frames are blitted into a single image; only the image and title are redrawn
+        renderer = BlitImageRenderer(canvas, ax, vmin=0, vmax=255)
+
+        @timed("m2d.show_frame")
+        def show_frame(frame_idx):
+            title = f"Frame {frame_idx+1}/{len(frames)}"
+            if player.playing:
+                title += f"  ({player})"
+            renderer.show(frames[frame_idx], title)
+
+        # Playback follows the file's Frame Time / Cine Rate and skips frames when rendering falls behind
+        player = CinePlayer.for_dataset(canvas.get_tk_widget(), ds, len(frames), show_frame)
+
         slider_ax = plt.axes([0.1, 0.05, 0.8, 0.03])
         slider = Slider(slider_ax, 'Frame', 0, len(frames)-1, valinit=0, valstep=1)
         
@@ -175,9 +364,7 @@ def display_m2d(ds):
             try:
                 frame_idx = int(slider.val)
                 if 0 <= frame_idx < len(frames):
-                    im.set_array(frames[frame_idx])
-                    ax.set_title(f"Frame {frame_idx+1}/{len(frames)}")
-                    fig.canvas.draw_idle()
+                    player.seek(frame_idx)
             except Exception as e:
                 print(f"Error updating frame: {e}")
         
@@ -187,98 +374,111 @@ def display_m2d(ds):
         play_ax = plt.axes([0.1, 0.1, 0.1, 0.04])
         play_button = Button(play_ax, 'Play')
         
-        is_playing = [False]
-        anim = None
-        
-        def animate(frame):
-            if is_playing[0]:
-                try:
-                    current_frame = int(slider.val)
-                    next_frame = (current_frame + 1) % len(frames)
-                    slider.set_val(next_frame)
-                except Exception as e:
-                    print(f"Animation error: {e}")
-                    is_playing[0] = False
-                    play_button.label.set_text('Play')
-            return [im]
-            
         def play(event):
-            nonlocal anim
-            is_playing[0] = not is_playing[0]
-            play_button.label.set_text('Pause' if is_playing[0] else 'Play')
-            
-            if is_playing[0]:
-                anim = animation.FuncAnimation(fig, animate, interval=300, blit=True)
-            else:
-                if anim is not None:
-                    anim.event_source.stop()
+            player.toggle()
+            play_button.label.set_text('Pause' if player.playing else 'Play')
+            if not player.playing:
+                # The slider is left alone during playback; catch it up without re-rendering
+                slider.eventson = False
+                slider.set_val(player.current)
+                slider.eventson = True
+                show_frame(player.current)
+                note("cine.playback", str(player))
+            canvas.draw_idle()
         
         play_button.on_clicked(play)
-        
-        # Create a canvas widget and pack it into the image_frame
-        canvas = FigureCanvasTkAgg(fig, master=image_frame)
-        canvas.draw()
-        canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+
+        renderer.show(frames[0], f"Frame 1/{len(frames)}")
         
     except Exception as e:
         messagebox.showerror("Error", f"Error displaying image: {e}")
 
-def display_3d_grid(ds):
-    """Displays a 3D DICOM volume as a grid of slices."""
+def display_3d_grid(ds, provider=None):
+    """Displays a 3D DICOM volume as a mosaic of slice thumbnails."""
+    import matplotlib.pyplot as plt
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+    from frame_provider import get_frame_provider
+    from mosaic import Mosaic
+    from windowing import WindowLevel
     try:
-        slices = ds.pixel_array  # Load 3D volume slices
-        print(f"Volume shape: {slices.shape}")  # (depth, height, width)
+        slices = provider or get_frame_provider(ds)  # Lazily loaded 3D volume slices
+        note("volume.shape", slices.shape)  # (depth, height, width)
 
         # Clear previous widgets in image_frame
         for widget in image_frame.winfo_children():
             widget.destroy()
 
-        # Grid configuration
-        num_slices = slices.shape[0]  # Number of 2D slices
-        grid_cols = int(np.ceil(np.sqrt(num_slices)))  # Number of columns
-        grid_rows = int(np.ceil(num_slices / grid_cols))  # Number of rows
-
-        fig, axes = plt.subplots(grid_rows, grid_cols, figsize=(90, 75))  # Increase figure size
-        axes = axes.flatten()
+        # One array holding a downsampled tile per slice, shown with a single imshow
+        mosaic = Mosaic(slices, transform=WindowLevel(ds, slices[0]))
+        num_slices = mosaic.num_tiles
 
-        # Plot each slice
-        for idx, ax in enumerate(axes):
-            if idx < num_slices:
-                ax.imshow(slices[idx], cmap='gray')
-                ax.axis('off')
-            else:
-                ax.axis('off')  # Hide unused axes
-
-        # Adjust layout
+        fig, ax = plt.subplots(figsize=(10, 10))
+        im = ax.imshow(mosaic.array, cmap='gray', vmin=0, vmax=1, interpolation='nearest')
+        ax.set_title(f"Slices {num_slices} (click a slice to open it)")
+        ax.axis('off')
         plt.tight_layout()
-        ax.set_title(f"Slices {num_slices}")
 
         # Add button for showing individual slices
         show_slices_button = tk.Button(image_frame, text="Show Individual Slices", 
-                                       command=lambda: show_slices(ds))
+                                       command=lambda: show_slices(ds, 0, slices))
         show_slices_button.pack(pady=10)
 
+        mpr_button = tk.Button(image_frame, text="MPR View (Axial/Coronal/Sagittal)",
+                               command=lambda: show_mpr(ds, slices))
+        mpr_button.pack(pady=(0, 10))
+
         # Create a canvas widget and pack it into the image_frame
         canvas = FigureCanvasTkAgg(fig, master=image_frame)
         canvas.draw()
         canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
 
+        # Clicking a tile opens the slice viewer at that slice
+        def on_click(event):
+            if event.inaxes is ax:
+                index = mosaic.index_at(event.xdata + 0.5, event.ydata + 0.5)
+                if index is not None:
+                    show_slices(ds, index, slices)
+
+        canvas.mpl_connect('button_press_event', on_click)
+
+        # Fill the mosaic progressively so the first tiles appear straight away
+        def fill_next_tiles():
+            if not canvas.get_tk_widget().winfo_exists():
+                return
+            with span("mosaic.fill"):
+                mosaic.fill(MOSAIC_TILES_PER_STEP)
+            im.set_data(mosaic.array)
+            canvas.draw_idle()
+            if not mosaic.done:
+                image_frame.after(1, fill_next_tiles)
+
+        image_frame.after(1, fill_next_tiles)
+
     except Exception as e:
         messagebox.showerror("Error", f"Error displaying 3D grid: {e}")
 
-def show_slices(ds):
+def show_slices(ds, start_slice=0, provider=None):
     """Opens a new window to display DICOM slices with navigation controls."""
+    import matplotlib.pyplot as plt
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+    from frame_cache import FrameCache
+    from frame_provider import get_frame_provider
+    from rendering import BlitImageRenderer
+    from windowing import WindowLevel
+
     # Create a new top-level window
     slice_window = tk.Toplevel()
     slice_window.title("DICOM Slice Viewer")
     slice_window.geometry("800x900")  # Adjust size as needed
 
     class SliceViewer:
-        def __init__(self, master, slices):
+        def __init__(self, master, slices, window, start_slice=0):
             self.master = master
-            self.slices = slices
-            self.current_slice = 0
+            self.slices = FrameCache(slices)  # Decoded slices, prefetched in the direction of travel
+            self.window = window  # Stored value -> display LUT, adjustable by right-dragging
+            self.current_slice = min(max(start_slice, 0), len(slices) - 1)
             self.total_slices = len(slices)
+            self._window_drag = None
 
             # Create main container
             self.main_container = tk.Frame(master)
@@ -304,6 +504,15 @@ def show_slices(ds):
             self.canvas.draw()
             self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
 
+            # Reuses one image artist and blits only the image and title on each step
+            self.renderer = BlitImageRenderer(self.canvas, self.ax, vmin=0, vmax=255,
+                                              pad=20, fontsize=12)
+
+            # Right-drag adjusts window width (horizontal) and level (vertical)
+            self.canvas.mpl_connect('button_press_event', self.start_window_drag)
+            self.canvas.mpl_connect('motion_notify_event', self.drag_window)
+            self.canvas.mpl_connect('button_release_event', self.end_window_drag)
+
             # Create navigation frame
             self.nav_frame = tk.Frame(master)
             self.nav_frame.pack(fill=tk.X, padx=10, pady=10)
@@ -337,6 +546,7 @@ def show_slices(ds):
             # Add keyboard bindings
             master.bind('<Left>', lambda e: self.show_previous_slice())
             master.bind('<Right>', lambda e: self.show_next_slice())
+            master.bind('r', lambda e: self.reset_window())
 
             # Create a frame for additional information
             self.info_frame = tk.Frame(master)
@@ -345,15 +555,25 @@ def show_slices(ds):
             # Add keyboard shortcut information
             self.shortcut_label = tk.Label(
                 self.info_frame,
-                text="Keyboard shortcuts: ← (Previous) | → (Next)",
+                text="Keyboard shortcuts: ← (Previous) | → (Next) | R (Reset window) | Right-drag: window/level",
                 font=("Arial", 10),
                 fg='gray'
             )
             self.shortcut_label.pack(pady=5)
 
+            # Frames-per-second counter for the slice renderer
+            self.fps_label = tk.Label(
+                self.info_frame,
+                text="",
+                font=("Arial", 9),
+                fg='gray'
+            )
+            self.fps_label.pack()
+
             # Display first slice
             self.update_display()
 
+        @timed("slice.update_display")
         def update_display(self):
             """Update the displayed slice and counter."""
             # Update counter with current slice number
@@ -361,16 +581,13 @@ def show_slices(ds):
                 text=f"Slice {self.current_slice + 1} of {self.total_slices}"
             )
 
-            # Clear and update the image
-            self.ax.clear()
-            self.ax.imshow(self.slices[self.current_slice], cmap='gray')
-            self.ax.axis('off')
-            
-            # Update the title with slice information
-            self.ax.set_title(f"Viewing Slice {self.current_slice + 1}/{self.total_slices}", 
-                            pad=20, fontsize=12)
-            
-            self.canvas.draw()
+            # Update the image and the title with slice information in place
+            self.renderer.show(self.window(self.slices[self.current_slice]),
+                               f"Viewing Slice {self.current_slice + 1}/{self.total_slices}")
+            self.fps_label.config(
+                text=f"W {self.window.width:.0f} / L {self.window.center:.0f} | "
+                     f"Rendering: {self.renderer.fps}"
+            )
 
             # Update button states and appearance
             if self.current_slice == 0:
@@ -383,6 +600,28 @@ def show_slices(ds):
             else:
                 self.next_button.config(state=tk.NORMAL, bg='#4a90e2')
 
+        def start_window_drag(self, event):
+            """Begin a window/level drag with the right mouse button."""
+            if event.button == 3 and self.window.applies:
+                self._window_drag = (event.x, event.y, self.window.center, self.window.width)
+
+        def drag_window(self, event):
+            """Update window/level from the drag distance; the LUT is cached per setting."""
+            if self._window_drag is None or event.x is None:
+                return
+            x0, y0, center, width = self._window_drag
+            step = max(self.window.default_window[1] / 500.0, 0.1)
+            self.window.set_window(center + (event.y - y0) * step, width + (event.x - x0) * step)
+            self.update_display()
+
+        def end_window_drag(self, event):
+            self._window_drag = None
+
+        def reset_window(self):
+            """Restore the window from the DICOM header."""
+            self.window.reset_window()
+            self.update_display()
+
         def show_previous_slice(self):
             """Display the previous slice if available."""
             if self.current_slice > 0:
@@ -396,23 +635,23 @@ def show_slices(ds):
                 self.update_display()
 
     try:
-        # Get the pixel array from the DICOM dataset
-        slices = ds.pixel_array
-        
+        # Frame provider over the DICOM dataset (or a whole series); a single-frame image is one slice
+        slices = provider or get_frame_provider(ds)
+
         # Handle different dimensional data
-        if len(slices.shape) == 2:  # Single slice
-            slices = slices[np.newaxis, ...]  # Add dimension to make it 3D
-        elif len(slices.shape) == 3:  # Multiple slices
-            pass
-        else:
+        if len(slices.frame_shape) not in (2, 3):
             raise ValueError("Unsupported image dimensions")
 
         # Create the slice viewer
-        viewer = SliceViewer(slice_window, slices)
+        window = WindowLevel(ds, slices[min(max(start_slice, 0), len(slices) - 1)])
+        viewer = SliceViewer(slice_window, slices, window, start_slice)
 
         # Configure window closing
         def on_closing():
             plt.close(viewer.fig)  # Clean up matplotlib figure
+            viewer.slices.close()
+            if provider is None:
+                slices.close()  # Only close the provider this window opened itself
             slice_window.destroy()
 
         slice_window.protocol("WM_DELETE_WINDOW", on_closing)
@@ -421,11 +660,110 @@ def show_slices(ds):
         messagebox.showerror("Error", f"Error displaying slices: {str(e)}")
         slice_window.destroy()
 
+def show_mpr(ds, provider=None):
+    """Open axial, coronal and sagittal views of a volume in a new window."""
+    import matplotlib.pyplot as plt
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+    from async_loader import CallTask
+    from frame_provider import get_frame_provider
+    from mpr import PLANES, MPRVolume, volume_spacing
+    from rendering import BlitImageRenderer
+    from windowing import WindowLevel
+    slices = provider or get_frame_provider(ds)
+    if len(slices) < 2 or len(slices.frame_shape) != 2:
+        messagebox.showerror("MPR", "Multiplanar views need a grayscale volume with several slices.")
+        return
+
+    class MPRViewer:
+        def __init__(self, master, mpr, window):
+            self.master = master
+            self.mpr = mpr
+            self.window = window  # Shared stored value -> display LUT
+            self.indices = {plane: mpr.num_slices(plane) // 2 for plane in PLANES}
+
+            self.fig, axes = plt.subplots(1, 3, figsize=(15, 6))
+            self.axes = dict(zip(PLANES, axes))
+            self.canvas = FigureCanvasTkAgg(self.fig, master=master)
+            self.canvas.draw()
+            self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+
+            # One blitting renderer per plane, so moving one plane redraws only that Axes
+            self.renderers = {plane: BlitImageRenderer(self.canvas, ax, vmin=0, vmax=255)
+                              for plane, ax in self.axes.items()}
+
+            # Scroll moves through the plane under the cursor; a click centres the other two planes there
+            self.canvas.mpl_connect('scroll_event', self.on_scroll)
+            self.canvas.mpl_connect('button_press_event', self.on_click)
+
+            help_label = tk.Label(master, text="Scroll: move through a plane    Click: move the other planes to that point")
+            help_label.pack(pady=5)
+
+            for plane in PLANES:
+                self.update_plane(plane)
+
+        def plane_at(self, event):
+            for plane, ax in self.axes.items():
+                if event.inaxes is ax:
+                    return plane
+            return None
+
+        @timed("mpr.update_plane")
+        def update_plane(self, plane):
+            index = self.indices[plane]
+            frame = self.window(self.mpr.plane(plane, index))
+            self.renderers[plane].show(frame, f"{plane.capitalize()} {index + 1}/{self.mpr.num_slices(plane)}")
+
+        def on_scroll(self, event):
+            plane = self.plane_at(event)
+            if plane is None:
+                return
+            step = 1 if event.button == 'up' else -1
+            index = min(max(self.indices[plane] + step, 0), self.mpr.num_slices(plane) - 1)
+            if index != self.indices[plane]:
+                self.indices[plane] = index
+                self.update_plane(plane)
+
+        def on_click(self, event):
+            plane = self.plane_at(event)
+            if plane is None or event.button != 1 or event.xdata is None:
+                return
+            position = self.mpr.locate(plane, int(round(event.ydata)), int(round(event.xdata)))
+            for other, index in zip(PLANES, position):
+                if index is not None and index != self.indices[other]:
+                    self.indices[other] = index
+                    self.update_plane(other)
+
+    def open_viewer(volume):
+        status_label.config(text="")
+        mpr_window = tk.Toplevel()
+        mpr_window.title("Multiplanar Reconstruction")
+        try:
+            spacing = volume_spacing(ds, getattr(slices, "slice_spacing", None))
+            mpr = MPRVolume(volume, spacing)
+            window = WindowLevel(ds, volume[len(volume) // 2])
+            viewer = MPRViewer(mpr_window, mpr, window)
+        except Exception as e:
+            messagebox.showerror("Error", f"Error displaying MPR: {e}")
+            mpr_window.destroy()
+            return
+
+        def on_closing():
+            plt.close(viewer.fig)
+            mpr_window.destroy()
+
+        mpr_window.protocol("WM_DELETE_WINDOW", on_closing)
+
+    def on_error(error):
+        status_label.config(text="")
+        messagebox.showerror("Error", f"Error loading volume: {error}")
+
+    # Memory-mapped files are used in place; other sources are read once into a single array
+    status_label.config(text="Loading volume for MPR...")
+    CallTask(root, slices.as_array, (), open_viewer, on_error).start()
+
 def anonymize_file():
     """Anonymize selected DICOM file."""
-    global dicom_data
-
-    if dicom_data is None:
+    if document is None:
         messagebox.showwarning("No DICOM File", "Please load a DICOM file first.")
         return
 
@@ -436,220 +774,149 @@ def anonymize_file():
 
     try:
         # Anonymize the DICOM file using the prefix
-        dicom_data = anonymize_dicom(dicom_data, prefix)
+        document.anonymize(prefix)
 
         # Save the anonymized file
         save_path = filedialog.asksaveasfilename(defaultextension=".dcm",
                                                 filetypes=[("DICOM files", "*.dcm")])
         if save_path:
-            dicom_data.save_as(save_path)  # Use save_as to save the DICOM file
+            # Files read from disk are rewritten header-first with PixelData copied in chunks
+            document.save(save_path)
             messagebox.showinfo("Anonymization", f"DICOM file has been anonymized and saved as {save_path}")
         else:
             messagebox.showinfo("Save Canceled", "File was not saved.")
     except Exception as e:
         messagebox.showerror("Error", f"Anonymization failed: {e}")
         
+@timed("ui.explore_group")
 def explore_group(group_name):
     """Explore the values of a specific DICOM group."""
-    global dicom_data
+    from dicom_core import ALL_GROUP
 
-    if dicom_data is not None:
-        metadata_text.delete("1.0", tk.END)
-        
-        # Define DICOM groups and their corresponding tags
-        group_tags = {
-    "Study Information": [
-        (0x8, 0x5),
-        (0x8, 0x8),
-        (0x8, 0x12),
-        (0x8, 0x13),
-        (0x8, 0x16),
-        (0x8, 0x18),
-        (0x8, 0x20),
-        (0x8, 0x22),
-        (0x8, 0x23),
-        (0x8, 0x30),
-        (0x8, 0x32),
-        (0x8, 0x33),
-        (0x8, 0x60),
-        (0x8, 0x1030),
-        (0x8, 0x1032),
-        (0x8, 0x103e),
-        (0x8, 0x1111),
-
-    ],
-    "Series Information": [
-        (0x20, 0xd),
-        (0x20, 0xe),
-        (0x20, 0x11),
-        (0x20, 0x13),
-        (0x20, 0x32),
-        (0x20, 0x37),
-        (0x20, 0x52),
-        (0x20, 0x1041),
-        (0x20, 0x4000),
-         #
-    ],
-    "Patient Information": [
-        (0x0010, 0x0010),  # Patient's Name
-        (0x0010, 0x0020),  # Patient ID
-        (0x0010, 0x0030),  # Patient Birth Date
-        (0x0010, 0x0040),  # Patient Sex
-        (0x10, 0x1010),
-    ],
-    "Image Acquisition Parameters": [
-        (0x18, 0x10),
-        (0x18, 0x22),
-        (0x18, 0x50),
-        (0x18, 0x60),
-        (0x18, 0x88),
-        (0x18, 0x90),
-        (0x18, 0x1030),
-        (0x18, 0x1100),
-        (0x18, 0x1120),
-        (0x18, 0x1130),
-        (0x18, 0x1140),
-        (0x18, 0x1151),
-        (0x18, 0x1152),
-        (0x18, 0x1160),
-        (0x18, 0x1210),
-        (0x18, 0x5100),
-
-    ],
-    "Equipment Information": [
-        (0x0008, 0x0070),  # Manufacturer
-        (0x0018, 0x1000),  # Device Serial Number
-        
-    ],
-    "Image Information": [
-        (0x0008, 0x0060),  # Modality
-        (0x0020, 0x0032),  # Image Position (Patient)
-        (0x0020, 0x0037),  # Image Orientation (Patient)
-        (0x0028, 0x0030),  # Pixel Spacing
-        (0x0028, 0x0100),  # Bits Allocated
-        (0x0028, 0x0101),  # Bits Stored
-        (0x0028, 0x0102),  # High Bit
-        (0x0028, 0x1050),  # Window Center
-        (0x0028, 0x1051),  # Window Width
-        (0x0028, 0x1052),  # Rescale Intercept
-        (0x0028, 0x1053),  # Rescale Slope
-        (0x0018, 0x0050),  # Slice Thickness
-    ],
-    "Sensitive Data": [
-        #"Clean Pixel Data"
-        # Tags that may contain pixel data with identification information
-        (0x0008, 0x0008),  # Image Type
-        (0x0052, 0x0006),  # Procedure Code Sequence
-    #"Clean Recognizable Visual Features"
-        # Tags that may lead to visual identification of individuals
-        (0x0010, 0x0010),  # Patient's Name
-        (0x0010, 0x0020),  # Patient ID
-        (0x0010, 0x0030),  # Patient Birth Date
-        (0x0010, 0x0040),  # Patient Sex
-        (0x0008, 0x0020),  # Study Date
-        (0x0008, 0x0030),  # Study Time
-        (0x0008, 0x0090),  # Referring Physician Name
-        (0x0008, 0x0050),  # Accession Number
-        (0x0010, 0x0024),  # Medical Record Number
-    #"Clean Graphics"
-        # Tags that may contain identification information encoded as graphics or text annotations
-        (0x0008, 0x0070),  # Manufacturer
-        (0x0018, 0x1000),  # Device Serial Number
-    #"Clean Structured Content"
-        # Tags that may contain structured report information
-        (0x0054, 0x0220),  # View Position
-        (0x0054, 0x0222),  # View Position Modifier
-    #"Clean Descriptors"
-        # Tags that contain descriptive information which may include sensitive data
-        (0x0008, 0x1030),  # Study Description
-        (0x0020, 0x4000),  # Image Comments
-    ],
-    "All" : []
-        }
-
-        # Get the tags for the selected group
-        selected_group_tags = group_tags.get(group_name)
-        if selected_group_tags is not None:
-            if group_name == "All":
-                selected_group_tags = [
-                    element.tag
-                    for element in dicom_data
-                    if element.tag != (0x7FE0, 0x0010)
-                ]
-            for tag in selected_group_tags:
-                element = dicom_data.get(tag)
-                if element:
-                    value = element.value
-                    if "Date" in element.name:
-                        formatted_value = format_dicom_date(str(value))
-                        metadata_text.insert(tk.END, f"({hex(element.tag.group)}, {hex(element.tag.element)}) {element.name}: {formatted_value}\n")
-                    elif "Time" in element.name:
-                        formatted_value = format_dicom_time(str(value))
-                        metadata_text.insert(tk.END, f"({hex(element.tag.group)}, {hex(element.tag.element)}) {element.name}: {formatted_value}\n")
-                    else:
-                        metadata_text.insert(tk.END, f"({hex(element.tag.group)}, {hex(element.tag.element)}) {element.name}: {value}\n")
-        else:
-            metadata_text.insert(tk.END, "No metadata available for this group.")
+    if document is not None:
+        if group_name == ALL_GROUP:
+            show_metadata_tree()
+            return
+        # Group tables and formatted lines are built once per dataset
+        text = document.group_text(group_name)
+        show_metadata_text("No metadata available for this group." if text is None else text)
 
 def display_metadata(event):
     """Display selected metadata for the DICOM file."""
-    global dicom_data
     selected_metadata = metadata_combobox.get()
 
-    if dicom_data is not None:
-        metadata_text.delete("1.0", tk.END)
-
-        # Find and display the corresponding metadata field
-        for element in dicom_data:
-            if element.name == selected_metadata:
-                value = element.value
-                # Format the date or time if needed
-                if "Date" in element.name:
-                    formatted_value = format_dicom_date(str(value))
-                    metadata_text.insert(tk.END, f"({hex(element.tag.group)}, {hex(element.tag.element)}) {element.name}: {formatted_value}\n")
-                elif "Time" in element.name:
-                    formatted_value = format_dicom_time(str(value))
-                    metadata_text.insert(tk.END, f"({hex(element.tag.group)}, {hex(element.tag.element)}) {element.name}: {formatted_value}\n")
-                else:
-                    metadata_text.insert(tk.END, f"({hex(element.tag.group)}, {hex(element.tag.element)}) {element.name}: {value}\n")
+    if document is not None:
+        show_metadata_text(document.name_text(selected_metadata))
 
+@timed("ui.search_metadata")
 def search_metadata():
-    """Search through DICOM metadata for a specific term."""
-    global dicom_data
-    
-    search_term = search_entry.get().lower()
+    """Search through DICOM metadata for a specific term.
+
+    Plain words match anywhere in element names and values; field queries
+    such as Modality=CT or StudyDate=20200101..20201231 are also accepted.
+    """
+    search_term = search_entry.get().strip()
     
-    if dicom_data is None:
+    if document is None:
         messagebox.showwarning("No DICOM File", "Please load a DICOM file first.")
         return
 
-    metadata_text.delete("1.0", tk.END)
-    found_matches = False
-
-    for element in dicom_data:
-        # Convert to string and make case-insensitive
-        element_name = str(element.name).lower()
-        element_value = str(element.value).lower()
-
-        # Check if search term is in name or value
-        if search_term in element_name or search_term in element_value:
-            value = element.value
-            if "Date" in element.name:
-                formatted_value = format_dicom_date(str(value))
-                metadata_text.insert(tk.END, f"({hex(element.tag.group)}, {hex(element.tag.element)}) {element.name}: {formatted_value}\n")
-            elif "Time" in element.name:
-                formatted_value = format_dicom_time(str(value))
-                metadata_text.insert(tk.END, f"({hex(element.tag.group)}, {hex(element.tag.element)}) {element.name}: {formatted_value}\n")
-            else:
-                metadata_text.insert(tk.END, f"({hex(element.tag.group)}, {hex(element.tag.element)}) {element.name}: {value}\n")
-            found_matches = True
+    # Elements are tokenized once per file; each search is a few index lookups
+    text = document.search_text(search_term)
+
+    show_metadata_text(text or "No matches found.")
+
+# Files listed per indexed-folder search; the total count is always shown
+MAX_SEARCH_RESULTS = 200
+
+def search_index_folder():
+    """Search every file in the persistent metadata index, e.g. Modality=CT StudyDate=20200101..20201231."""
+    from async_loader import CallTask
+    from search_engine import SearchIndex
+    query = search_entry.get().strip()
+    index = get_metadata_index()
+    if not query or index is None:
+        messagebox.showwarning("Search Index", "Enter a query (the metadata index must be available).")
+        return
+
+    def show_results(result):
+        lines = [f"{len(result)} files match ({result.seconds * 1000:.1f} ms)\n"]
+        for path, tags in list(result.items())[:MAX_SEARCH_RESULTS]:
+            lines.append(f"\n{path}\n")
+            for element in index.get_elements(path):
+                if element.tag in tags:
+                    lines.append(f"    ({hex(element.tag.group)}, {hex(element.tag.element)}) {element.name}: {element.value}\n")
+        show_metadata_text("".join(lines))
+        status_label.config(text="")
+
+    def on_done(archive):
+        global archive_search_index
+        if submitted == index_updates_submitted:  # No folder was queued for indexing meanwhile
+            archive_search_index = archive
+        show_results(archive.search(query))
+
+    def on_error(error):
+        status_label.config(text="Search failed")
+        messagebox.showerror("Search Index", f"Error searching the metadata index: {error}")
+
+    if archive_search_index is not None:
+        show_results(archive_search_index.search(query))
+        return
+
+    # The inverted index over all indexed files is built once per session, off the UI thread
+    def build_archive_index():
+        archive = SearchIndex()
+        archive.add_metadata_index(index)
+        return archive
+
+    def build_after_updates():
+        # Queued behind any background folder update, so the search sees every imported file
+        if index_updates is None:
+            return build_archive_index()
+        return index_updates.submit(build_archive_index).result()
+
+    submitted = index_updates_submitted
+    status_label.config(text="Building search index over the metadata index...")
+    CallTask(root, build_after_updates, (), on_done, on_error).start()
+
+def set_profiling(enabled):
+    """Turn hot-path timing and its on-screen overlay on or off."""
+    recorder.enable(enabled)
+    profiling_var.set(enabled)
+    if enabled:
+        profile_overlay.show()
+    else:
+        profile_overlay.hide()
+
+def toggle_profiling(event=None):
+    set_profiling(not recorder.enabled)
 
-    if not found_matches:
-        metadata_text.insert(tk.END, "No matches found.")
+def export_profile():
+    """Save the recorded spans as a Chrome trace, with a text summary next to it."""
+    if not recorder.trace:
+        messagebox.showinfo("Profiling", "Nothing recorded yet. Turn profiling on (F12) and use the viewer first.")
+        return
+    path = filedialog.asksaveasfilename(defaultextension=".json", initialfile="dicom_reader_trace.json",
+                                        filetypes=[("Chrome trace", "*.json")])
+    if not path:
+        return
+    try:
+        count = recorder.export_trace(path)
+        log_path = os.path.splitext(path)[0] + ".log"
+        recorder.write_log(log_path)
+        messagebox.showinfo("Profiling", f"Saved {count} spans to {path}\nSummary: {log_path}\n"
+                                         "Open the trace in chrome://tracing or ui.perfetto.dev.")
+    except OSError as e:
+        messagebox.showerror("Profiling", f"Could not export the profile: {e}")
 
 # Initialize global variables
-dicom_data = None
-image_type = None
+document = None  # DicomDocument of the loaded file or series
+load_task = None  # DicomLoadTask of the import in progress
+metadata_index = None  # MetadataIndex, opened on first use
+archive_search_index = None  # SearchIndex over the whole metadata index
+index_updates = None  # Single-worker executor updating the metadata index in the background
+index_updates_submitted = 0  # Folder updates queued so far; a newer count invalidates a built SearchIndex
+metadata_tree = None  # MetadataTree of the "All Data" view, created on first use
 
 # Create the main window
 if __name__ == "__main__":
@@ -672,6 +939,28 @@ if __name__ == "__main__":
     import_button = tk.Button(anonymization_frame, text="Import DICOM File", command=import_dicom)
     import_button.pack(side=tk.LEFT, padx=5)
 
+    import_folder_button = tk.Button(anonymization_frame, text="Import DICOM Folder", command=import_folder)
+    import_folder_button.pack(side=tk.LEFT, padx=5)
+
+    # Import progress and cancellation
+    cancel_button = tk.Button(anonymization_frame, text="Cancel", command=cancel_import, state=tk.DISABLED)
+    cancel_button.pack(side=tk.RIGHT, padx=5)
+
+    progress_bar = ttk.Progressbar(anonymization_frame, length=150, mode='determinate', maximum=100)
+    progress_bar.pack(side=tk.RIGHT, padx=5)
+
+    status_label = tk.Label(anonymization_frame, text="", fg='gray')
+    status_label.pack(side=tk.RIGHT, padx=5)
+
+    # Hot-path timing: off by default (or DICOM_READER_PROFILE=1), F12 toggles it with an overlay
+    profile_button = tk.Button(anonymization_frame, text="Export Profile...", command=export_profile)
+    profile_button.pack(side=tk.RIGHT, padx=5)
+
+    profiling_var = tk.BooleanVar(value=recorder.enabled)
+    profiling_check = tk.Checkbutton(anonymization_frame, text="Profiling (F12)", variable=profiling_var,
+                                     command=lambda: set_profiling(profiling_var.get()))
+    profiling_check.pack(side=tk.RIGHT, padx=5)
+
     # Create main container
     main_container = tk.Frame(root)
     main_container.pack(fill=tk.BOTH, expand=True)
@@ -716,6 +1005,9 @@ if __name__ == "__main__":
     search_button = tk.Button(search_frame, text="Search", command=search_metadata)
     search_button.pack(side=tk.LEFT)
 
+    search_index_button = tk.Button(search_frame, text="Search Indexed Files", command=search_index_folder)
+    search_index_button.pack(side=tk.LEFT, padx=5)
+
     # Metadata and controls frame
     top_frame = tk.Frame(main_container)
     top_frame.pack(fill=tk.BOTH, expand=True)
@@ -733,5 +1025,22 @@ if __name__ == "__main__":
     image_frame = tk.Frame(main_container)
     image_frame.pack(fill=tk.BOTH, expand=True)
 
+    profile_overlay = ProfileOverlay(root)
+    root.bind('<F12>', toggle_profiling)
+    if recorder.enabled:
+        profile_overlay.show()
+
+    # Startup ends when the event loop first goes idle: the window is up and taking input
+    def on_startup_idle():
+        seconds = time.perf_counter() - STARTED
+        note("startup.seconds", f"{seconds:.3f}")
+        if "--exit-after-startup" in sys.argv:
+            print(f"Startup: {seconds:.3f}s (budget {STARTUP_BUDGET_SECONDS:.3f}s)")
+            root.destroy()
+            return
+        root.after(PRELOAD_DELAY_MS, preload_modules)
+
+    root.after_idle(on_startup_idle)
+
     # Start the GUI event loop
     root.mainloop()
@@ -0,0 +1,286 @@
+"""Compiled, profile-driven de-identification rules.
+
+A profile names one action per attribute:
+
+    remove      delete the element
+    empty       keep the element with an empty value
+    replace     replace the value with the anonymization prefix
+    hash        prefix + keyed hash of the value, so equal values stay linkable
+                (the prefix is shortened, never the hash, in short VRs)
+    date_shift  move DA/DT values by the profile's number of days
+    uid         replace with a new UID, consistently across files (UIDMap)
+    keep        leave the value unchanged
+
+compile_profile() turns a profile into a tag -> function table once, so
+anonymizing a file is a single walk over its elements (nested sequences
+included) with one dict lookup per element.
+
+Profiles are dicts, or JSON files holding the same structure:
+
+    {"name": "...", "actions": {"PatientName": "replace", "(0010,0020)": "hash"},
+     "remove_private": true, "date_shift_days": null}
+
+With date_shift_days null the shift is derived from the UID map's secret,
+so it is the same for every file anonymized against that store.
+"""
+import json
+from datetime import date, timedelta
+
+from pydicom.datadict import DicomDictionary, tag_for_keyword
+from pydicom.multival import MultiValue
+
+from uid_map import DEFAULT_UID_MAP_PATH, UIDMap
+
+ACTIONS = ("remove", "empty", "replace", "hash", "date_shift", "uid", "keep")
+
+# Replaces the hard-coded sensitive_tags set of anonymize_dicom. Names and
+# IDs keep the user's prefix, dates are shifted rather than destroyed, and
+# instance/series/study UIDs are remapped consistently.
+DEFAULT_PROFILE = {
+    "name": "DICOM Reader basic profile",
+    "remove_private": True,
+    "date_shift_days": None,
+    "actions": {
+        # Recognizable visual features
+        "PatientName": "replace",
+        "PatientID": "hash",
+        "PatientBirthDate": "empty",
+        "PatientBirthTime": "remove",
+        "PatientSex": "empty",
+        "PatientAge": "remove",
+        "PatientAddress": "remove",
+        "PatientTelephoneNumbers": "remove",
+        "OtherPatientIDs": "remove",
+        "OtherPatientNames": "remove",
+        "OtherPatientIDsSequence": "remove",
+        "IssuerOfPatientIDQualifiersSequence": "remove",
+        "MedicalRecordLocator": "remove",
+        "ReferringPhysicianName": "empty",
+        "PerformingPhysicianName": "remove",
+        "NameOfPhysiciansReadingStudy": "remove",
+        "OperatorsName": "remove",
+        "InstitutionName": "remove",
+        "InstitutionAddress": "remove",
+        "StationName": "remove",
+        "AccessionNumber": "hash",
+        "StudyID": "empty",
+        # Dates and times
+        "StudyDate": "date_shift",
+        "SeriesDate": "date_shift",
+        "AcquisitionDate": "date_shift",
+        "ContentDate": "date_shift",
+        "InstanceCreationDate": "date_shift",
+        "AcquisitionDateTime": "date_shift",
+        "StudyTime": "empty",
+        "SeriesTime": "empty",
+        "AcquisitionTime": "empty",
+        "ContentTime": "empty",
+        # Graphics and devices
+        "Manufacturer": "empty",
+        "DeviceSerialNumber": "remove",
+        # Structured content and descriptors
+        "ProcedureCodeSequence": "remove",
+        "ViewCodeSequence": "remove",
+        "ViewModifierCodeSequence": "remove",
+        "StudyDescription": "remove",
+        "ImageComments": "remove",
+        "RequestAttributesSequence": "remove",
+        # Identifying UIDs
+        "StudyInstanceUID": "uid",
+        "SeriesInstanceUID": "uid",
+        "SOPInstanceUID": "uid",
+        "FrameOfReferenceUID": "uid",
+        "ReferencedSOPInstanceUID": "uid",
+        "ReferencedFrameOfReferenceUID": "uid",
+        "SynchronizationFrameOfReferenceUID": "uid",
+        "IrradiationEventUID": "uid",
+    },
+}
+
+# Standard tags whose values are sequences; only these are descended into
+SEQUENCE_TAGS = frozenset(tag for tag, entry in DicomDictionary.items() if entry[0] == "SQ")
+
+# Hex digits of the keyed hash always kept by the hash action; the prefix is
+# shortened to make room, so pseudonyms stay distinct in short VRs like SH
+MIN_HASH_LENGTH = 10
+
+# Longest value allowed by each text VR (None: unlimited)
+TEXT_VR_MAX_LENGTH = {
+    "AE": 16, "CS": 16, "SH": 16, "LO": 64, "PN": 64, "ST": 1024,
+    "LT": 10240, "UT": None, "UC": None, "UR": None,
+}
+
+
+def parse_profile_tag(name):
+    """Tag (as int) of a keyword or (gggg,eeee) key in a profile."""
+    text = name.strip().strip("()").replace(",", "")
+    tag = tag_for_keyword(name.strip())
+    if tag is None:
+        try:
+            tag = int(text, 16)
+        except ValueError:
+            raise ValueError(f"Unknown attribute in profile: {name!r}") from None
+    return tag
+
+
+def load_profile(profile=None):
+    """Return a profile dict from None (default), a dict, or a JSON file path."""
+    if profile is None:
+        return DEFAULT_PROFILE
+    if isinstance(profile, dict):
+        return profile
+    with open(profile, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def map_values(value, func):
+    """Apply func to each value of a possibly multi-valued element."""
+    if isinstance(value, (list, MultiValue)):
+        return [func(v) for v in value]
+    return func(value)
+
+
+def shift_date(text, days):
+    """Shift a DA (or the date part of a DT) value by days; '' if unparseable."""
+    text = str(text).strip()
+    if len(text) < 8 or not text[:8].isdigit():
+        return ""
+    try:
+        shifted = date(int(text[:4]), int(text[4:6]), int(text[6:8])) + timedelta(days=days)
+    except ValueError:
+        return ""
+    return shifted.strftime("%Y%m%d") + text[8:]
+
+
+class CompiledProfile:
+    """A profile turned into a tag -> action table, ready to apply to datasets."""
+
+    def __init__(self, profile=None, prefix="ANON", uid_map=None):
+        profile = load_profile(profile)
+        self.name = profile.get("name", "custom profile")
+        self.prefix = prefix
+        self.remove_private = bool(profile.get("remove_private", True))
+        self.uid_map = uid_map if uid_map is not None else get_uid_map()
+
+        days = profile.get("date_shift_days")
+        if days is None:
+            # Same shift for every file anonymized against this store, between 1 and 3650 days back
+            days = -(int(self.uid_map.keyed_hash("date_shift")[:8], 16) % 3650 + 1)
+        self.date_shift_days = int(days)
+
+        self.table = {}
+        for name, action in profile.get("actions", {}).items():
+            if action not in ACTIONS:
+                raise ValueError(f"Unknown action {action!r} for {name!r}")
+            self.table[parse_profile_tag(name)] = getattr(self, "_" + action)
+        self.remaps_sop_instance = self.table.get(0x00080018) == self._uid
+
+    # Actions: each is called as action(ds, tag)
+
+    @staticmethod
+    def _remove(ds, tag):
+        del ds[tag]
+
+    @staticmethod
+    def _empty(ds, tag):
+        element = ds[tag]
+        element.value = [] if element.VR == "SQ" else None
+
+    @staticmethod
+    def _keep(ds, tag):
+        pass
+
+    def _replace(self, ds, tag):
+        element = ds[tag]
+        if element.VR in TEXT_VR_MAX_LENGTH:
+            element.value = self.prefix
+        else:
+            self._empty(ds, tag)
+
+    def _hash(self, ds, tag):
+        element = ds[tag]
+        if element.VR not in TEXT_VR_MAX_LENGTH or element.value in (None, ""):
+            self._empty(ds, tag)
+            return
+        max_length = TEXT_VR_MAX_LENGTH[element.VR]
+        prefix = self.prefix
+        if max_length:
+            if max_length < MIN_HASH_LENGTH:
+                raise ValueError(f"{element.VR} values are too short to hold a {MIN_HASH_LENGTH}-digit hash")
+            prefix = prefix[:max_length - MIN_HASH_LENGTH]
+
+        def pseudonym(value):
+            text = prefix + self.uid_map.keyed_hash(str(value))
+            text = text[:max_length] if max_length else text
+            return text.upper() if element.VR == "CS" else text
+
+        element.value = map_values(element.value, pseudonym)
+
+    def _date_shift(self, ds, tag):
+        element = ds[tag]
+        if element.VR not in ("DA", "DT") or element.value in (None, ""):
+            self._empty(ds, tag)
+            return
+        element.value = map_values(element.value, lambda v: shift_date(v, self.date_shift_days))
+
+    def _uid(self, ds, tag):
+        element = ds[tag]
+        if element.VR != "UI":
+            self._empty(ds, tag)
+        elif element.value:
+            element.value = map_values(element.value, lambda v: self.uid_map.remap(str(v)))
+
+    # Application
+
+    def _walk(self, ds):
+        table = self.table
+        for tag in list(ds.keys()):
+            action = table.get(tag)
+            if action is not None:
+                action(ds, tag)
+            elif tag.is_private:
+                if self.remove_private:
+                    del ds[tag]
+            elif tag in SEQUENCE_TAGS:
+                value = ds[tag].value
+                if value:
+                    for item in value:
+                        self._walk(item)
+
+    def apply(self, ds):
+        """De-identify ds in place (one pass over its elements) and return it."""
+        self._walk(ds)
+
+        file_meta = getattr(ds, "file_meta", None)
+        if self.remaps_sop_instance and file_meta is not None and "MediaStorageSOPInstanceUID" in file_meta:
+            file_meta.MediaStorageSOPInstanceUID = self.uid_map.remap(str(file_meta.MediaStorageSOPInstanceUID))
+        ds.PatientIdentityRemoved = "YES"
+        ds.DeidentificationMethod = self.name[:64]
+
+        self.uid_map.flush()
+        return ds
+
+    __call__ = apply
+
+
+_uid_map = None
+_compiled = {}
+
+
+def get_uid_map():
+    """The process-wide UIDMap, opened on first use."""
+    global _uid_map
+    if _uid_map is None:
+        _uid_map = UIDMap(DEFAULT_UID_MAP_PATH)
+    return _uid_map
+
+
+def compile_profile(profile=None, prefix="ANON"):
+    """Compiled profile for (profile, prefix); cached unless profile is a dict."""
+    if isinstance(profile, dict):
+        return CompiledProfile(profile, prefix)
+    key = (profile, prefix)
+    compiled = _compiled.get(key)
+    if compiled is None:
+        compiled = _compiled[key] = CompiledProfile(profile, prefix)
+    return compiled
@@ -0,0 +1,140 @@
+"""Non-blocking DICOM import for the Tk viewer.
+
+BackgroundTask runs work on a worker thread and hands its events back to
+the Tk main thread through a queue polled with widget.after(), so the UI
+keeps redrawing while a large or compressed file loads, and a task can
+be cancelled at any point. DicomLoadTask reads the header and decodes
+the first frame this way; CallTask runs any function (e.g. indexing a
+folder).
+"""
+import queue
+import threading
+import tkinter as tk
+
+from frame_provider import get_frame_provider
+
+
+class LoadCancelled(Exception):
+    """Raised inside the worker when the task has been cancelled."""
+
+
+class BackgroundTask:
+    """Run work() on a worker thread and deliver its events on the Tk event loop.
+
+    Subclasses implement work() and report with self._post(kind, *args);
+    each kind is dispatched to the callback of the same name on the Tk
+    main thread. Exceptions are delivered to the "error" callback.
+    """
+
+    def __init__(self, widget, callbacks, poll_interval=30):
+        self.widget = widget
+        self.callbacks = callbacks
+        self.poll_interval = poll_interval
+        self.finished = False
+        self._events = queue.Queue()
+        self._cancelled = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=type(self).__name__, daemon=True)
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def start(self):
+        self._thread.start()
+        self.widget.after(self.poll_interval, self._poll)
+        return self
+
+    def cancel(self):
+        """Stop delivering results; the worker stops at the next stage boundary."""
+        self._cancelled.set()
+
+    def work(self):
+        raise NotImplementedError
+
+    def _check_cancelled(self):
+        if self._cancelled.is_set():
+            raise LoadCancelled()
+
+    def _post(self, kind, *args):
+        self._events.put((kind, args))
+
+    def _run(self):
+        try:
+            self.work()
+        except LoadCancelled:
+            pass
+        except Exception as e:
+            self._post("error", e)
+        finally:
+            self._post("finished")
+
+    def _poll(self):
+        try:
+            while True:
+                kind, args = self._events.get_nowait()
+                if kind == "finished":
+                    self.finished = True
+                    continue
+                if self.cancelled:
+                    continue
+                callback = self.callbacks.get(kind)
+                if callback is not None:
+                    callback(*args)
+        except queue.Empty:
+            pass
+
+        if not self.finished:
+            try:
+                self.widget.after(self.poll_interval, self._poll)
+            except tk.TclError:
+                # The widget was destroyed (application closing)
+                self.cancel()
+
+
+class CallTask(BackgroundTask):
+    """Call func(*args) in the background and pass its result to on_done(result)."""
+
+    def __init__(self, widget, func, args, on_done, on_error=None, poll_interval=30):
+        super().__init__(widget, {"done": on_done, "error": on_error}, poll_interval)
+        self.func = func
+        self.args = args
+
+    def work(self):
+        result = self.func(*self.args)
+        self._check_cancelled()
+        self._post("done", result)
+
+
+class DicomLoadTask(BackgroundTask):
+    """Load one file in the background and report back on the Tk event loop.
+
+    Callbacks, all invoked on the Tk main thread:
+        on_progress(message, percent)
+        on_metadata(ds)           header parsed, PixelData still deferred
+        on_pixels(ds, provider)   first frame decoded, ready to display
+        on_error(exception)
+    """
+
+    def __init__(self, widget, filepath, reader, on_metadata, on_pixels,
+                 on_error=None, on_progress=None, poll_interval=30):
+        super().__init__(widget, {
+            "metadata": on_metadata,
+            "pixels": on_pixels,
+            "error": on_error,
+            "progress": on_progress,
+        }, poll_interval)
+        self.filepath = filepath
+        self.reader = reader
+
+    def work(self):
+        self._post("progress", "Reading header...", 10)
+        ds = self.reader(self.filepath)
+        self._check_cancelled()
+        self._post("metadata", ds)
+
+        self._post("progress", "Decoding pixels...", 50)
+        provider = get_frame_provider(ds)
+        provider[0]  # Decode (or page in) the first frame off the UI thread
+        self._check_cancelled()
+        self._post("pixels", ds, provider)
+        self._post("progress", "Done", 100)
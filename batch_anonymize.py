@@ -0,0 +1,201 @@
+"""Headless batch anonymization of DICOM directory trees.
+
+Walks an input directory, runs ``anonymize_dicom`` over every file in a
+process pool and mirrors the results into an output tree. Pixel data is
+streamed through unchanged (see stream_anonymize).
+
+Usage:
+    python batch_anonymize.py INPUT_DIR OUTPUT_DIR --prefix ANON [--profile PROFILE.json] [--workers N]
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from pydicom.errors import InvalidDicomError
+
+from anonymize_profile import compile_profile
+from stream_anonymize import anonymize_stream
+
+
+class FileResult:
+    """Outcome of anonymizing a single file."""
+
+    def __init__(self, source, destination, status, size=0, seconds=0.0, error=""):
+        self.source = source
+        self.destination = destination
+        self.status = status  # "ok", "skipped" or "failed"
+        self.size = size
+        self.seconds = seconds
+        self.error = error
+
+
+class BatchSummary:
+    """Running totals for a batch job."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.processed = 0
+        self.skipped = 0
+        self.failures = []
+        self.bytes = 0
+
+    def add(self, result):
+        if result.status == "ok":
+            self.processed += 1
+            self.bytes += result.size
+        elif result.status == "skipped":
+            self.skipped += 1
+        else:
+            self.failures.append(result)
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def files_per_second(self):
+        return self.processed / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def megabytes_per_second(self):
+        return self.bytes / 1e6 / self.elapsed if self.elapsed > 0 else 0.0
+
+    def __str__(self):
+        return (f"{self.processed} anonymized, {self.skipped} skipped, "
+                f"{len(self.failures)} failed in {self.elapsed:.1f}s "
+                f"({self.files_per_second:.1f} files/s, {self.megabytes_per_second:.1f} MB/s)")
+
+
+def iter_dicom_files(input_dir, exclude=None):
+    """Yield every regular file below input_dir in a stable order.
+
+    The directory exclude (e.g. an output tree inside input_dir) is not
+    descended into; the walk is lazy, so it would otherwise pick up files
+    written while it runs.
+    """
+    excluded = os.path.realpath(exclude) if exclude else None
+    for dirpath, dirnames, filenames in os.walk(input_dir):
+        if excluded:
+            dirnames[:] = [name for name in dirnames
+                           if os.path.realpath(os.path.join(dirpath, name)) != excluded]
+        dirnames.sort()
+        for filename in sorted(filenames):
+            yield os.path.join(dirpath, filename)
+
+
+def anonymize_one(source, destination, prefix, profile=None):
+    """Anonymize one file into destination. Runs inside a worker process."""
+    start = time.perf_counter()
+    try:
+        # Only the header is parsed; PixelData is copied through in chunks
+        size = anonymize_stream(source, destination, prefix, profile=profile)
+    except InvalidDicomError as e:
+        return FileResult(source, destination, "skipped", error=f"Not a DICOM file: {e}")
+    except Exception as e:
+        return FileResult(source, destination, "failed", error=f"Anonymization failed: {e}")
+
+    return FileResult(source, destination, "ok", size, time.perf_counter() - start)
+
+
+def anonymize_tree(input_dir, output_dir, prefix, workers=None, skip_existing=False, profile=None):
+    """Anonymize every file below input_dir into output_dir.
+
+    Results are yielded as they complete so callers can stream progress.
+    At most a few tasks per worker are in flight, so memory stays flat
+    regardless of how many files the study contains.
+    """
+    workers = workers or os.cpu_count() or 1
+    max_pending = workers * 4
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        for source in iter_dicom_files(input_dir, exclude=output_dir):
+            relative = os.path.relpath(source, input_dir)
+            destination = os.path.join(output_dir, relative)
+            if skip_existing and os.path.exists(destination):
+                yield FileResult(source, destination, "skipped", error="Already exists")
+                continue
+
+            pending.add(executor.submit(anonymize_one, source, destination, prefix, profile))
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+def run_batch(input_dir, output_dir, prefix, workers=None, skip_existing=False,
+              report_path=None, progress=None, profile=None):
+    """Anonymize a directory tree and return a BatchSummary.
+
+    progress, if given, is called with (result, summary) after each file.
+    report_path, if given, receives one CSV row per file.
+    profile, if given, is a de-identification profile (see anonymize_profile).
+    """
+    summary = BatchSummary()
+    report_file = open(report_path, "w", newline="") if report_path else None
+    try:
+        writer = None
+        if report_file:
+            writer = csv.writer(report_file)
+            writer.writerow(["source", "destination", "status", "bytes", "seconds", "error"])
+
+        for result in anonymize_tree(input_dir, output_dir, prefix, workers, skip_existing, profile):
+            summary.add(result)
+            if writer:
+                writer.writerow([result.source, result.destination, result.status,
+                                 result.size, f"{result.seconds:.4f}", result.error])
+            if progress:
+                progress(result, summary)
+    finally:
+        if report_file:
+            report_file.close()
+
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Anonymize every DICOM file in a directory tree.")
+    parser.add_argument("input_dir", help="Directory to read DICOM files from")
+    parser.add_argument("output_dir", help="Directory to write anonymized files to")
+    parser.add_argument("--prefix", required=True, help="Anonymization prefix")
+    parser.add_argument("--profile", help="JSON de-identification profile (default: built-in profile)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Number of worker processes (default: all cores)")
+    parser.add_argument("--skip-existing", action="store_true",
+                        help="Skip files that already exist in the output tree")
+    parser.add_argument("--report", help="Write a per-file CSV report to this path")
+    parser.add_argument("--verbose", action="store_true", help="Print one line per file")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.input_dir):
+        parser.error(f"Input directory not found: {args.input_dir}")
+    if args.profile:
+        try:
+            compile_profile(args.profile, args.prefix)
+        except (OSError, ValueError) as e:
+            parser.error(f"Invalid profile {args.profile}: {e}")
+
+    def progress(result, summary):
+        if args.verbose:
+            print(f"[{result.status}] {result.source} ({result.seconds * 1000:.1f} ms) {result.error}")
+        elif (summary.processed + summary.skipped + len(summary.failures)) % 500 == 0:
+            print(summary, file=sys.stderr)
+        if result.status == "failed" and not args.verbose:
+            print(f"[failed] {result.source}: {result.error}", file=sys.stderr)
+
+    summary = run_batch(args.input_dir, args.output_dir, args.prefix, args.workers,
+                        args.skip_existing, args.report, progress, args.profile)
+    print(summary)
+    return 1 if summary.failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
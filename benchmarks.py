@@ -0,0 +1,450 @@
+"""Reproducible benchmarks of the viewer's hot paths on synthetic DICOM data.
+
+Every case is generated locally from a fixed seed, so two runs (or two
+versions of the code) time exactly the same files:
+
+    single_frame   one 512x512 CT slice
+    multi_frame    uncompressed 200-frame 256x256 volume
+    compressed     RLE Lossless 100-frame 256x256 volume
+    large_header   one slice with thousands of private and nested elements
+    large_series   a folder of 300 single-frame slices
+    startup        cold import of the viewer and, with a display, the time
+                   to an interactive main window
+
+For each case the script times reading the file (dicom_core.read_dicom,
+as the viewer opens it), decoding pixels (compressed frames also one by
+one on a single core, the baseline for the parallel decode), metadata
+search, group exploration, anonymizing and saving, and the per-slice cost of the slice viewer's update_display
+on the headless Agg backend. The series case also serves its folder with
+dicom_server on the loopback interface and times cold, cached and
+conditional (304) rendered-frame requests. Results are written as JSON; pass
+--compare with an earlier result file to see the change per benchmark.
+
+Usage:
+    python benchmarks.py [--output results.json] [--data DIR] [--repeat N] [--quick] [--compare OLD.json]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import matplotlib
+matplotlib.use("Agg")
+import numpy as np
+import pydicom
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.sequence import Sequence
+from pydicom.uid import ExplicitVRLittleEndian, RLELossless, generate_uid
+
+import anonymize_profile
+from DicomReader import STARTUP_BUDGET_SECONDS
+from dicom_core import DicomDocument, anonymize_dicom, read_dicom
+from dicom_server import loopback_benchmark
+from frame_cache import FrameCache
+from frame_provider import get_frame_provider
+from rendering import BlitImageRenderer
+from series_index import load_folder
+from stream_anonymize import anonymize_stream
+from uid_map import UIDMap
+from windowing import WindowLevel
+
+RESULTS_VERSION = 1
+DEFAULT_REPEAT = 5
+SEED = 20240101
+
+# Terms searched in each file, like typing into the Search box
+SEARCH_TERMS = ("patient", "Modality=CT", "SliceThickness>=1", "*private*")
+
+# Modules that importing the viewer must not load (they are imported on first use)
+DEFERRED_MODULES = ("pydicom", "numpy", "matplotlib", "PyQt5")
+
+# Benchmarks that got slower than this ratio are reported as regressions by --compare
+REGRESSION_THRESHOLD = 1.2
+
+
+# Synthetic data
+
+def make_dataset(rows, columns, frames=1, seed=SEED, position=0.0):
+    """A CT-like dataset with smooth anatomy-ish pixel data (deterministic for a seed)."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:rows, 0:columns]
+    radius = np.hypot(y - rows / 2, x - columns / 2) / (min(rows, columns) / 2)
+    body = np.where(radius < 0.9, 1000 + 200 * np.cos(radius * 8), 0)
+    volume = np.stack([body + 40 * np.sin(radius * 12 + k / 7) for k in range(frames)])
+    volume += rng.normal(0, 10, volume.shape)
+    pixels = np.clip(volume, 0, 4095).astype(np.uint16)
+
+    ds = Dataset()
+    ds.file_meta = FileMetaDataset()
+    ds.file_meta.MediaStorageSOPClassUID = "1.2.840.10008.5.1.4.1.1.2"
+    ds.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    ds.SOPClassUID = ds.file_meta.MediaStorageSOPClassUID
+    ds.SOPInstanceUID = generate_uid(entropy_srcs=[str(seed), str(position)])
+    ds.file_meta.MediaStorageSOPInstanceUID = ds.SOPInstanceUID
+    ds.StudyInstanceUID = generate_uid(entropy_srcs=[str(seed), "study"])
+    ds.SeriesInstanceUID = generate_uid(entropy_srcs=[str(seed), "series"])
+    ds.FrameOfReferenceUID = generate_uid(entropy_srcs=[str(seed), "frame"])
+    ds.PatientName = "BENCHMARK^PATIENT"
+    ds.PatientID = "BENCH0001"
+    ds.PatientBirthDate = "19700101"
+    ds.PatientSex = "O"
+    ds.StudyDate = ds.SeriesDate = ds.ContentDate = "20240101"
+    ds.StudyTime = "120000"
+    ds.AccessionNumber = "ACC0001"
+    ds.Modality = "CT"
+    ds.Manufacturer = "Synthetic"
+    ds.InstitutionName = "Benchmark Hospital"
+    ds.StudyDescription = "Synthetic benchmark study"
+    ds.SeriesNumber = 1
+    ds.InstanceNumber = int(position) + 1
+    ds.ImagePositionPatient = [0.0, 0.0, float(position)]
+    ds.ImageOrientationPatient = [1.0, 0.0, 0.0, 0.0, 1.0, 0.0]
+    ds.PixelSpacing = [0.7, 0.7]
+    ds.SliceThickness = 1.25
+    ds.WindowCenter = 1040
+    ds.WindowWidth = 400
+    ds.RescaleIntercept = -1024
+    ds.RescaleSlope = 1
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = "MONOCHROME2"
+    ds.Rows = rows
+    ds.Columns = columns
+    ds.BitsAllocated = 16
+    ds.BitsStored = 12
+    ds.HighBit = 11
+    ds.PixelRepresentation = 0
+    if frames > 1:
+        ds.NumberOfFrames = frames
+    ds.PixelData = (pixels if frames > 1 else pixels[0]).tobytes()
+    return ds
+
+
+def add_large_header(ds, private_elements=2000, sequence_items=500):
+    """Pad ds with private elements and a long nested sequence."""
+    for index in range(private_elements):
+        # A private block holds 256 elements; spread the rest over further odd groups
+        group, offset = 0x0011 + 2 * (index // 0x100), index % 0x100
+        block = ds.private_block(group, "BENCHMARK", create=True)
+        block.add_new(offset, "LO", f"private value {index}")
+    items = []
+    for index in range(sequence_items):
+        item = Dataset()
+        item.ReferencedSOPClassUID = ds.SOPClassUID
+        item.ReferencedSOPInstanceUID = generate_uid(entropy_srcs=[str(index), "ref"])
+        item.CodeValue = f"C{index:05d}"
+        item.CodeMeaning = f"Synthetic code {index}"
+        item.ImageComments = "Nested free text " * 4
+        items.append(item)
+    ds.ReferencedImageSequence = Sequence(items)
+    return ds
+
+
+def make_cases(quick=False):
+    """(name, description, builder) for every case; builder(path) writes the case."""
+    scale = 4 if quick else 1
+
+    def single_frame(path):
+        make_dataset(512, 512).save_as(path, enforce_file_format=True)
+
+    def multi_frame(path):
+        make_dataset(256, 256, 200 // scale).save_as(path, enforce_file_format=True)
+
+    def compressed(path):
+        ds = make_dataset(256, 256, 100 // scale)
+        ds.compress(RLELossless, encoding_plugin="pydicom")
+        ds.save_as(path, enforce_file_format=True)
+
+    def large_header(path):
+        add_large_header(make_dataset(256, 256), 4000 // scale, 500 // scale)\
+            .save_as(path, enforce_file_format=True)
+
+    def large_series(path):
+        os.makedirs(path, exist_ok=True)
+        for index in range(300 // scale):
+            ds = make_dataset(256, 256, seed=SEED + index, position=index * 1.25)
+            ds.StudyInstanceUID = generate_uid(entropy_srcs=[str(SEED), "study"])
+            ds.SeriesInstanceUID = generate_uid(entropy_srcs=[str(SEED), "series"])
+            ds.save_as(os.path.join(path, f"slice_{index:04d}.dcm"), enforce_file_format=True)
+
+    return [
+        ("single_frame", "1 x 512x512 uncompressed", single_frame),
+        ("multi_frame", f"{200 // scale} x 256x256 uncompressed", multi_frame),
+        ("compressed", f"{100 // scale} x 256x256 RLE Lossless", compressed),
+        ("large_header", f"{4000 // scale} private elements, {500 // scale}-item sequence", large_header),
+        ("large_series", f"{300 // scale} single-frame 256x256 files", large_series),
+    ]
+
+
+# Timing
+
+def measure(func, repeat=DEFAULT_REPEAT, setup=None):
+    """Time func (called with setup()'s result, if given) repeat times; setup is not timed."""
+    times = []
+    for _ in range(repeat):
+        args = (setup(),) if setup is not None else ()
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+    return {
+        "median": statistics.median(times),
+        "min": min(times),
+        "mean": statistics.fmean(times),
+        "repeat": repeat,
+    }
+
+
+def per_slice_display(provider, ds, slices=None):
+    """Per-slice cost of SliceViewer.update_display: decode, window, blit (on Agg)."""
+    figure = Figure(figsize=(8, 8))
+    canvas = FigureCanvasAgg(figure)
+    ax = figure.add_subplot()
+    renderer = BlitImageRenderer(canvas, ax, vmin=0, vmax=255, pad=20, fontsize=12)
+    frames = FrameCache(provider)
+    window = WindowLevel(ds, frames[0])
+    count = min(slices or len(frames), len(frames))
+    renderer.show(window(frames[0]), "first")  # The full draw that caches the background
+    times = []
+    for index in range(count):
+        start = time.perf_counter()
+        renderer.show(window(frames[index]), f"Viewing Slice {index + 1}/{len(frames)}")
+        times.append(time.perf_counter() - start)
+    frames.close()
+    return {
+        "median": statistics.median(times),
+        "min": min(times),
+        "mean": statistics.fmean(times),
+        "slices": count,
+    }
+
+
+def search_file(ds):
+    """What search_metadata does for each term: look up and format the matches."""
+    document = DicomDocument(ds)
+    for term in SEARCH_TERMS:
+        document.search_text(term)
+
+
+def explore_groups(ds):
+    """What explore_group does for every group of a freshly loaded file."""
+    document = DicomDocument(ds)
+    for group in document.group_names():
+        document.group_text(group)
+
+
+def benchmark_file(path, workdir, repeat):
+    results = {}
+    results["dcmread"] = measure(lambda: read_dicom(path), repeat)
+    results["dcmread_metadata_only"] = measure(lambda: read_dicom(path, metadata_only=True), repeat)
+    results["pixel_array"] = measure(lambda ds: ds.pixel_array, repeat, lambda: read_dicom(path))
+
+    def frames_as_array(ds):
+        provider = get_frame_provider(ds)
+        provider.as_array()
+        provider.close()
+
+    results["frame_provider_as_array"] = measure(frames_as_array, repeat, lambda: read_dicom(path))
+
+    def frames_one_by_one(ds):
+        provider = get_frame_provider(ds)
+        for index in range(len(provider)):
+            provider[index]
+        provider.close()
+
+    if read_dicom(path, metadata_only=True).file_meta.TransferSyntaxUID.is_compressed:
+        # Serial baseline for as_array, which decodes on a process pool when there are cores for it
+        results["frame_provider_serial_decode"] = measure(frames_one_by_one, repeat, lambda: read_dicom(path))
+    results["search_metadata"] = measure(search_file, repeat, lambda: read_dicom(path, metadata_only=True))
+    results["explore_group"] = measure(explore_groups, repeat, lambda: read_dicom(path, metadata_only=True))
+
+    destination = os.path.join(workdir, "anonymized.dcm")
+
+    def anonymize_and_save(ds):
+        anonymize_dicom(ds, "ANON").save_as(destination)
+
+    def load_all():
+        ds = pydicom.dcmread(path)
+        ds.PixelData  # Loaded up front, as after viewing the image
+        return ds
+
+    results["anonymize_save"] = measure(anonymize_and_save, repeat, load_all)
+    results["anonymize_stream"] = measure(lambda: anonymize_stream(path, destination, "ANON"), repeat)
+    os.remove(destination)
+
+    ds = read_dicom(path)
+    provider = get_frame_provider(ds)
+    results["update_display_per_slice"] = per_slice_display(provider, ds)
+    provider.close()
+    return results
+
+
+def benchmark_series(folder, repeat):
+    results = {}
+    results["load_folder"] = measure(lambda: load_folder(folder), repeat)
+    series = load_folder(folder)[0]
+    provider = series.frame_provider()
+    results["update_display_per_slice"] = per_slice_display(provider, series.first_dataset())
+    provider.close()
+    served = loopback_benchmark(folder, log=lambda line: None)
+    for phase in ("cold", "cached", "conditional"):
+        timing = served[phase]
+        results[f"http_{phase}_per_frame"] = {
+            "median": timing["p50_ms"] / 1000, "p95": timing["p95_ms"] / 1000,
+            "requests_per_second": timing["requests_per_second"], "requests": served["frames"],
+        }
+    return results
+
+
+def benchmark_startup(repeat):
+    """Cold start in fresh interpreters: importing the viewer and, with a display, opening it."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    results["import_viewer"] = measure(
+        lambda: subprocess.run([sys.executable, "-c", "import DicomReader"], cwd=here, check=True), repeat)
+    check = ("import sys, DicomReader; "
+             f"print(','.join(m for m in {DEFERRED_MODULES!r} if m in sys.modules))")
+    loaded = subprocess.run([sys.executable, "-c", check], cwd=here, check=True, capture_output=True,
+                            text=True).stdout.strip()
+    if os.environ.get("DISPLAY") or sys.platform in ("win32", "darwin"):
+        results["interactive_window"] = measure(
+            lambda: subprocess.run([sys.executable, "DicomReader.py", "--exit-after-startup"], cwd=here,
+                                   check=True, capture_output=True), repeat)
+    return results, [name for name in loaded.split(",") if name]
+
+
+def disk_usage(path):
+    if os.path.isfile(path):
+        return 1, os.path.getsize(path)
+    paths = [os.path.join(path, name) for name in os.listdir(path)]
+    return len(paths), sum(os.path.getsize(p) for p in paths)
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(data_dir, repeat=DEFAULT_REPEAT, quick=False, cases=None, log=print):
+    """Generate (or reuse) the synthetic cases under data_dir, time them and return the results dict."""
+    if quick:
+        data_dir = os.path.join(data_dir, "quick")  # Never reuse the smaller files for a full run
+    os.makedirs(data_dir, exist_ok=True)
+    # Anonymization remaps UIDs; keep that mapping out of the user's own store
+    anonymize_profile._uid_map = UIDMap(os.path.join(data_dir, "uid_map.sqlite"))
+
+    results = {
+        "version": RESULTS_VERSION,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "quick": quick,
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "numpy": np.__version__,
+            "pydicom": pydicom.__version__,
+            "matplotlib": matplotlib.__version__,
+        },
+        "cases": {},
+    }
+    for name, description, build in make_cases(quick):
+        if cases and name not in cases:
+            continue
+        path = os.path.join(data_dir, name if name == "large_series" else name + ".dcm")
+        if not os.path.exists(path):
+            log(f"Generating {name} ({description})...")
+            build(path)
+        log(f"Running {name}...")
+        files, size = disk_usage(path)
+        timings = benchmark_series(path, repeat) if os.path.isdir(path) else \
+            benchmark_file(path, data_dir, repeat)
+        results["cases"][name] = {"description": description, "files": files, "bytes": size,
+                                  "benchmarks": timings}
+
+    if not cases or "startup" in cases:
+        log("Running startup...")
+        timings, loaded = benchmark_startup(repeat)
+        results["cases"]["startup"] = {"description": "cold start in a new interpreter",
+                                       "budget_seconds": STARTUP_BUDGET_SECONDS,
+                                       "modules_loaded_on_import": loaded, "benchmarks": timings}
+        window = timings.get("interactive_window")
+        if window is not None and window["median"] > STARTUP_BUDGET_SECONDS:
+            log(f"Startup over budget: {window['median']:.3f}s > {STARTUP_BUDGET_SECONDS:.3f}s")
+        if loaded:
+            log(f"Importing the viewer loads {', '.join(loaded)}")
+    return results
+
+
+def compare(old, new, threshold=REGRESSION_THRESHOLD):
+    """Lines comparing median timings of two result dicts, and the number of regressions."""
+    lines = [f"{'case':<14} {'benchmark':<26} {'old ms':>10} {'new ms':>10} {'ratio':>7}"]
+    regressions = 0
+    for case, entry in new["cases"].items():
+        old_entry = old.get("cases", {}).get(case)
+        if old_entry is None:
+            continue
+        for name, timing in entry["benchmarks"].items():
+            old_timing = old_entry["benchmarks"].get(name)
+            if old_timing is None or not old_timing["median"]:
+                continue
+            ratio = timing["median"] / old_timing["median"]
+            flag = ""
+            if ratio > threshold:
+                flag = "  slower"
+                regressions += 1
+            elif ratio < 1 / threshold:
+                flag = "  faster"
+            lines.append(f"{case:<14} {name:<26} {old_timing['median'] * 1000:>10.2f} "
+                         f"{timing['median'] * 1000:>10.2f} {ratio:>7.2f}{flag}")
+    return lines, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark load, render, search and anonymize hot paths.")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file to write results to")
+    parser.add_argument("--data", default=None,
+                        help="Directory for the generated files, reused between runs (default: temporary)")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Timed repetitions per benchmark")
+    parser.add_argument("--quick", action="store_true", help="Smaller cases for a fast smoke run")
+    parser.add_argument("--case", action="append", dest="cases",
+                        help="Only run this case (may be given more than once)")
+    parser.add_argument("--compare", help="Earlier result file to compare against")
+    args = parser.parse_args(argv)
+
+    if args.data:
+        results = run_benchmarks(args.data, args.repeat, args.quick, args.cases)
+    else:
+        with tempfile.TemporaryDirectory(prefix="dicom_bench_") as data_dir:
+            results = run_benchmarks(data_dir, args.repeat, args.quick, args.cases)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    for case, entry in results["cases"].items():
+        for name, timing in entry["benchmarks"].items():
+            print(f"{case:<14} {name:<26} {timing['median'] * 1000:>10.2f} ms")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            old = json.load(f)
+        lines, regressions = compare(old, results)
+        print("\n".join(lines))
+        if regressions:
+            print(f"{regressions} benchmarks slower than {REGRESSION_THRESHOLD:.2f}x", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+"""Cine playback at the frame timing recorded in the DICOM header.
+
+CinePlayer schedules frames on the Tk event loop against a wall clock:
+each tick shows the frame that is due now, so when rendering falls
+behind, late frames are skipped (and counted) instead of slowing the
+loop down. Timing comes from Frame Time Vector, Frame Time, Cine Rate or
+Recommended Display Frame Rate, in that order.
+"""
+import time
+import tkinter as tk
+from bisect import bisect_right
+
+import numpy as np
+from pydicom.multival import MultiValue
+
+from rendering import FPSCounter
+
+# Playback rate for files that record no timing at all
+DEFAULT_FRAME_RATE = 10.0
+
+
+def positive_float(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if value > 0 else None
+
+
+def frame_interval(ds):
+    """Seconds between frames from Frame Time, Cine Rate or Recommended Display Frame Rate."""
+    frame_time = positive_float(ds.get("FrameTime"))
+    if frame_time:
+        return frame_time / 1000.0
+    for keyword in ("CineRate", "RecommendedDisplayFrameRate"):
+        rate = positive_float(ds.get(keyword))
+        if rate:
+            return 1.0 / rate
+    return 1.0 / DEFAULT_FRAME_RATE
+
+
+def frame_timestamps(ds, num_frames):
+    """Presentation time of each frame (seconds from the start of the loop) and the loop length."""
+    interval = frame_interval(ds)
+    vector = ds.get("FrameTimeVector")
+    if vector is not None:
+        # A single-valued vector (e.g. a one-frame file) reads as a scalar
+        vector = list(vector) if isinstance(vector, MultiValue) else [vector]
+    if vector is not None and len(vector) >= num_frames:
+        # Entry k is the time since frame k-1 (the first entry is normally 0)
+        increments = np.array([positive_float(v) or 0.0 for v in vector[:num_frames]]) / 1000.0
+        increments[0] = 0.0
+        timestamps = np.cumsum(increments)
+        last = increments[-1] if num_frames > 1 and increments[-1] > 0 else interval
+        return timestamps, float(timestamps[-1] + last)
+    return np.arange(num_frames) * interval, num_frames * interval
+
+
+class CinePlayer:
+    """Play frames through show(index) at their recorded timing, dropping late frames.
+
+    show is called on the Tk main thread with the index of the frame to
+    display; it should render quickly (e.g. BlitImageRenderer.show).
+    """
+
+    def __init__(self, widget, num_frames, show, timestamps, duration, loop=True, on_stop=None):
+        self.widget = widget
+        self.num_frames = num_frames
+        self.show = show
+        self.timestamps = list(timestamps)
+        self.duration = duration
+        self.loop = loop
+        self.on_stop = on_stop
+        self.current = 0
+        self.displayed = 0
+        self.dropped = 0
+        self.fps = FPSCounter()
+        self._origin = 0.0
+        self._after_id = None
+
+    @classmethod
+    def for_dataset(cls, widget, ds, num_frames, show, **kwargs):
+        timestamps, duration = frame_timestamps(ds, num_frames)
+        return cls(widget, num_frames, show, timestamps, duration, **kwargs)
+
+    @property
+    def playing(self):
+        return self._after_id is not None
+
+    @property
+    def target_fps(self):
+        return self.num_frames / self.duration if self.duration > 0 else 0.0
+
+    def play(self):
+        if self.playing or self.num_frames < 2:
+            return
+        self.fps.reset()
+        self._origin = time.perf_counter() - self.timestamps[self.current]
+        self._after_id = self.widget.after_idle(self._tick)
+
+    def pause(self):
+        if self._after_id is not None:
+            try:
+                self.widget.after_cancel(self._after_id)
+            except tk.TclError:
+                pass
+            self._after_id = None
+
+    def toggle(self):
+        if self.playing:
+            self.pause()
+        else:
+            self.play()
+
+    def seek(self, index):
+        """Jump to index; playback (if running) continues from there."""
+        self.current = int(index) % self.num_frames
+        self._origin = time.perf_counter() - self.timestamps[self.current]
+        self.show(self.current)
+
+    def reset_stats(self):
+        self.displayed = 0
+        self.dropped = 0
+        self.fps.reset()
+
+    def _stop(self):
+        self._after_id = None
+        if self.on_stop is not None:
+            self.on_stop()
+
+    def _tick(self):
+        self._after_id = None
+        try:
+            if not self.widget.winfo_exists():
+                return
+        except tk.TclError:
+            return  # Application closed
+
+        elapsed = time.perf_counter() - self._origin
+        if elapsed >= self.duration:
+            if not self.loop:
+                self._stop()
+                return
+            loops = int(elapsed // self.duration)
+            self._origin += loops * self.duration
+            elapsed -= loops * self.duration
+
+        index = bisect_right(self.timestamps, elapsed) - 1
+        if index != self.current:
+            # Frames whose time passed while the previous one was rendering are skipped
+            self.dropped += (index - self.current - 1) % self.num_frames
+            self.current = index
+            self.show(index)
+            self.displayed += 1
+            self.fps.tick()
+
+        next_time = self.timestamps[index + 1] if index + 1 < self.num_frames else self.duration
+        delay = self._origin + next_time - time.perf_counter()
+        self._after_id = self.widget.after(max(1, int(delay * 1000)), self._tick)
+
+    def __str__(self):
+        return f"{self.fps.fps:.1f}/{self.target_fps:.1f} fps, {self.dropped} dropped"
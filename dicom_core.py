@@ -0,0 +1,288 @@
+"""GUI-free core of the DICOM viewer: load, query metadata, render and anonymize.
+
+Nothing here imports tkinter or matplotlib, so batch jobs, servers and
+worker processes use the same fast paths as the viewer (deferred
+PixelData, per-frame decoding, the cached metadata view, the inverted
+search index, LUT windowing, streaming anonymization) without a display.
+
+    doc = DicomDocument.open("image.dcm")
+    doc.group_text("Patient Information")
+    doc.search("Modality=CT")
+    pixels = doc.render(0)                  # uint8 display values
+    doc.anonymize("ANON")
+    doc.save("anonymized.dcm")
+
+The Tk viewer (DicomReader.py) is a client of this module.
+"""
+import os
+
+import pydicom
+
+from anonymize_profile import compile_profile
+from frame_provider import get_frame_provider, iter_header_elements
+from instrumentation import span, timed
+from metadata_view import ALL_GROUP, GROUP_TAGS, MetadataView, format_value
+from search_engine import SearchIndex, split_query
+from windowing import WindowLevel
+
+# Elements larger than this (in practice PixelData) are left on disk until accessed
+DEFER_SIZE = "256 KB"
+
+# Image layouts, as chosen by image_kind()
+SINGLE_FRAME = "single"
+MULTI_FRAME = "multiframe"
+VOLUME = "volume"
+
+
+@timed("load.dcmread")
+def read_dicom(filepath, metadata_only=False):
+    """Read a DICOM file without pulling the pixel payload into memory.
+
+    With metadata_only the parser stops before (7FE0,0010) altogether.
+    Otherwise large values are deferred and read from disk the first
+    time ds.PixelData / ds.pixel_array is touched.
+    """
+    if metadata_only:
+        return pydicom.dcmread(filepath, stop_before_pixels=True)
+    return pydicom.dcmread(filepath, defer_size=DEFER_SIZE)
+
+
+def get_number_of_frames(ds):
+    """Return NumberOfFrames from the header (1 when absent)."""
+    try:
+        return int(ds.get("NumberOfFrames", 1) or 1)
+    except (TypeError, ValueError):
+        return 1
+
+
+def pixel_array_ndim(ds):
+    """Number of dimensions ds.pixel_array will have, computed from the header only."""
+    ndim = 2
+    if get_number_of_frames(ds) > 1:
+        ndim += 1
+    if int(ds.get("SamplesPerPixel", 1) or 1) > 1:
+        ndim += 1
+    return ndim
+
+
+def image_kind(ds, provider=None):
+    """SINGLE_FRAME, MULTI_FRAME (e.g. colour cine) or VOLUME, from the header only.
+
+    A provider with several grayscale frames (e.g. the slices of a series)
+    is a VOLUME whatever its first file says.
+    """
+    if provider is not None and len(provider) > 1 and len(provider.frame_shape) == 2:
+        return VOLUME
+    if hasattr(ds, "NumberOfFrames") and pixel_array_ndim(ds) == 3:
+        return VOLUME
+    if hasattr(ds, "NumberOfFrames"):
+        return MULTI_FRAME
+    return SINGLE_FRAME
+
+
+def anonymize_dicom(dicom_data, prefix, profile=None):
+    """Anonymize a DICOM dataset in place with a de-identification profile.
+
+    The default profile replaces names with the prefix, hashes IDs, shifts
+    dates and remaps SOP/series/study UIDs consistently across files.
+    profile may be a profile dict or the path of a JSON profile.
+    """
+    return compile_profile(profile, prefix).apply(dicom_data)
+
+
+def render_frame(provider, index=0, window=None, ds=None):
+    """One frame as uint8 display values (grayscale windowed, colour unchanged).
+
+    window is a WindowLevel; without one it is built from ds's header and
+    the frame itself.
+    """
+    frame = provider[index]
+    if window is None:
+        window = WindowLevel(ds, frame)
+    with span("render.frame"):
+        return window(frame)
+
+
+def element_record(element, max_depth=8):
+    """JSON-ready dict of one element; sequences nest their items' records."""
+    tag = element.tag
+    record = {
+        "tag": f"{tag.group:04X}{tag.element:04X}",
+        "keyword": element.keyword,
+        "name": element.name,
+        "vr": element.VR,
+    }
+    if element.VR == "SQ":
+        items = element.value or []
+        if max_depth > 0:
+            record["items"] = [[element_record(item[t], max_depth - 1) for t in item.keys()] for item in items]
+        else:
+            record["items"] = len(items)
+    else:
+        record["value"] = format_value(element)
+    return record
+
+
+class DicomDocument:
+    """A loaded dataset with lazily built metadata view, search index, frames and window."""
+
+    def __init__(self, ds, provider=None):
+        self.ds = ds
+        self._frames = provider
+        self._view = None
+        self._search_index = None
+        self._window = None
+        self.anonymized_with = None  # (prefix, profile) once anonymized
+
+    @classmethod
+    def open(cls, path, metadata_only=False):
+        return cls(read_dicom(path, metadata_only))
+
+    @classmethod
+    def from_series(cls, series):
+        """Metadata from the series' first file, frames from all of its slices."""
+        return cls(series.first_dataset(), series.frame_provider())
+
+    @property
+    def path(self):
+        filename = getattr(self.ds, "filename", None)
+        return filename if isinstance(filename, str) else None
+
+    @property
+    def kind(self):
+        return image_kind(self.ds, self._frames)
+
+    # Metadata
+
+    @property
+    def view(self):
+        """MetadataView of the header (PixelData stays on disk)."""
+        if self._view is None:
+            with span("metadata.view"):
+                self._view = MetadataView(self.ds)
+        return self._view
+
+    @property
+    def search_index(self):
+        if self._search_index is None:
+            self._search_index = SearchIndex()
+            self._search_index.add_dataset(self.path or "", self.ds)
+        return self._search_index
+
+    def group_names(self):
+        return list(GROUP_TAGS) + [ALL_GROUP]
+
+    def group_text(self, group_name):
+        """Text of a metadata group, or None for an unknown group."""
+        return self.view.group_text(group_name)
+
+    def name_text(self, name):
+        return self.view.name_text(name)
+
+    def search(self, query, substring=True):
+        """SearchResult of a query (plain words and field clauses, see search_engine)."""
+        return self.search_index.search(query, substring=substring)
+
+    def search_text(self, query):
+        """Matching elements as metadata text ('' if none); an empty query lists everything.
+
+        Field clauses (Modality=CT, StudyDate=2020..) go through the search
+        index; the rest of the query is matched as one phrase anywhere in
+        element names and values, like the viewer's original search.
+        """
+        query = query.strip()
+        if not query:
+            return self.view.group_text(ALL_GROUP)
+        fields, text = split_query(query)
+        tags = set()
+        if fields:
+            matched = [tags for _, tags in self.search(" ".join(fields)).items()]
+            if not matched:
+                return ""
+            tags.update(matched[0])
+        if text:
+            found = self.view.find(text)
+            if not found:
+                return ""
+            tags.update(found)
+        return self.view.text(tag for tag in self.view.elements if tag in tags)
+
+    def metadata(self, group_name=None):
+        """JSON-ready records of the header, or of one group (None for an unknown group)."""
+        if group_name is None:
+            elements = iter_header_elements(self.ds)
+        else:
+            elements = self.view.group_elements(group_name)
+            if elements is None:
+                return None
+        return [element_record(element) for element in elements]
+
+    # Pixels
+
+    @property
+    def frames(self):
+        """FrameProvider of the pixel data, opened on first use."""
+        if self._frames is None:
+            self._frames = get_frame_provider(self.ds)
+        return self._frames
+
+    @property
+    def num_frames(self):
+        return len(self.frames)
+
+    @property
+    def window(self):
+        """WindowLevel shared by every frame, from the header or the middle frame."""
+        if self._window is None:
+            self._window = WindowLevel(self.ds, self.frames[len(self.frames) // 2])
+        return self._window
+
+    def render(self, index=0, center=None, width=None):
+        """Frame index as uint8 display values, optionally with a window center/width."""
+        window = self.window
+        if center is not None or width is not None:
+            window.set_window(window.center if center is None else center,
+                              window.width if width is None else width)
+        return render_frame(self.frames, index, window)
+
+    # Anonymization
+
+    def anonymize(self, prefix, profile=None):
+        """De-identify the dataset in place; cached metadata is rebuilt on next use.
+
+        Repeating the same call is a no-op. Anonymizing again with other
+        settings starts over from the source file when there is one, as
+        save() does, so UIDs are never remapped twice.
+        """
+        if self.anonymized_with is not None:
+            if self.anonymized_with == (prefix, profile):
+                return self
+            source = self.path
+            if source and os.path.isfile(source):
+                self.ds = read_dicom(source)
+        anonymize_dicom(self.ds, prefix, profile)
+        self.anonymized_with = (prefix, profile)
+        self._view = None
+        self._search_index = None
+        return self
+
+    def save(self, destination):
+        """Write the dataset to destination.
+
+        An anonymized file that was read from disk is re-anonymized from its
+        source with streaming, so PixelData is copied in chunks instead of
+        loaded; anything else is written with save_as.
+        """
+        source = self.path
+        if self.anonymized_with is not None and source and os.path.isfile(source):
+            from stream_anonymize import anonymize_stream
+            prefix, profile = self.anonymized_with
+            anonymize_stream(source, destination, prefix, profile=profile)
+        else:
+            self.ds.save_as(destination)
+        return destination
+
+    def close(self):
+        if self._frames is not None:
+            self._frames.close()
+            self._frames = None
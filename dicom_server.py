@@ -0,0 +1,664 @@
+"""Local DICOMweb-style HTTP service for metadata and rendered frames.
+
+Serves a folder of DICOM files (indexed and grouped into series as in
+the viewer's Import Folder) over HTTP/1.1 with keep-alive:
+
+    GET /studies
+    GET /studies/{study}/series
+    GET /studies/{study}/series/{series}/metadata[?group=Patient Information]
+    GET /studies/{study}/series/{series}/instances
+    GET /studies/{study}/series/{series}/instances/{sop}/metadata[?group=...]
+    GET /studies/{study}/series/{series}/instances/{sop}/frames/{n}/rendered
+        [?format=png|jpeg&size=256&window=center,width&quality=90]
+    GET /studies/{study}/series/{series}/thumbnail[?size=128]
+
+Metadata is the viewer's group output (dicom_core.DicomDocument) as JSON;
+frames are windowed exactly as in the viewer and encoded as PNG or JPEG
+(Pillow). Requests are parsed on one asyncio event loop; header parsing,
+decoding, windowing and encoding run on a bounded thread pool. Responses
+carry an ETag derived from the source file's size and mtime and the
+render parameters, so a matching If-None-Match is answered 304 without
+touching the file, and rendered bodies are kept in an LRU cache bounded
+in bytes, so repeated thumbnail requests are served from memory.
+Identical requests in flight share one render.
+
+Usage:
+    python dicom_server.py FOLDER [--port 8042] [--workers N] [--cache-mb 256]
+    python dicom_server.py FOLDER --benchmark       # loopback load test
+"""
+import argparse
+import asyncio
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from dicom_core import DicomDocument, render_frame
+from instrumentation import span
+from series_index import load_folder
+from windowing import WindowLevel
+
+DEFAULT_PORT = 8042
+DEFAULT_CACHE_BYTES = 256 * 1024 * 1024
+# Parsed files kept open for rendering; older ones are dropped first
+DOCUMENT_CACHE_SIZE = 64
+# Render jobs allowed to wait for a worker before new ones are refused with 503
+MAX_QUEUED_PER_WORKER = 16
+THUMBNAIL_SIZE = 128
+MAX_RENDER_SIZE = 8192
+DEFAULT_JPEG_QUALITY = 90
+MAX_HEADER_BYTES = 64 * 1024
+
+CONTENT_TYPES = {"png": "image/png", "jpeg": "image/jpeg"}
+STATUS_TEXT = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found",
+               405: "Method Not Allowed", 406: "Not Acceptable", 431: "Request Header Fields Too Large",
+               500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Response:
+    __slots__ = ("status", "content_type", "body", "etag")
+
+    def __init__(self, status, content_type, body, etag=None):
+        self.status = status
+        self.content_type = content_type
+        self.body = body
+        self.etag = etag
+
+
+class RenderCache:
+    """LRU of response bodies by key, bounded in total bytes (event-loop thread only)."""
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        response = self._entries.get(key)
+        if response is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return response
+
+    def put(self, key, response):
+        size = len(response.body)
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.bytes -= len(old.body)
+        self._entries[key] = response
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.bytes -= len(evicted.body)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def make_etag(path, *params):
+    """Strong validator of the file's current version and the response parameters."""
+    stat = os.stat(path)
+    text = "|".join([path, str(stat.st_mtime_ns), str(stat.st_size)] + [str(p) for p in params])
+    return '"' + hashlib.sha1(text.encode("utf-8", "replace")).hexdigest()[:24] + '"'
+
+
+def parse_window(text):
+    if not text:
+        return None
+    try:
+        center, width = (float(v) for v in text.split(","))
+    except ValueError:
+        raise HTTPError(400, "window must be center,width") from None
+    if width <= 0:
+        raise HTTPError(400, "window width must be positive")
+    return center, width
+
+
+def parse_int(text, default, low, high, name):
+    if text is None or text == "":
+        return default
+    try:
+        value = int(text)
+    except ValueError:
+        raise HTTPError(400, f"{name} must be an integer") from None
+    if not low <= value <= high:
+        raise HTTPError(400, f"{name} must be between {low} and {high}")
+    return value
+
+
+def encode_image(pixels, image_format, size=None, quality=DEFAULT_JPEG_QUALITY):
+    """uint8 grayscale or RGB pixels as PNG/JPEG bytes, downscaled to fit size x size."""
+    try:
+        from PIL import Image
+    except ImportError:
+        raise HTTPError(406, "Rendering frames needs Pillow (pip install pillow)") from None
+    image = Image.fromarray(pixels)
+    if size and max(image.size) > size:
+        image.thumbnail((size, size), Image.Resampling.BILINEAR, reducing_gap=2.0)
+    out = io.BytesIO()
+    if image_format == "jpeg":
+        image.save(out, "JPEG", quality=quality)
+    else:
+        image.save(out, "PNG", compress_level=1)  # Fast; the cache makes size matter less
+    return out.getvalue()
+
+
+class Archive:
+    """Studies, series and instances of a folder, indexed once at start-up."""
+
+    def __init__(self, folder, index=None):
+        self.folder = folder
+        self.series = load_folder(folder, index=index)
+        self.studies = OrderedDict()  # study uid -> {series uid: [Series]}
+        self.instances = {}  # (study, series, sop) -> IndexedFile
+        for series in self.series:
+            self.studies.setdefault(series.study_uid, OrderedDict()) \
+                .setdefault(series.series_uid, []).append(series)
+            for entry in series.files:
+                self.instances[(series.study_uid, series.series_uid, entry.sop_uid)] = entry
+
+    def get_series(self, study, series):
+        found = self.studies.get(study, {}).get(series)
+        if not found:
+            raise HTTPError(404, f"Series {series} not found in study {study}")
+        return found
+
+    def series_files(self, study, series):
+        return [entry for part in self.get_series(study, series) for entry in part.files]
+
+    def get_instance(self, study, series, sop):
+        entry = self.instances.get((study, series, sop))
+        if entry is None:
+            raise HTTPError(404, f"Instance {sop} not found")
+        return entry
+
+
+class CachedDocument:
+    """A parsed file shared by the render pool; closed once evicted and no longer in use.
+
+    users and evicted are guarded by the service's cache lock; lock
+    serializes the jobs on this document.
+    """
+
+    def __init__(self, document):
+        self.document = document
+        self.lock = threading.Lock()
+        self.users = 0
+        self.evicted = False
+
+    def evict(self):
+        """Mark as dropped from the cache; True if nobody is using it, so it can be closed now."""
+        self.evicted = True
+        return self.users == 0
+
+
+class DicomService:
+    """Request handling: routing, caching and dispatch to the worker pool."""
+
+    ROUTES = [
+        (re.compile(r"^/studies/?$"), "studies"),
+        (re.compile(r"^/studies/([^/]+)/series/?$"), "series_list"),
+        (re.compile(r"^/studies/([^/]+)/series/([^/]+)/metadata$"), "series_metadata"),
+        (re.compile(r"^/studies/([^/]+)/series/([^/]+)/instances/?$"), "instances"),
+        (re.compile(r"^/studies/([^/]+)/series/([^/]+)/instances/([^/]+)/metadata$"), "instance_metadata"),
+        (re.compile(r"^/studies/([^/]+)/series/([^/]+)/instances/([^/]+)/frames/(\d+)/rendered$"), "rendered"),
+        (re.compile(r"^/studies/([^/]+)/series/([^/]+)/thumbnail$"), "thumbnail"),
+    ]
+
+    def __init__(self, archive, workers=None, cache_bytes=DEFAULT_CACHE_BYTES):
+        self.archive = archive
+        self.workers = workers or min(32, (os.cpu_count() or 1) + 4)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="render")
+        self.cache = RenderCache(cache_bytes)
+        self.requests = 0
+        self.not_modified = 0
+        self._queued = 0
+        self._max_queued = self.workers * MAX_QUEUED_PER_WORKER
+        self._in_flight = {}  # cache key -> Future of the response being produced
+        self._documents = OrderedDict()  # (path, mtime_ns, size) -> CachedDocument
+        self._documents_lock = threading.Lock()
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        with self._documents_lock:
+            idle = [entry for entry in self._documents.values() if entry.evict()]
+            self._documents.clear()
+        for entry in idle:
+            entry.document.close()
+
+    # Worker-side helpers (run on the pool)
+
+    @contextmanager
+    def _document(self, path):
+        """Check out the cached document of path for one job.
+
+        Evicted documents are closed by whoever releases them last, so a
+        render in progress never sees its frames closed underneath it.
+        """
+        # A file rewritten in place gets a new key, so its stale parse is never served
+        st = os.stat(path)
+        key = (path, st.st_mtime_ns, st.st_size)
+        with self._documents_lock:
+            entry = self._documents.get(key)
+            if entry is not None:
+                self._documents.move_to_end(key)
+                entry.users += 1
+        if entry is None:
+            # Parsing happens outside the lock; a concurrent duplicate is closed again
+            opened = CachedDocument(DicomDocument.open(path))
+            idle = []
+            with self._documents_lock:
+                entry = self._documents.setdefault(key, opened)
+                entry.users += 1
+                while len(self._documents) > DOCUMENT_CACHE_SIZE:
+                    evicted = self._documents.popitem(last=False)[1]
+                    if evicted.evict():
+                        idle.append(evicted)
+            if entry is not opened:
+                idle.append(opened)
+            for evicted in idle:
+                evicted.document.close()
+        try:
+            yield entry
+        finally:
+            with self._documents_lock:
+                entry.users -= 1
+                closing = entry.evicted and entry.users == 0
+            if closing:
+                entry.document.close()
+
+    def _render(self, path, frame_index, image_format, size, window, quality):
+        with span("server.render", path=os.path.basename(path), frame=frame_index), \
+                self._document(path) as entry:
+            # Frames are opened lazily and the shared window caches its lookup tables
+            with entry.lock:
+                document = entry.document
+                frames = document.frames
+                if not 0 <= frame_index < len(frames):
+                    raise HTTPError(404, f"Frame {frame_index + 1} not found (1-{len(frames)})")
+                if window is None:
+                    pixels = render_frame(frames, frame_index, document.window)
+                else:
+                    custom = WindowLevel(document.ds)
+                    custom.set_window(*window)
+                    pixels = render_frame(frames, frame_index, custom)
+            # Colour frames can still view the source, so the document stays checked out
+            return encode_image(pixels, image_format, size, quality)
+
+    def _metadata(self, path, group):
+        with span("server.metadata", path=os.path.basename(path)), \
+                self._document(path) as entry, entry.lock:
+            document = entry.document
+            if group is None:
+                groups = {name: document.metadata(name) for name in document.group_names()}
+                return json_bytes({"groups": groups})
+            records = document.metadata(group)
+            if records is None:
+                raise HTTPError(404, f"Unknown group {group!r}; groups: {', '.join(document.group_names())}")
+            return json_bytes({"group": group, "elements": records})
+
+    # Event-loop side
+
+    async def _cached(self, key, etag, headers, content_type, func, *args):
+        """Serve key from the conditional request, the cache, an in-flight job or the pool."""
+        if etag is not None and etag in headers.get("if-none-match", ""):
+            self.not_modified += 1
+            return Response(304, content_type, b"", etag)
+        response = self.cache.get(key)
+        if response is not None and response.etag == etag:
+            return response
+        future = self._in_flight.get(key)
+        if future is None:
+            if self._queued >= self._max_queued:
+                raise HTTPError(503, "Too many requests queued")
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._in_flight[key] = future
+            self._queued += 1
+            try:
+                body = await loop.run_in_executor(self.executor, func, *args)
+                response = Response(200, content_type, body, etag)
+                self.cache.put(key, response)
+                future.set_result(response)
+            except Exception as e:
+                future.set_exception(e)
+                future.exception()  # Mark retrieved for waiters that never come
+                raise
+            finally:
+                self._queued -= 1
+                del self._in_flight[key]
+            return response
+        return await asyncio.shield(future)
+
+    async def handle(self, method, target, headers):
+        self.requests += 1
+        if method not in ("GET", "HEAD"):
+            raise HTTPError(405, f"Method {method} not allowed")
+        url = urlsplit(target)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        path = unquote(url.path)
+        for pattern, name in self.ROUTES:
+            match = pattern.match(path)
+            if match:
+                return await getattr(self, "route_" + name)(headers, query, *match.groups())
+        raise HTTPError(404, f"No route for {path}")
+
+    async def route_studies(self, headers, query):
+        studies = []
+        for study_uid, series in self.archive.studies.items():
+            first = next(iter(series.values()))[0]
+            studies.append({"StudyInstanceUID": study_uid, "Modality": first.modality,
+                            "Series": len(series),
+                            "Instances": sum(len(part) for parts in series.values() for part in parts)})
+        return Response(200, "application/json", json_bytes(studies))
+
+    async def route_series_list(self, headers, query, study):
+        series = self.archive.studies.get(study)
+        if series is None:
+            raise HTTPError(404, f"Study {study} not found")
+        listing = []
+        for series_uid, parts in series.items():
+            listing.append({"SeriesInstanceUID": series_uid, "Modality": parts[0].modality,
+                            "SeriesDescription": parts[0].description,
+                            "Instances": sum(len(part) for part in parts),
+                            "Frames": sum(part.num_frames for part in parts),
+                            "Rows": parts[0].rows, "Columns": parts[0].columns})
+        return Response(200, "application/json", json_bytes(listing))
+
+    async def route_instances(self, headers, query, study, series):
+        files = self.archive.series_files(study, series)
+        listing = [{"SOPInstanceUID": entry.sop_uid, "InstanceNumber": entry.instance_number,
+                    "NumberOfFrames": entry.num_frames} for entry in files]
+        return Response(200, "application/json", json_bytes(listing))
+
+    async def route_series_metadata(self, headers, query, study, series):
+        entry = self.archive.series_files(study, series)[0]
+        return await self._metadata_response(headers, query, entry.path)
+
+    async def route_instance_metadata(self, headers, query, study, series, sop):
+        entry = self.archive.get_instance(study, series, sop)
+        return await self._metadata_response(headers, query, entry.path)
+
+    async def _metadata_response(self, headers, query, path):
+        group = query.get("group")
+        etag = make_etag(path, "metadata", group)
+        return await self._cached(("metadata", path, group), etag, headers, "application/json",
+                                  self._metadata, path, group)
+
+    async def route_rendered(self, headers, query, study, series, sop, frame):
+        entry = self.archive.get_instance(study, series, sop)
+        return await self._rendered_response(headers, query, entry.path, int(frame) - 1, None)
+
+    async def route_thumbnail(self, headers, query, study, series):
+        files = self.archive.series_files(study, series)
+        entry = files[len(files) // 2]
+        return await self._rendered_response(headers, query, entry.path, entry.num_frames // 2, THUMBNAIL_SIZE)
+
+    async def _rendered_response(self, headers, query, path, frame_index, default_size):
+        image_format = query.get("format")
+        if image_format is None:
+            accept = headers.get("accept", "")
+            image_format = "jpeg" if "image/jpeg" in accept and "image/png" not in accept else "png"
+        image_format = {"jpg": "jpeg"}.get(image_format.lower(), image_format.lower())
+        if image_format not in CONTENT_TYPES:
+            raise HTTPError(400, "format must be png or jpeg")
+        size = parse_int(query.get("size"), default_size, 1, MAX_RENDER_SIZE, "size")
+        quality = parse_int(query.get("quality"), DEFAULT_JPEG_QUALITY, 1, 100, "quality")
+        window = parse_window(query.get("window"))
+        params = (frame_index, image_format, size, window, quality if image_format == "jpeg" else None)
+        etag = make_etag(path, *params)
+        return await self._cached(("frame", path) + params, etag, headers, CONTENT_TYPES[image_format],
+                                  self._render, path, frame_index, image_format, size, window, quality)
+
+    # HTTP/1.1 connection handling
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request_line = await reader.readline()
+                except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+                    break
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self._write(writer, error_response(400, "Malformed request line"), False, "GET")
+                    break
+                headers = {}
+                header_bytes = 0
+                while header_bytes <= MAX_HEADER_BYTES:
+                    try:
+                        line = await reader.readline()
+                    except (asyncio.LimitOverrunError, ValueError):  # One line over the stream limit
+                        header_bytes = MAX_HEADER_BYTES + 1
+                        break
+                    header_bytes += len(line)
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                if header_bytes > MAX_HEADER_BYTES:
+                    # The rest of the header block is unread, so the connection cannot be reused
+                    await self._write(writer, error_response(431, "Request header fields too large"),
+                                      False, method)
+                    break
+                keep_alive = (version == "HTTP/1.1" and headers.get("connection", "").lower() != "close") or \
+                    headers.get("connection", "").lower() == "keep-alive"
+                try:
+                    response = await self.handle(method, target, headers)
+                except HTTPError as e:
+                    response = error_response(e.status, str(e))
+                except Exception as e:
+                    response = error_response(500, f"{type(e).__name__}: {e}")
+                await self._write(writer, response, keep_alive, method)
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _write(writer, response, keep_alive, method):
+        # HEAD reports the length of the body a GET would get, but sends no body
+        body = b"" if method == "HEAD" or response.status == 304 else response.body
+        lines = [f"HTTP/1.1 {response.status} {STATUS_TEXT.get(response.status, 'Error')}",
+                 f"Content-Type: {response.content_type}",
+                 f"Content-Length: {len(response.body) if response.status != 304 else 0}",
+                 f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        if response.etag:
+            lines.append(f"ETag: {response.etag}")
+            lines.append("Cache-Control: private, max-age=0, must-revalidate")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+    def stats(self):
+        return {"requests": self.requests, "not_modified": self.not_modified,
+                "cache_hits": self.cache.hits, "cache_misses": self.cache.misses,
+                "cache_entries": len(self.cache), "cache_bytes": self.cache.bytes}
+
+
+def json_bytes(value):
+    return json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+
+def error_response(status, message):
+    return Response(status, "application/json", json_bytes({"error": message}))
+
+
+class ServerThread:
+    """Run a DicomService on its own event loop in a background thread (for tests and benchmarks)."""
+
+    def __init__(self, service, host="127.0.0.1", port=0):
+        self.service = service
+        self.host = host
+        self.port = port
+        self._loop = None
+        self._server = None
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="dicom-server", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        self._server = self._loop.run_until_complete(
+            asyncio.start_server(self.service.handle_connection, self.host, self.port))
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        self._loop.run_forever()
+        self._server.close()
+        self._loop.run_until_complete(self._server.wait_closed())
+        self._loop.close()
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+        self.service.close()
+
+
+async def http_get(reader, writer, path, headers=None):
+    """Minimal keep-alive HTTP/1.1 GET over an open connection: (status, headers, body)."""
+    request = [f"GET {path} HTTP/1.1", "Host: localhost"]
+    request += [f"{name}: {value}" for name, value in (headers or {}).items()]
+    writer.write(("\r\n".join(request) + "\r\n\r\n").encode("latin-1"))
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    response_headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        response_headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(response_headers.get("content-length", 0)))
+    return status, response_headers, body
+
+
+async def run_load(port, paths, concurrency, headers_for=None):
+    """GET every path over `concurrency` keep-alive connections; returns (latencies, responses)."""
+    queue = list(reversed(paths))
+    latencies = []
+    responses = {}
+
+    async def client():
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        try:
+            while queue:
+                path = queue.pop()
+                start = time.perf_counter()
+                responses[path] = await http_get(reader, writer, path, headers_for(path) if headers_for else None)
+                latencies.append(time.perf_counter() - start)
+        finally:
+            writer.close()
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies, responses
+
+
+def loopback_benchmark(folder, concurrency=8, workers=None, size=THUMBNAIL_SIZE, log=print):
+    """Serve folder on the loopback interface and time cold, cached and conditional frame requests."""
+    started = time.perf_counter()
+    service = DicomService(Archive(folder), workers)
+    index_seconds = time.perf_counter() - started
+    server = ServerThread(service).start()
+    try:
+        paths = []
+        for (study, series, sop), entry in service.archive.instances.items():
+            for frame in range(1, entry.num_frames + 1):
+                paths.append(f"/studies/{study}/series/{series}/instances/{sop}/frames/{frame}/rendered?size={size}")
+        results = {"index_seconds": index_seconds, "frames": len(paths), "concurrency": concurrency}
+
+        def phase(name, headers_for=None):
+            start = time.perf_counter()
+            latencies, responses = asyncio.run(run_load(server.port, paths, concurrency, headers_for))
+            seconds = time.perf_counter() - start
+            latencies.sort()
+            results[name] = {
+                "seconds": seconds,
+                "requests_per_second": len(paths) / seconds if seconds else 0.0,
+                "p50_ms": latencies[len(latencies) // 2] * 1000,
+                "p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000,
+                "statuses": sorted({status for status, _, _ in responses.values()}),
+            }
+            log(f"{name:<12} {results[name]['requests_per_second']:>9.0f} req/s  "
+                f"p50 {results[name]['p50_ms']:.2f} ms  p95 {results[name]['p95_ms']:.2f} ms")
+            return responses
+
+        responses = phase("cold")
+        phase("cached")
+        etags = {path: headers.get("etag", "") for path, (_, headers, _) in responses.items()}
+        phase("conditional", lambda path: {"If-None-Match": etags[path]})
+        results["server"] = service.stats()
+        return results
+    finally:
+        server.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve DICOM metadata and rendered frames over HTTP.")
+    parser.add_argument("folder", help="Folder of DICOM files to serve")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on (default: loopback only)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=None, help="Render worker threads")
+    parser.add_argument("--cache-mb", type=int, default=DEFAULT_CACHE_BYTES // (1024 * 1024),
+                        help="Rendered-frame cache size in MB")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="Run a loopback load test against the folder instead of serving")
+    parser.add_argument("--concurrency", type=int, default=8, help="Client connections for --benchmark")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.folder):
+        parser.error(f"Folder not found: {args.folder}")
+    if args.benchmark:
+        print(json.dumps(loopback_benchmark(args.folder, args.concurrency, args.workers), indent=2))
+        return 0
+
+    started = time.perf_counter()
+    service = DicomService(Archive(args.folder), args.workers, args.cache_mb * 1024 * 1024)
+    print(f"Indexed {len(service.archive.instances)} instances in {len(service.archive.studies)} studies "
+          f"in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+    async def serve():
+        server = await asyncio.start_server(service.handle_connection, args.host, args.port)
+        print(f"Serving on http://{args.host}:{args.port}/studies", file=sys.stderr)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
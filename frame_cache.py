@@ -0,0 +1,159 @@
+"""Decoded-frame LRU cache with background prefetch.
+
+Wraps a FrameProvider so that stepping through slices or playing a cine
+loop only pays for a decode once per frame. Frames are evicted least
+recently used first once the byte budget is exceeded, and the next few
+frames in the direction of travel are decoded on a background thread.
+"""
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from instrumentation import span
+
+DEFAULT_CACHE_BYTES = 256 * 1024 * 1024
+DEFAULT_PREFETCH = 8
+
+
+class FrameCache:
+    """Byte-budgeted LRU cache of decoded (and optionally transformed) frames.
+
+    transform, if given, is applied to each decoded frame before it is
+    cached (e.g. windowing to display values). Indexing the cache works
+    like indexing the provider, and also schedules a prefetch of the
+    next `prefetch` frames in the direction of travel.
+    """
+
+    def __init__(self, provider, max_bytes=DEFAULT_CACHE_BYTES, transform=None,
+                 prefetch=DEFAULT_PREFETCH, workers=1):
+        self.provider = provider
+        self.max_bytes = max_bytes
+        self.prefetch_count = prefetch
+        self._transform = transform
+        self._frames = OrderedDict()
+        self._pending = {}
+        self._bytes = 0
+        self._generation = 0
+        self._last_index = None
+        self._direction = 1
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="frame-prefetch") \
+            if prefetch else None
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.provider)
+
+    def __getitem__(self, index):
+        return self.get(index)
+
+    @property
+    def shape(self):
+        return self.provider.shape
+
+    @property
+    def nbytes(self):
+        return self._bytes
+
+    def set_transform(self, transform):
+        """Change the per-frame transform; cached frames are discarded."""
+        with self._lock:
+            self._transform = transform
+            self._generation += 1
+            self._frames.clear()
+            self._bytes = 0
+            for future in self._pending.values():
+                future.cancel()
+            self._pending.clear()
+
+    def get(self, index, prefetch=True):
+        """Return frame `index`, decoding it if it is not cached yet."""
+        index = int(index)
+        if index < 0:
+            index += len(self.provider)
+
+        with self._lock:
+            if self._last_index is not None and index != self._last_index:
+                self._direction = 1 if index > self._last_index else -1
+            self._last_index = index
+
+            frame = self._frames.get(index)
+            if frame is not None:
+                self._frames.move_to_end(index)
+                self.hits += 1
+            else:
+                self.misses += 1
+            future = self._pending.get(index) if frame is None else None
+
+        if frame is None:
+            if future is not None and not future.cancelled():
+                # Already being decoded in the background: wait for that instead of decoding twice
+                frame = future.result()
+            else:
+                frame = self._load(index, self._generation)
+
+        if prefetch:
+            self.prefetch(index, self._direction)
+        return frame
+
+    def prefetch(self, index, direction=1):
+        """Decode the next frames after `index` in `direction` in the background."""
+        if self._executor is None:
+            return
+        targets = []
+        for step in range(1, self.prefetch_count + 1):
+            target = index + direction * step
+            if 0 <= target < len(self.provider):
+                targets.append(target)
+
+        with self._lock:
+            # Drop queued work that is no longer ahead of us (e.g. direction changed)
+            for pending_index in list(self._pending):
+                if pending_index not in targets and self._pending[pending_index].cancel():
+                    del self._pending[pending_index]
+            generation = self._generation
+            for target in targets:
+                if target in self._frames or target in self._pending:
+                    continue
+                future = self._executor.submit(self._load, target, generation)
+                self._pending[target] = future
+
+    def _load(self, index, generation):
+        try:
+            with span("frame_cache.decode", index=index):
+                frame = self.provider[index]
+            if self._transform is not None:
+                frame = self._transform(frame)
+            else:
+                # Touch the data now (e.g. page in a memory map) rather than on the UI thread
+                frame = np.array(frame)
+            self._store(index, frame, generation)
+            return frame
+        finally:
+            with self._lock:
+                self._pending.pop(index, None)
+
+    def _store(self, index, frame, generation):
+        with self._lock:
+            if generation != self._generation or index in self._frames:
+                return
+            self._frames[index] = frame
+            self._bytes += frame.nbytes
+            while self._bytes > self.max_bytes and len(self._frames) > 1:
+                _, evicted = self._frames.popitem(last=False)
+                self._bytes -= evicted.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self._bytes = 0
+
+    def close(self):
+        """Stop the prefetcher and drop cached frames."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self.clear()
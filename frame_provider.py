@@ -0,0 +1,490 @@
+"""Lazy, per-frame access to DICOM pixel data.
+
+``ds.pixel_array`` decodes every frame into one array up front. The
+providers here hand out one frame at a time instead:
+
+* uncompressed PixelData is served zero-copy from a memory-mapped view
+  of the file, starting at the PixelData value offset;
+* encapsulated (compressed) PixelData is indexed through the Basic
+  Offset Table and each frame is decoded on its own when requested;
+  reading many frames in order (iterating, ``as_array``) decodes them
+  in parallel on a process pool.
+
+Use ``get_frame_provider(ds)`` on a dataset read with ``read_dicom`` (so
+that PixelData is still deferred on disk).
+"""
+import io
+import os
+import struct
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.encaps import encapsulate
+from pydicom.tag import Tag
+
+from instrumentation import span, timed
+
+PIXEL_DATA_TAG = Tag(0x7FE0, 0x0010)
+EXTENDED_OFFSET_TABLE_TAG = Tag(0x7FE0, 0x0001)
+ITEM_TAG = Tag(0xFFFE, 0xE000)
+SEQUENCE_DELIMITER_TAG = Tag(0xFFFE, 0xE0DD)
+
+# Transfer syntaxes whose PixelData is stored native (not encapsulated)
+NATIVE_TRANSFER_SYNTAXES = {
+    "1.2.840.10008.1.2",       # Implicit VR Little Endian
+    "1.2.840.10008.1.2.1",     # Explicit VR Little Endian
+    "1.2.840.10008.1.2.1.99",  # Deflated Explicit VR Little Endian
+    "1.2.840.10008.1.2.2",     # Explicit VR Big Endian
+}
+BIG_ENDIAN_TRANSFER_SYNTAX = "1.2.840.10008.1.2.2"
+
+# Compressed frames are decoded in parallel only when there are at least
+# this many; below that, starting the worker processes costs more than it saves
+PARALLEL_DECODE_THRESHOLD = 16
+# Frames sent to a worker per task, and tasks kept queued per worker
+DECODE_BATCH_SIZE = 8
+DECODE_BATCHES_PER_WORKER = 2
+
+# Image Pixel module attributes needed to decode a single frame on its own
+PIXEL_MODULE_KEYWORDS = (
+    "SamplesPerPixel",
+    "PhotometricInterpretation",
+    "PlanarConfiguration",
+    "Rows",
+    "Columns",
+    "BitsAllocated",
+    "BitsStored",
+    "HighBit",
+    "PixelRepresentation",
+    "RedPaletteColorLookupTableDescriptor",
+    "GreenPaletteColorLookupTableDescriptor",
+    "BluePaletteColorLookupTableDescriptor",
+    "RedPaletteColorLookupTableData",
+    "GreenPaletteColorLookupTableData",
+    "BluePaletteColorLookupTableData",
+)
+
+
+def get_transfer_syntax(ds):
+    """Return the dataset's Transfer Syntax UID as a string ('' if unknown)."""
+    file_meta = getattr(ds, "file_meta", None)
+    if file_meta is None:
+        return ""
+    return str(file_meta.get("TransferSyntaxUID", ""))
+
+
+def get_pixel_data_element(ds):
+    """Return the PixelData element without forcing a deferred read."""
+    try:
+        return ds.get_item(PIXEL_DATA_TAG, keep_deferred=True)
+    except TypeError:
+        # pydicom < 3 never resolves deferred values in get_item()
+        return ds.get_item(PIXEL_DATA_TAG)
+
+
+def iter_header_elements(ds):
+    """Yield every element except PixelData without reading deferred values.
+
+    Iterating a Dataset directly resolves deferred elements, which would
+    pull the whole pixel payload into memory just to list the header.
+    """
+    for tag in list(ds.keys()):
+        if tag != PIXEL_DATA_TAG:
+            yield ds[tag]
+
+
+class FrameProvider:
+    """Base class: sequence-like access to the frames of a dataset.
+
+    Subclasses implement get_frame(index). Frames come back as arrays of
+    shape (rows, columns) or (rows, columns, samples).
+    """
+
+    def __init__(self, num_frames, frame_shape, dtype):
+        self.num_frames = num_frames
+        self.frame_shape = tuple(frame_shape)
+        self.dtype = np.dtype(dtype)
+
+    @property
+    def shape(self):
+        return (self.num_frames,) + self.frame_shape
+
+    @property
+    def frame_nbytes(self):
+        return int(np.prod(self.frame_shape)) * self.dtype.itemsize
+
+    def __len__(self):
+        return self.num_frames
+
+    def __getitem__(self, index):
+        if not isinstance(index, (int, np.integer)):
+            raise TypeError("Frame index must be an integer")
+        index = int(index)
+        if index < 0:
+            index += self.num_frames
+        if not 0 <= index < self.num_frames:
+            raise IndexError(f"Frame {index} out of range (0-{self.num_frames - 1})")
+        return self.get_frame(index)
+
+    def __iter__(self):
+        for index in range(self.num_frames):
+            yield self.get_frame(index)
+
+    def get_frame(self, index):
+        raise NotImplementedError
+
+    def as_array(self, progress=None):
+        """All frames as one (frames, ...) array, filled frame by frame into one allocation.
+
+        progress, if given, is called with (done, total) after each frame.
+        Subclasses that already hold the frames contiguously return them
+        without copying.
+        """
+        volume = np.empty(self.shape, dtype=self.dtype)
+        for index in range(self.num_frames):
+            volume[index] = self.get_frame(index)
+            if progress:
+                progress(index + 1, self.num_frames)
+        return volume
+
+    def close(self):
+        """Release any file handles or mappings held by the provider."""
+
+
+class ArrayFrameProvider(FrameProvider):
+    """Frames backed by an in-memory array (or a callable producing one on demand)."""
+
+    def __init__(self, array_or_loader, num_frames=None, frame_shape=None, dtype=None):
+        self._array = None
+        self._loader = None
+        self._lock = threading.Lock()
+        if callable(array_or_loader):
+            self._loader = array_or_loader
+        else:
+            array = np.asarray(array_or_loader)
+            self._array = self._as_frames(array, len(frame_shape) if frame_shape else 2)
+            num_frames = self._array.shape[0]
+            frame_shape = self._array.shape[1:]
+            dtype = self._array.dtype
+        super().__init__(num_frames, frame_shape, dtype)
+
+    @staticmethod
+    def _as_frames(array, frame_ndim):
+        # A single frame comes back from pixel_array without a frame axis
+        if array.ndim == frame_ndim:
+            return array[np.newaxis, ...]
+        return array
+
+    def get_frame(self, index):
+        if self._array is None:
+            with self._lock:
+                if self._array is None:
+                    with span("decode.pixel_array"):
+                        self._array = self._as_frames(np.asarray(self._loader()), len(self.frame_shape))
+        return self._array[index]
+
+    def as_array(self, progress=None):
+        self.get_frame(0)
+        return self._array
+
+    def close(self):
+        self._array = None
+
+
+class MemmapFrameProvider(FrameProvider):
+    """Uncompressed frames served as views of a memory-mapped PixelData value."""
+
+    def __init__(self, ds, offset, num_frames, frame_shape, dtype, planar=False, sign_shift=0):
+        super().__init__(num_frames, frame_shape, dtype)
+        self.filename = ds.filename
+        rows, columns = frame_shape[0], frame_shape[1]
+        samples = frame_shape[2] if len(frame_shape) == 3 else 1
+        if samples > 1 and planar:
+            stored_shape = (num_frames, samples, rows, columns)
+        else:
+            stored_shape = (num_frames,) + tuple(frame_shape)
+        self._mmap = np.memmap(self.filename, dtype=self.dtype, mode="r",
+                               offset=offset, shape=stored_shape)
+        self._planar = samples > 1 and planar
+        self._sign_shift = sign_shift
+
+    def get_frame(self, index):
+        frame = self._mmap[index]
+        if self._planar:
+            frame = frame.transpose(1, 2, 0)  # still a view
+        frame = np.asarray(frame)
+        if self._sign_shift:
+            # Sign-extend signed values stored in fewer bits than allocated
+            frame = (frame << self._sign_shift) >> self._sign_shift
+        return frame
+
+    def as_array(self, progress=None):
+        if self._planar or self._sign_shift:
+            return super().as_array(progress)
+        return self._mmap  # The mapped file itself, no copy
+
+    def close(self):
+        mmap = getattr(self._mmap, "_mmap", None)
+        self._mmap = None
+        if mmap is not None:
+            mmap.close()
+
+
+class EncapsulatedFrameProvider(FrameProvider):
+    """Compressed frames located via the Basic Offset Table and decoded one at a time."""
+
+    def __init__(self, ds, frame_fragments, source, num_frames, frame_shape, dtype):
+        super().__init__(num_frames, frame_shape, dtype)
+        self._template = make_frame_template(ds)
+        self._frame_fragments = frame_fragments
+        self._source = source
+        self._lock = threading.Lock()
+        self._file = None
+        self._last = (None, None)  # Most recently decoded (index, frame)
+
+    def read_frame_bytes(self, index):
+        """Return the still-encoded bytes of one frame."""
+        fragments = self._frame_fragments[index]
+        if isinstance(self._source, (bytes, bytearray, memoryview)):
+            return b"".join(bytes(self._source[start:start + length]) for start, length in fragments)
+        with self._lock:
+            if self._file is None:
+                self._file = open(self._source, "rb")
+            chunks = []
+            for start, length in fragments:
+                self._file.seek(start)
+                chunks.append(self._file.read(length))
+        return b"".join(chunks)
+
+    def get_frame(self, index):
+        last_index, last_frame = self._last
+        if last_index == index:
+            return last_frame
+        frame = decode_frame(self._template, self.read_frame_bytes(index))
+        self._last = (index, frame)
+        return frame
+
+    def __iter__(self):
+        for _, frame in self.iter_decoded():
+            yield frame
+
+    def iter_decoded(self, indices=None, workers=None):
+        """Yield (index, frame) for indices (default: all frames), in order.
+
+        With enough frames and more than one core, frames are decoded in
+        batches on a process pool while earlier ones are being consumed
+        (on a single core the pool only adds overhead, whatever workers says);
+        only a bounded number of batches is in flight at a time. The
+        encoded bytes are read here and shipped to the workers, so they
+        never reopen the file.
+        """
+        indices = range(self.num_frames) if indices is None else list(indices)
+        cpus = os.cpu_count() or 1
+        workers = workers or cpus
+        if cpus < 2 or workers < 2 or len(indices) < PARALLEL_DECODE_THRESHOLD:
+            for index in indices:
+                yield index, self.get_frame(index)
+            return
+
+        batches = (indices[start:start + DECODE_BATCH_SIZE]
+                   for start in range(0, len(indices), DECODE_BATCH_SIZE))
+        executor = ProcessPoolExecutor(max_workers=workers)
+        pending = deque()
+        try:
+            def submit_next():
+                batch = next(batches, None)
+                if batch is not None:
+                    encoded = [self.read_frame_bytes(index) for index in batch]
+                    pending.append((batch, executor.submit(decode_frames, self._template, encoded)))
+
+            for _ in range(workers * DECODE_BATCHES_PER_WORKER):
+                submit_next()
+            while pending:
+                batch, future = pending.popleft()
+                frames = future.result()
+                submit_next()
+                yield from zip(batch, frames)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    @timed("decode.volume")
+    def as_array(self, progress=None, workers=None):
+        """All frames decoded (in parallel where worthwhile) into one preallocated array."""
+        volume = None
+        for done, (index, frame) in enumerate(self.iter_decoded(workers=workers), 1):
+            if volume is None:
+                # Colour conversion can change the sample layout, so size the array from a decoded frame
+                volume = np.empty((self.num_frames,) + frame.shape, dtype=frame.dtype)
+            volume[index] = frame
+            if progress:
+                progress(done, self.num_frames)
+        return volume
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def make_frame_template(ds):
+    """Build a minimal dataset carrying only what is needed to decode one frame."""
+    template = Dataset()
+    template.file_meta = FileMetaDataset()
+    template.file_meta.TransferSyntaxUID = get_transfer_syntax(ds)
+    for keyword in PIXEL_MODULE_KEYWORDS:
+        if keyword in ds:
+            setattr(template, keyword, ds[keyword].value)
+    template.NumberOfFrames = 1
+    return template
+
+
+@timed("decode.frame")
+def decode_frame(template, frame_bytes):
+    """Decode one encapsulated frame using a template from make_frame_template()."""
+    single = Dataset()
+    single.file_meta = template.file_meta
+    single.update(template)
+    single.PixelData = encapsulate([frame_bytes])
+    single["PixelData"].VR = "OB"
+    return single.pixel_array
+
+
+def decode_frames(template, encoded_frames):
+    """Decode a batch of encoded frames (runs in pool worker processes)."""
+    return [decode_frame(template, frame_bytes) for frame_bytes in encoded_frames]
+
+
+def parse_encapsulated_items(fp, start):
+    """Read the item headers of an encapsulated PixelData value.
+
+    Returns (basic_offsets, fragments) where fragments is a list of
+    (item_offset, data_position, length); item_offset is relative to the
+    first fragment as the Basic Offset Table expects. Only headers are
+    read, the fragment data is skipped with seek().
+    """
+    fp.seek(start)
+    header = fp.read(8)
+    if len(header) < 8:
+        raise ValueError("Truncated encapsulated PixelData")
+    group, element, length = struct.unpack("<HHL", header)
+    if Tag(group, element) != ITEM_TAG:
+        raise ValueError("Encapsulated PixelData does not start with the Basic Offset Table")
+    basic_offsets = list(struct.unpack(f"<{length // 4}L", fp.read(length))) if length else []
+
+    fragments = []
+    first_fragment = fp.tell()
+    while True:
+        item_start = fp.tell()
+        header = fp.read(8)
+        if len(header) < 8:
+            break
+        group, element, length = struct.unpack("<HHL", header)
+        tag = Tag(group, element)
+        if tag == SEQUENCE_DELIMITER_TAG:
+            break
+        if tag != ITEM_TAG:
+            raise ValueError(f"Unexpected tag {tag} in encapsulated PixelData")
+        fragments.append((item_start - first_fragment, item_start + 8, length))
+        fp.seek(length, os.SEEK_CUR)
+    return basic_offsets, fragments
+
+
+def group_fragments(basic_offsets, fragments, num_frames):
+    """Assign fragments to frames. Returns None if the split is ambiguous."""
+    if basic_offsets and len(basic_offsets) == num_frames:
+        bounds = list(basic_offsets) + [float("inf")]
+        frames = [[] for _ in range(num_frames)]
+        frame = 0
+        for item_offset, position, length in fragments:
+            while item_offset >= bounds[frame + 1]:
+                frame += 1
+            frames[frame].append((position, length))
+        return frames
+    if num_frames == 1:
+        return [[(position, length) for _, position, length in fragments]]
+    if len(fragments) == num_frames:
+        return [[(position, length)] for _, position, length in fragments]
+    return None
+
+
+def get_extended_offsets(ds):
+    """Return the Extended Offset Table as a list, or [] if absent."""
+    if EXTENDED_OFFSET_TABLE_TAG not in ds:
+        return []
+    table = ds[EXTENDED_OFFSET_TABLE_TAG].value
+    return list(struct.unpack(f"<{len(table) // 8}Q", table)) if table else []
+
+
+def get_pixel_dtype(ds, transfer_syntax):
+    """Numpy dtype of the stored pixel values, or None if not memory-mappable."""
+    bits_allocated = int(ds.BitsAllocated)
+    if bits_allocated not in (8, 16, 32, 64):
+        return None
+    kind = "i" if int(ds.get("PixelRepresentation", 0)) == 1 else "u"
+    byteorder = ">" if transfer_syntax == BIG_ENDIAN_TRANSFER_SYNTAX else "<"
+    return np.dtype(f"{byteorder}{kind}{bits_allocated // 8}")
+
+
+def get_frame_shape(ds):
+    rows, columns = int(ds.Rows), int(ds.Columns)
+    samples = int(ds.get("SamplesPerPixel", 1) or 1)
+    return (rows, columns, samples) if samples > 1 else (rows, columns)
+
+
+def get_frame_provider(ds):
+    """Return the cheapest FrameProvider that can serve ds frame by frame."""
+    num_frames = int(ds.get("NumberOfFrames", 1) or 1)
+    frame_shape = get_frame_shape(ds)
+    transfer_syntax = get_transfer_syntax(ds)
+    filename = getattr(ds, "filename", None)
+    element = get_pixel_data_element(ds)
+    deferred = element is not None and getattr(element, "value", None) is None
+
+    if transfer_syntax in NATIVE_TRANSFER_SYNTAXES:
+        dtype = get_pixel_dtype(ds, transfer_syntax)
+        photometric = str(ds.get("PhotometricInterpretation", ""))
+        mappable = (
+            dtype is not None
+            and deferred
+            and isinstance(filename, str)
+            and transfer_syntax != "1.2.840.10008.1.2.1.99"
+            and not photometric.startswith("YBR")
+            and "FloatPixelData" not in ds
+            and "DoubleFloatPixelData" not in ds
+        )
+        if mappable:
+            needed = num_frames * int(np.prod(frame_shape)) * dtype.itemsize
+            if element.length >= needed:
+                sign_shift = 0
+                bits_stored = int(ds.get("BitsStored", ds.BitsAllocated))
+                if dtype.kind == "i" and bits_stored < int(ds.BitsAllocated):
+                    sign_shift = int(ds.BitsAllocated) - bits_stored
+                planar = int(ds.get("PlanarConfiguration", 0) or 0) == 1
+                return MemmapFrameProvider(ds, element.value_tell, num_frames, frame_shape,
+                                           dtype, planar, sign_shift)
+    elif transfer_syntax and element is not None:
+        try:
+            if deferred and isinstance(filename, str):
+                with open(filename, "rb") as fp:
+                    basic_offsets, fragments = parse_encapsulated_items(fp, element.value_tell)
+                source = filename
+            else:
+                source = ds.PixelData
+                basic_offsets, fragments = parse_encapsulated_items(io.BytesIO(source), 0)
+            basic_offsets = basic_offsets or get_extended_offsets(ds)
+            frame_fragments = group_fragments(basic_offsets, fragments, num_frames)
+        except (ValueError, struct.error, OSError):
+            frame_fragments = None
+        if frame_fragments is not None:
+            dtype = get_pixel_dtype(ds, "") or np.dtype("u1")
+            return EncapsulatedFrameProvider(ds, frame_fragments, source, num_frames,
+                                             frame_shape, dtype)
+
+    # Anything else (1-bit data, YBR colour, in-memory datasets, ambiguous
+    # fragment layouts) falls back to a single decode on first access
+    dtype = get_pixel_dtype(ds, transfer_syntax) or np.dtype("u1")
+    return ArrayFrameProvider(lambda: ds.pixel_array, num_frames, frame_shape, dtype)
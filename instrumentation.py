@@ -0,0 +1,236 @@
+"""Optional timing and metrics for the viewer's hot paths.
+
+Instrumented code wraps its work in ``span(name)`` or decorates a
+function with ``@timed(name)``. While profiling is off a span is a
+shared do-nothing object and a timed function costs one attribute check,
+so the hooks stay in the hot paths permanently. While it is on, every
+span updates per-name statistics (count, total, recent percentiles) and
+is appended to a bounded trace that can be exported in Chrome trace
+format (chrome://tracing, https://ui.perfetto.dev) or written out as a
+text log.
+
+Profiling is turned on with the DICOM_READER_PROFILE=1 environment
+variable, the viewer's Profiling toggle (F12), or enable().
+"""
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger("dicom_reader.perf")
+
+# Spans kept for trace export; the oldest are dropped first
+MAX_TRACE_EVENTS = 200_000
+# Durations kept per metric for percentiles
+RECENT_SAMPLES = 500
+# Spans slower than this are logged as they happen
+SLOW_SPAN_SECONDS = 0.25
+
+
+class Metric:
+    """Running statistics of one span name."""
+
+    __slots__ = ("count", "total", "max", "last", "recent")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.last = seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.recent.append(seconds)
+
+    def percentile(self, fraction):
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "total_ms": self.total * 1000,
+            "mean_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "p50_ms": self.percentile(0.5) * 1000,
+            "p95_ms": self.percentile(0.95) * 1000,
+            "max_ms": self.max * 1000,
+            "last_ms": self.last * 1000,
+        }
+
+
+class Span:
+    """Times the enclosed block and reports it to a Recorder."""
+
+    __slots__ = ("recorder", "name", "args", "start")
+
+    def __init__(self, recorder, name, args):
+        self.recorder = recorder
+        self.name = name
+        self.args = args
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.recorder.record(self.name, self.start, time.perf_counter(), self.args)
+        return False
+
+
+class NullSpan:
+    """Stand-in for Span while profiling is off."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Recorder:
+    """Collects spans and notes from every thread of the process."""
+
+    def __init__(self, max_trace_events=MAX_TRACE_EVENTS, slow_seconds=SLOW_SPAN_SECONDS):
+        self.enabled = False
+        self.slow_seconds = slow_seconds
+        self.metrics = {}
+        self.notes = {}  # Latest value of named facts, e.g. the shape of the open volume
+        self.trace = deque(maxlen=max_trace_events)
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def enable(self, enabled=True):
+        self.enabled = bool(enabled)
+        logger.info("Profiling %s", "enabled" if self.enabled else "disabled")
+
+    def reset(self):
+        with self._lock:
+            self.metrics.clear()
+            self.notes.clear()
+            self.trace.clear()
+            self._origin = time.perf_counter()
+
+    def span(self, name, **args):
+        """Context manager timing a block as name (args end up in the trace)."""
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, args)
+
+    def record(self, name, start, end, args=None):
+        seconds = end - start
+        with self._lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = Metric()
+            metric.add(seconds)
+            self.trace.append((name, start, seconds, threading.get_ident(), args or None))
+        if seconds >= self.slow_seconds:
+            logger.warning("Slow %s: %.1f ms %s", name, seconds * 1000, args or "")
+
+    def note(self, name, value):
+        """Record a named value (shown in the overlay and the log)."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.notes[name] = value
+        logger.info("%s: %s", name, value)
+
+    def snapshot(self):
+        """{name: summary dict} of every metric."""
+        with self._lock:
+            return {name: metric.summary() for name, metric in self.metrics.items()}
+
+    def summary_lines(self, limit=None):
+        """Metrics as aligned text lines, most total time first."""
+        metrics = sorted(self.snapshot().items(), key=lambda item: item[1]["total_ms"], reverse=True)
+        lines = [f"{'span':<28} {'count':>7} {'last':>8} {'p50':>8} {'p95':>8} {'max':>8}  (ms)"]
+        for name, m in metrics[:limit]:
+            lines.append(f"{name:<28} {m['count']:>7} {m['last_ms']:>8.1f} {m['p50_ms']:>8.1f} "
+                         f"{m['p95_ms']:>8.1f} {m['max_ms']:>8.1f}")
+        with self._lock:
+            notes = list(self.notes.items())
+        lines.extend(f"{name}: {value}" for name, value in notes)
+        return lines
+
+    def export_trace(self, path):
+        """Write the recorded spans as a Chrome trace (JSON array of complete events)."""
+        with self._lock:
+            spans = list(self.trace)
+            origin = self._origin
+        pid = os.getpid()
+        events = []
+        for name, start, seconds, thread, args in spans:
+            event = {"name": name, "cat": name.split(".", 1)[0], "ph": "X", "pid": pid, "tid": thread,
+                     "ts": (start - origin) * 1e6, "dur": seconds * 1e6}
+            if args:
+                event["args"] = {key: str(value) for key, value in args.items()}
+            events.append(event)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        return len(events)
+
+    def write_log(self, path):
+        """Write the metric summary and notes as text."""
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(time.strftime("%Y-%m-%d %H:%M:%S") + "\n")
+            f.write("\n".join(self.summary_lines()) + "\n")
+
+
+recorder = Recorder()
+
+
+def span(name, **args):
+    """recorder.span() of the process-wide recorder."""
+    if not recorder.enabled:
+        return NULL_SPAN
+    return Span(recorder, name, args)
+
+
+def timed(name=None):
+    """Decorator timing every call of a function as name (default: its qualified name)."""
+    def decorate(func):
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not recorder.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                recorder.record(label, start, time.perf_counter())
+        return wrapper
+    return decorate
+
+
+def note(name, value):
+    recorder.note(name, value)
+
+
+def enable(enabled=True):
+    recorder.enable(enabled)
+
+
+def is_enabled():
+    return recorder.enabled
+
+
+if os.environ.get("DICOM_READER_PROFILE", "").strip() not in ("", "0"):
+    recorder.enabled = True
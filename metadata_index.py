@@ -0,0 +1,339 @@
+"""Persistent on-disk metadata index for browsing large DICOM archives.
+
+Parsed header elements are stored in a local SQLite database keyed by
+file path, modification time and size. Updating a folder only re-parses
+files that are new or have changed since the last run and drops entries
+for files that have disappeared, so reopening or searching a large
+archive reads the index instead of every header.
+
+Usage:
+    python metadata_index.py FOLDER [--db PATH] [--workers N]
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pydicom
+from pydicom.errors import InvalidDicomError
+from pydicom.multival import MultiValue
+from pydicom.tag import Tag
+
+from frame_provider import iter_header_elements
+from series_index import INDEX_TAGS, PROCESS_POOL_THRESHOLD, IndexedFile, iter_files
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.expanduser("~"), ".dicom_reader", "metadata_index.sqlite")
+
+# Longest value text stored per element; longer values are truncated
+MAX_VALUE_LENGTH = 1024
+
+# Rows fetched per batch by iter_elements
+ITER_BATCH_ROWS = 10_000
+
+# VRs whose values are raw bytes and are stored only as a size summary
+BINARY_VRS = {"OB", "OD", "OF", "OL", "OV", "OW", "UN"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    is_dicom INTEGER NOT NULL,
+    header TEXT,
+    indexed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS elements (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    tag INTEGER NOT NULL,
+    keyword TEXT,
+    name TEXT,
+    vr TEXT,
+    value TEXT,
+    PRIMARY KEY (file_id, tag)
+) WITHOUT ROWID;
+"""
+
+
+def element_value_text(element):
+    """Text of an element's value as shown in the metadata views."""
+    if element.VR in BINARY_VRS:
+        length = len(element.value) if element.value is not None else 0
+        return f"<binary data, {length} bytes>"
+    text = str(element.value)
+    if len(text) > MAX_VALUE_LENGTH:
+        text = text[:MAX_VALUE_LENGTH] + "..."
+    return text
+
+
+def json_value(value):
+    """Convert an element value to something json.dumps accepts."""
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, (list, tuple, MultiValue)):
+        return [json_value(v) for v in value]
+    return str(value)
+
+
+def dataset_record(path, mtime, size, ds):
+    """Plain-data record (path, mtime, size, header, elements) for a parsed dataset."""
+    header = {keyword: json_value(ds[keyword].value) for keyword in INDEX_TAGS if keyword in ds}
+    elements = [
+        (int(element.tag), element.keyword, element.name, element.VR, element_value_text(element))
+        for element in iter_header_elements(ds)
+    ]
+    return path, mtime, size, header, elements
+
+
+def parse_file(path, mtime, size):
+    """Parse one header. Runs in a worker; returns a plain-data record."""
+    try:
+        ds = pydicom.dcmread(path, stop_before_pixels=True)
+    except (InvalidDicomError, OSError, ValueError, EOFError):
+        return path, mtime, size, None, []
+    return dataset_record(path, mtime, size, ds)
+
+
+def parse_file_args(args):
+    return parse_file(*args)
+
+
+class IndexedElement:
+    """A stored element with the attributes the metadata views use."""
+
+    def __init__(self, tag, keyword, name, vr, value):
+        self.tag = Tag(tag)
+        self.keyword = keyword
+        self.name = name
+        self.VR = vr
+        self.value = value
+
+
+class UpdateStats:
+    def __init__(self):
+        self.added = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.removed = 0
+        self.seconds = 0.0
+
+    def __str__(self):
+        return (f"{self.added} added, {self.updated} updated, {self.unchanged} unchanged, "
+                f"{self.removed} removed in {self.seconds:.1f}s")
+
+
+class MetadataIndex:
+    """SQLite-backed index of parsed DICOM headers."""
+
+    def __init__(self, db_path=DEFAULT_INDEX_PATH):
+        self.db_path = db_path
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def _stat(path):
+        stat = os.stat(path)
+        return stat.st_mtime, stat.st_size
+
+    def is_current(self, path):
+        """True if path is indexed and unchanged on disk."""
+        path = os.path.abspath(path)
+        try:
+            mtime, size = self._stat(path)
+        except OSError:
+            return False
+        with self._lock:
+            row = self._conn.execute("SELECT mtime, size FROM files WHERE path = ?", (path,)).fetchone()
+        return row is not None and row[0] == mtime and row[1] == size
+
+    def _store(self, records):
+        """Insert or replace parsed records in one transaction."""
+        now = time.time()
+        with self._lock, self._conn:
+            for path, mtime, size, header, elements in records:
+                self._conn.execute("DELETE FROM files WHERE path = ?", (path,))
+                cursor = self._conn.execute(
+                    "INSERT INTO files (path, mtime, size, is_dicom, header, indexed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (path, mtime, size, header is not None, json.dumps(header) if header is not None else None, now))
+                file_id = cursor.lastrowid
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO elements (file_id, tag, keyword, name, vr, value) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(file_id,) + element for element in elements])
+
+    def add_dataset(self, path, ds):
+        """Index an already-parsed dataset (e.g. the file just opened in the viewer)."""
+        path = os.path.abspath(path)
+        mtime, size = self._stat(path)
+        self._store([dataset_record(path, mtime, size, ds)])
+
+    def update_file(self, path):
+        """Re-parse path if it is new or has changed. Returns True if it was parsed."""
+        path = os.path.abspath(path)
+        if self.is_current(path):
+            return False
+        mtime, size = self._stat(path)
+        self._store([parse_file(path, mtime, size)])
+        return True
+
+    def update_folder(self, folder, workers=None, progress=None, batch_size=500):
+        """Bring the index up to date with every file under folder.
+
+        progress, if given, is called with (done, total) as changed files
+        are parsed.
+        """
+        started = time.perf_counter()
+        stats = UpdateStats()
+        folder = os.path.abspath(folder)
+        prefix = folder.rstrip(os.sep) + os.sep
+
+        with self._lock:
+            known = {
+                path: (mtime, size)
+                for path, mtime, size in self._conn.execute(
+                    "SELECT path, mtime, size FROM files WHERE substr(path, 1, ?) = ?",
+                    (len(prefix), prefix))
+            }
+
+        changed = []
+        seen = set()
+        for path in iter_files(folder):
+            try:
+                mtime, size = self._stat(path)
+            except OSError:
+                continue
+            seen.add(path)
+            previous = known.get(path)
+            if previous == (mtime, size):
+                stats.unchanged += 1
+                continue
+            if previous is None:
+                stats.added += 1
+            else:
+                stats.updated += 1
+            changed.append((path, mtime, size))
+
+        removed = [path for path in known if path not in seen]
+        if removed:
+            with self._lock, self._conn:
+                self._conn.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in removed])
+            stats.removed = len(removed)
+
+        if changed:
+            cpus = os.cpu_count() or 1
+            if len(changed) >= PROCESS_POOL_THRESHOLD and cpus > 1:
+                executor = ProcessPoolExecutor(max_workers=workers or cpus)
+            else:
+                executor = ThreadPoolExecutor(max_workers=workers or min(32, cpus * 4))
+            with executor:
+                batch = []
+                done = 0
+                for record in executor.map(parse_file_args, changed, chunksize=32):
+                    batch.append(record)
+                    done += 1
+                    if len(batch) >= batch_size:
+                        self._store(batch)
+                        batch = []
+                    if progress:
+                        progress(done, len(changed))
+                if batch:
+                    self._store(batch)
+
+        stats.seconds = time.perf_counter() - started
+        return stats
+
+    def indexed_files(self, folder=None):
+        """IndexedFile entries for every indexed image under folder (or everywhere)."""
+        query = "SELECT path, header FROM files WHERE is_dicom = 1"
+        params = ()
+        if folder is not None:
+            prefix = os.path.abspath(folder).rstrip(os.sep) + os.sep
+            query += " AND substr(path, 1, ?) = ?"
+            params = (len(prefix), prefix)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        entries = []
+        for path, header in rows:
+            header = json.loads(header)
+            if "Rows" in header:
+                entries.append(IndexedFile(path, header))
+        return entries
+
+    def get_elements(self, path):
+        """Stored elements of one file in tag order (empty if not indexed)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT e.tag, e.keyword, e.name, e.vr, e.value FROM elements e "
+                "JOIN files f ON f.id = e.file_id WHERE f.path = ? ORDER BY e.tag",
+                (os.path.abspath(path),)).fetchall()
+        return [IndexedElement(*row) for row in rows]
+
+    def iter_elements(self, folder=None):
+        """Yield (path, tag, keyword, name, vr, value) for every stored element.
+
+        Rows come grouped by path (in tag order within a file) and are
+        fetched in batches, so the index is never loaded into memory whole.
+        """
+        query = ("SELECT f.path, e.tag, e.keyword, e.name, e.vr, e.value FROM elements e "
+                 "JOIN files f ON f.id = e.file_id")
+        params = ()
+        if folder is not None:
+            prefix = os.path.abspath(folder).rstrip(os.sep) + os.sep
+            query += " WHERE substr(f.path, 1, ?) = ?"
+            params = (len(prefix), prefix)
+        query += " ORDER BY f.path, e.tag"
+        with self._lock:
+            cursor = self._conn.execute(query, params)
+        try:
+            while True:
+                with self._lock:
+                    rows = cursor.fetchmany(ITER_BATCH_ROWS)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cursor.close()
+
+    def file_count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM files WHERE is_dicom = 1").fetchone()[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or update the DICOM metadata index for a folder.")
+    parser.add_argument("folder", help="Folder to index")
+    parser.add_argument("--db", default=DEFAULT_INDEX_PATH, help="Index database path")
+    parser.add_argument("--workers", type=int, default=None, help="Number of parser workers")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.folder):
+        parser.error(f"Folder not found: {args.folder}")
+
+    with MetadataIndex(args.db) as index:
+        stats = index.update_folder(args.folder, args.workers)
+        print(stats)
+        print(f"{index.file_count()} DICOM files in {args.db}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""Lazily expanded tree view of a DICOM header.
+
+Only the rows that are visible are ever formatted: sequence items and
+their elements are inserted when a node is opened and deleted again when
+it is closed, and long child lists are inserted one page at a time
+behind a "more" row. RT Structure Sets or enhanced multi-frame
+functional group sequences therefore cost a few hundred rows, not
+megabytes of text.
+"""
+import tkinter as tk
+from tkinter import ttk
+
+from instrumentation import timed
+from metadata_view import format_value
+
+# Children inserted per page; a "more" row loads the next page
+PAGE_SIZE = 200
+
+# Longest value text shown in the value column
+MAX_VALUE_CHARS = 256
+
+
+def element_row(element):
+    """(text, vr, value) columns of one element's row."""
+    tag = element.tag
+    text = f"({tag.group:04X},{tag.element:04X}) {element.name}"
+    if element.VR == "SQ":
+        count = len(element.value)
+        return text, "SQ", f"<{count} item{'s' if count != 1 else ''}>"
+    value = format_value(element).replace("\n", " ")
+    if len(value) > MAX_VALUE_CHARS:
+        value = value[:MAX_VALUE_CHARS] + "..."
+    return text, element.VR, value
+
+
+class MetadataTree(ttk.Frame):
+    """A ttk.Treeview of a header whose sequences are expanded on demand."""
+
+    def __init__(self, master, **kwargs):
+        super().__init__(master, **kwargs)
+        self.tree = ttk.Treeview(self, columns=("vr", "value"), selectmode="browse")
+        self.tree.heading("#0", text="Tag / Name")
+        self.tree.heading("vr", text="VR")
+        self.tree.heading("value", text="Value")
+        self.tree.column("#0", width=320, stretch=False)
+        self.tree.column("vr", width=40, stretch=False, anchor=tk.CENTER)
+        self.tree.column("value", width=480)
+
+        scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self.tree.bind("<<TreeviewOpen>>", self._on_open)
+        self.tree.bind("<<TreeviewClose>>", self._on_close)
+        self.tree.bind("<<TreeviewSelect>>", self._on_select)
+
+        self.view = None
+        self._nodes = {}  # iid -> ("elements", tags, dataset or tag -> element) or ("sequence", element)
+        self._more = {}   # iid of a "more" row -> (parent iid, next start)
+
+    def show(self, view):
+        """Show the header held by a MetadataView (top-level rows only)."""
+        if view is self.view:
+            return
+        self.clear()
+        self.view = view
+        self._nodes[""] = ("elements", list(view.elements), view.elements)
+        self._add_page("", 0)
+
+    def clear(self):
+        self.tree.delete(*self.tree.get_children())
+        self.view = None
+        self._nodes.clear()
+        self._more.clear()
+
+    def _add_row(self, parent, text, values, node=None):
+        iid = self.tree.insert(parent, tk.END, text=text, values=values)
+        if node is not None:
+            self._nodes[iid] = node
+            # A placeholder child makes the row expandable without building its children
+            self.tree.insert(iid, tk.END, text="", tags=("placeholder",))
+        return iid
+
+    @timed("metadata.tree_page")
+    def _add_page(self, parent, start):
+        """Insert children start .. start + PAGE_SIZE of a node, and a "more" row if needed."""
+        node = self._nodes[parent]
+        if node[0] == "elements":
+            _, tags, ds = node
+            total = len(tags)
+            for tag in tags[start:start + PAGE_SIZE]:
+                element = ds[tag]
+                text, vr, value = element_row(element)
+                child = ("sequence", element) if vr == "SQ" and len(element.value) else None
+                self._add_row(parent, text, (vr, value), child)
+        else:
+            sequence = node[1].value
+            total = len(sequence)
+            for index in range(start, min(start + PAGE_SIZE, total)):
+                item = sequence[index]
+                child = ("elements", list(item.keys()), item) if len(item) else None
+                self._add_row(parent, f"Item {index + 1}", ("", f"<{len(item)} elements>"), child)
+
+        stop = start + PAGE_SIZE
+        if stop < total:
+            iid = self.tree.insert(parent, tk.END, text=f"... {total - stop} more (select to load)",
+                                   tags=("more",))
+            self._more[iid] = (parent, stop)
+
+    def _forget(self, iid):
+        """Drop the bookkeeping of every descendant of iid."""
+        for child in self.tree.get_children(iid):
+            self._nodes.pop(child, None)
+            self._more.pop(child, None)
+            self._forget(child)
+
+    def _on_open(self, event):
+        iid = self.tree.focus()
+        children = self.tree.get_children(iid)
+        if len(children) == 1 and self.tree.tag_has("placeholder", children[0]):
+            self.tree.delete(children[0])
+            self._add_page(iid, 0)
+
+    def _on_close(self, event):
+        # Closed subtrees are discarded so memory follows what is on screen
+        iid = self.tree.focus()
+        if iid in self._nodes:
+            self._forget(iid)
+            self.tree.delete(*self.tree.get_children(iid))
+            self.tree.insert(iid, tk.END, text="", tags=("placeholder",))
+
+    def _on_select(self, event):
+        for iid in self.tree.selection():
+            if iid in self._more:
+                parent, start = self._more.pop(iid)
+                self.tree.delete(iid)
+                self._add_page(parent, start)
@@ -0,0 +1,237 @@
+"""Metadata view-model: the header of one dataset, prepared for display.
+
+Built once per loaded dataset, it holds the name -> tag and
+group -> elements lookups the metadata panel needs, and formats each
+element at most once (dates and times by VR, binary values as a size
+summary). Switching groups, picking a name or showing search results
+then only joins cached lines into one text for a single insert.
+"""
+from datetime import datetime
+
+from frame_provider import iter_header_elements
+from instrumentation import timed
+from metadata_index import BINARY_VRS
+
+# Tags shown by each group button, in display order
+GROUP_TAGS = {
+    "Study Information": [
+        (0x8, 0x5),
+        (0x8, 0x8),
+        (0x8, 0x12),
+        (0x8, 0x13),
+        (0x8, 0x16),
+        (0x8, 0x18),
+        (0x8, 0x20),
+        (0x8, 0x22),
+        (0x8, 0x23),
+        (0x8, 0x30),
+        (0x8, 0x32),
+        (0x8, 0x33),
+        (0x8, 0x60),
+        (0x8, 0x1030),
+        (0x8, 0x1032),
+        (0x8, 0x103e),
+        (0x8, 0x1111),
+    ],
+    "Series Information": [
+        (0x20, 0xd),
+        (0x20, 0xe),
+        (0x20, 0x11),
+        (0x20, 0x13),
+        (0x20, 0x32),
+        (0x20, 0x37),
+        (0x20, 0x52),
+        (0x20, 0x1041),
+        (0x20, 0x4000),
+    ],
+    "Patient Information": [
+        (0x0010, 0x0010),  # Patient's Name
+        (0x0010, 0x0020),  # Patient ID
+        (0x0010, 0x0030),  # Patient Birth Date
+        (0x0010, 0x0040),  # Patient Sex
+        (0x10, 0x1010),
+    ],
+    "Image Acquisition Parameters": [
+        (0x18, 0x10),
+        (0x18, 0x22),
+        (0x18, 0x50),
+        (0x18, 0x60),
+        (0x18, 0x88),
+        (0x18, 0x90),
+        (0x18, 0x1030),
+        (0x18, 0x1100),
+        (0x18, 0x1120),
+        (0x18, 0x1130),
+        (0x18, 0x1140),
+        (0x18, 0x1151),
+        (0x18, 0x1152),
+        (0x18, 0x1160),
+        (0x18, 0x1210),
+        (0x18, 0x5100),
+    ],
+    "Equipment Information": [
+        (0x0008, 0x0070),  # Manufacturer
+        (0x0018, 0x1000),  # Device Serial Number
+    ],
+    "Image Information": [
+        (0x0008, 0x0060),  # Modality
+        (0x0020, 0x0032),  # Image Position (Patient)
+        (0x0020, 0x0037),  # Image Orientation (Patient)
+        (0x0028, 0x0030),  # Pixel Spacing
+        (0x0028, 0x0100),  # Bits Allocated
+        (0x0028, 0x0101),  # Bits Stored
+        (0x0028, 0x0102),  # High Bit
+        (0x0028, 0x1050),  # Window Center
+        (0x0028, 0x1051),  # Window Width
+        (0x0028, 0x1052),  # Rescale Intercept
+        (0x0028, 0x1053),  # Rescale Slope
+        (0x0018, 0x0050),  # Slice Thickness
+    ],
+    "Sensitive Data": [
+    #"Clean Pixel Data"
+        # Tags that may contain pixel data with identification information
+        (0x0008, 0x0008),  # Image Type
+        (0x0052, 0x0006),  # Procedure Code Sequence
+    #"Clean Recognizable Visual Features"
+        # Tags that may lead to visual identification of individuals
+        (0x0010, 0x0010),  # Patient's Name
+        (0x0010, 0x0020),  # Patient ID
+        (0x0010, 0x0030),  # Patient Birth Date
+        (0x0010, 0x0040),  # Patient Sex
+        (0x0008, 0x0020),  # Study Date
+        (0x0008, 0x0030),  # Study Time
+        (0x0008, 0x0090),  # Referring Physician Name
+        (0x0008, 0x0050),  # Accession Number
+        (0x0010, 0x0024),  # Medical Record Number
+    #"Clean Graphics"
+        # Tags that may contain identification information encoded as graphics or text annotations
+        (0x0008, 0x0070),  # Manufacturer
+        (0x0018, 0x1000),  # Device Serial Number
+    #"Clean Structured Content"
+        # Tags that may contain structured report information
+        (0x0054, 0x0220),  # View Position
+        (0x0054, 0x0222),  # View Position Modifier
+    #"Clean Descriptors"
+        # Tags that contain descriptive information which may include sensitive data
+        (0x0008, 0x1030),  # Study Description
+        (0x0020, 0x4000),  # Image Comments
+    ],
+}
+
+# Pseudo-group listing every header element
+ALL_GROUP = "All"
+
+
+def format_dicom_date(date_str):
+    """Format DICOM date strings to YYYY-MM-DD format"""
+    if not date_str or not isinstance(date_str, str):
+        return date_str
+    try:
+        # Remove any dots or separators
+        date_str = date_str.replace('.', '').replace('-', '')
+        # Handle YYYYMMDD format
+        if len(date_str) == 8:
+            return datetime.strptime(date_str, "%Y%m%d").strftime("%Y-%m-%d")
+        return date_str
+    except ValueError:
+        return date_str
+
+
+def format_dicom_time(time_str):
+    """Format DICOM time strings to HH:MM:SS format"""
+    if not time_str or not isinstance(time_str, str):
+        return time_str
+    try:
+        # Remove any trailing fractional seconds and separators
+        time_str = time_str.split('.')[0].replace(':', '')
+        # Handle HHMMSS format
+        if len(time_str) == 6:
+            return datetime.strptime(time_str, "%H%M%S").strftime("%H:%M:%S")
+        return time_str
+    except ValueError:
+        return time_str
+
+
+def format_value(element):
+    """Display text of an element's value, chosen by its VR."""
+    vr = element.VR
+    if vr == "DA":
+        return format_dicom_date(str(element.value))
+    if vr == "TM":
+        return format_dicom_time(str(element.value))
+    if vr in BINARY_VRS:
+        length = len(element.value) if element.value is not None else 0
+        return f"<binary data, {length} bytes>"
+    return str(element.value)
+
+
+def format_element(element):
+    """One metadata panel line: (group, element) name: value."""
+    tag = element.tag
+    return f"({hex(tag.group)}, {hex(tag.element)}) {element.name}: {format_value(element)}\n"
+
+
+class MetadataView:
+    """Lookups and cached display lines for the header of one dataset."""
+
+    def __init__(self, ds):
+        self.ds = ds
+        self.elements = {}  # tag -> element, in file order
+        self.tags_by_name = {}  # name -> tags (private elements share names)
+        for element in iter_header_elements(ds):
+            tag = int(element.tag)
+            self.elements[tag] = element
+            self.tags_by_name.setdefault(element.name, []).append(tag)
+        self.names = sorted(self.tags_by_name)
+        self.groups = {
+            name: [tag for tag in (int((group << 16) | elem) for group, elem in tags) if tag in self.elements]
+            for name, tags in GROUP_TAGS.items()
+        }
+        self.groups[ALL_GROUP] = list(self.elements)
+        self._lines = {}
+        self._group_texts = {}
+        self._haystacks = None
+
+    def line(self, tag):
+        """Formatted line of one element (formatted on first use)."""
+        line = self._lines.get(tag)
+        if line is None:
+            line = self._lines[tag] = format_element(self.elements[tag])
+        return line
+
+    @timed("metadata.text")
+    def text(self, tags):
+        """Lines of the given tags (those present in the dataset) as one string."""
+        return "".join(self.line(int(tag)) for tag in tags if int(tag) in self.elements)
+
+    def group_elements(self, group_name):
+        """Elements of a group in display order, or None for an unknown group."""
+        tags = self.groups.get(group_name)
+        return None if tags is None else [self.elements[tag] for tag in tags]
+
+    @timed("metadata.group_text")
+    def group_text(self, group_name):
+        """Text of a whole group, or None for an unknown group."""
+        text = self._group_texts.get(group_name)
+        if text is None:
+            tags = self.groups.get(group_name)
+            if tags is None:
+                return None
+            text = self._group_texts[group_name] = self.text(tags)
+        return text
+
+    def name_text(self, name):
+        """Lines of the elements with the given name ('' if absent)."""
+        return self.text(self.tags_by_name.get(name, ()))
+
+    def find(self, text):
+        """Tags whose name, value or displayed value contains text (case-insensitive)."""
+        if self._haystacks is None:
+            # Lower-cased once per dataset, so repeated searches are plain substring scans
+            self._haystacks = []
+            for tag, element in self.elements.items():
+                value = "" if element.VR in BINARY_VRS else str(element.value)
+                self._haystacks.append(
+                    (tag, "\n".join((element.name, value, format_value(element))).lower()))
+        needle = text.lower()
+        return [tag for tag, haystack in self._haystacks if needle in haystack]
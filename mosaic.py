@@ -0,0 +1,102 @@
+"""Downsampled mosaic (contact sheet) of all frames in a volume.
+
+Instead of one Axes and one full-resolution imshow per slice, every
+slice is reduced to a small thumbnail with vectorized block averaging
+and written into its tile of a single preallocated mosaic array, which
+is then shown with one imshow.
+"""
+import numpy as np
+
+DEFAULT_TILE_SIZE = 128
+
+
+def downsample(frame, factor):
+    """Block-average a (rows, cols[, samples]) frame by an integer factor."""
+    if factor <= 1:
+        return frame.astype(np.float32)
+    rows = frame.shape[0] // factor * factor
+    cols = frame.shape[1] // factor * factor
+    cropped = frame[:rows, :cols]
+    blocks = cropped.reshape((rows // factor, factor, cols // factor, factor) + frame.shape[2:])
+    return blocks.mean(axis=(1, 3), dtype=np.float32)
+
+
+def normalize(thumbnail):
+    """Scale a thumbnail to 0..1 by its own range, like a per-slice imshow would."""
+    low = thumbnail.min()
+    high = thumbnail.max()
+    if high > low:
+        return (thumbnail - low) / (high - low)
+    return np.zeros_like(thumbnail)
+
+
+class Mosaic:
+    """A grid of per-slice thumbnails tiled into one array.
+
+    The array is allocated up front (blank) and filled tile by tile with
+    fill(), so a viewer can show it immediately and refresh it as tiles
+    arrive.
+    """
+
+    def __init__(self, frames, tile_size=DEFAULT_TILE_SIZE, transform=None):
+        self.frames = frames
+        self.transform = transform  # e.g. a WindowLevel mapping frames to display values
+        self.num_tiles = len(frames)
+        self.cols = int(np.ceil(np.sqrt(self.num_tiles)))
+        self.rows = int(np.ceil(self.num_tiles / self.cols))
+
+        frame_shape = frames.shape[1:]
+        rows, cols = frame_shape[0], frame_shape[1]
+        self.factor = max(1, int(np.ceil(max(rows, cols) / tile_size)))
+        self.tile_height = rows // self.factor
+        self.tile_width = cols // self.factor
+        channels = frame_shape[2:]
+
+        self.array = np.zeros((self.rows * self.tile_height, self.cols * self.tile_width) + channels,
+                              dtype=np.float32)
+        self.filled = 0
+        self._frames_iter = None
+
+    @property
+    def done(self):
+        return self.filled >= self.num_tiles
+
+    def tile_slice(self, index):
+        """Row/column slices of the mosaic array occupied by tile `index`."""
+        row, col = divmod(index, self.cols)
+        return (slice(row * self.tile_height, (row + 1) * self.tile_height),
+                slice(col * self.tile_width, (col + 1) * self.tile_width))
+
+    def fill(self, count=None):
+        """Render the next `count` tiles (all remaining if None). Returns the indices filled."""
+        stop = self.num_tiles if count is None else min(self.num_tiles, self.filled + count)
+        filled = range(self.filled, stop)
+        if self._frames_iter is None:
+            # Tiles are filled in order, so iterate: compressed providers decode ahead in parallel
+            self._frames_iter = iter(self.frames)
+        for index in filled:
+            frame = np.asarray(next(self._frames_iter))
+            if self.transform is not None:
+                frame = self.transform(frame)
+            thumbnail = downsample(frame, self.factor)
+            if np.issubdtype(frame.dtype, np.integer) and (self.transform is not None or frame.ndim == 3):
+                # Display values and colour tiles keep their absolute scale;
+                # raw grayscale is stretched per slice
+                thumbnail /= np.iinfo(frame.dtype).max
+            else:
+                thumbnail = normalize(thumbnail)
+            rows, cols = self.tile_slice(index)
+            self.array[rows, cols] = thumbnail
+        self.filled = stop
+        return filled
+
+    def index_at(self, x, y):
+        """Slice index under mosaic pixel coordinates (x, y), or None."""
+        if x is None or y is None or x < 0 or y < 0:
+            return None
+        col = int(x) // self.tile_width
+        row = int(y) // self.tile_height
+        if col >= self.cols or row >= self.rows:
+            return None
+        index = row * self.cols + col
+        return index if index < self.num_tiles else None
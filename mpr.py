@@ -0,0 +1,110 @@
+"""Multiplanar reconstruction (axial / coronal / sagittal) of a slice volume.
+
+All three planes are strided views of one (slices, rows, columns)
+array; for uncompressed multi-frame files that array is the memory-mapped
+PixelData itself, so nothing is duplicated. Each displayed plane is
+resampled to isotropic pixels with precomputed index arrays, which only
+costs the size of the plane being shown.
+"""
+import numpy as np
+
+PLANES = ("axial", "coronal", "sagittal")
+
+
+def first_float(value):
+    try:
+        value = float(value[0] if hasattr(value, "__len__") and not isinstance(value, str) else value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    return value if value > 0 else None
+
+
+def volume_spacing(ds, slice_spacing=None):
+    """(slice, row, column) spacing in mm from the header (1.0 where unknown).
+
+    The slice spacing is the measured distance between slice centres when
+    given, otherwise Spacing Between Slices, otherwise Slice Thickness.
+    """
+    row_spacing = column_spacing = None
+    pixel_spacing = ds.get("PixelSpacing")
+    if pixel_spacing is not None and len(pixel_spacing) == 2:
+        row_spacing = first_float(pixel_spacing[0])
+        column_spacing = first_float(pixel_spacing[1])
+    slice_spacing = (slice_spacing
+                     or first_float(ds.get("SpacingBetweenSlices"))
+                     or first_float(ds.get("SliceThickness")))
+    return (slice_spacing or 1.0, row_spacing or 1.0, column_spacing or 1.0)
+
+
+def resample_indices(count, spacing, target):
+    """Nearest source index for each output pixel when stretching count samples to target spacing."""
+    if abs(spacing - target) < 1e-6:
+        return None  # Already at the target spacing
+    output = max(1, int(round(count * spacing / target)))
+    positions = (np.arange(output) + 0.5) * target / spacing - 0.5
+    return np.clip(np.rint(positions), 0, count - 1).astype(np.intp)
+
+
+class MPRVolume:
+    """Axial, coronal and sagittal planes of a (slices, rows, columns) volume."""
+
+    def __init__(self, volume, spacing):
+        if volume.ndim != 3:
+            raise ValueError("MPR needs a grayscale volume of shape (slices, rows, columns)")
+        self.volume = volume
+        self.spacing = tuple(float(s) for s in spacing)
+        self.target_spacing = min(self.spacing)
+        nz, ny, nx = volume.shape
+        dz, dy, dx = self.spacing
+        target = self.target_spacing
+        self._z = resample_indices(nz, dz, target)
+        self._y = resample_indices(ny, dy, target)
+        self._x = resample_indices(nx, dx, target)
+        # Slices are stored from the first to the last position; show the last at the top
+        self._z_display = (self._z if self._z is not None else np.arange(nz))[::-1]
+
+    def num_slices(self, plane):
+        return self.volume.shape[PLANES.index(plane)]
+
+    def axis_indices(self, plane):
+        """(row indices, column indices) mapping displayed pixels to volume indices."""
+        nz, ny, nx = self.volume.shape
+        y = self._y if self._y is not None else np.arange(ny)
+        x = self._x if self._x is not None else np.arange(nx)
+        if plane == "axial":
+            return y, x
+        if plane == "coronal":
+            return self._z_display, x
+        return self._z_display, y
+
+    def plane(self, plane, index):
+        """One isotropic slice through the volume.
+
+        The slice itself is a view; resampling (where the spacing is not
+        already isotropic) produces only the 2-D output.
+        """
+        if plane == "axial":
+            view = self.volume[index]
+            rows, columns = self._y, self._x
+        elif plane == "coronal":
+            view = self.volume[:, index, :]
+            rows, columns = self._z_display, self._x
+        else:
+            view = self.volume[:, :, index]
+            rows, columns = self._z_display, self._y
+        if rows is not None:
+            view = view.take(rows, axis=0)
+        if columns is not None:
+            view = view.take(columns, axis=1)
+        return view
+
+    def locate(self, plane, row, column):
+        """Volume (z, y, x) of a displayed pixel in plane; the plane's own axis is None."""
+        rows, columns = self.axis_indices(plane)
+        r = int(rows[min(max(row, 0), len(rows) - 1)])
+        c = int(columns[min(max(column, 0), len(columns) - 1)])
+        if plane == "axial":
+            return None, r, c
+        if plane == "coronal":
+            return r, None, c
+        return r, c, None
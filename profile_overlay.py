@@ -0,0 +1,68 @@
+"""On-screen profiling overlay for the viewer.
+
+A small label floated over the top-right corner of a window showing the
+slowest hot paths recorded by ``instrumentation``. It only refreshes
+while it is visible, so a hidden overlay costs nothing.
+"""
+import tkinter as tk
+
+from instrumentation import recorder
+
+# Milliseconds between overlay refreshes
+REFRESH_MS = 500
+
+# Metrics listed in the overlay (most total time first)
+OVERLAY_ROWS = 12
+
+
+class ProfileOverlay:
+    """Toggleable live view of the recorder's metrics on top of a window."""
+
+    def __init__(self, master, rows=OVERLAY_ROWS):
+        self.master = master
+        self.rows = rows
+        self.label = tk.Label(master, justify=tk.LEFT, anchor="nw", font=("Courier", 9),
+                              bg="black", fg="#9f9", padx=6, pady=4)
+        self._after_id = None
+
+    @property
+    def visible(self):
+        return self._after_id is not None
+
+    def show(self):
+        if self.visible:
+            return
+        self.label.place(relx=1.0, rely=0.0, x=-10, y=10, anchor="ne")
+        self.label.lift()
+        self._refresh()
+
+    def hide(self):
+        if self._after_id is not None:
+            try:
+                self.master.after_cancel(self._after_id)
+            except tk.TclError:
+                pass
+            self._after_id = None
+        self.label.place_forget()
+
+    def toggle(self):
+        if self.visible:
+            self.hide()
+        else:
+            self.show()
+
+    def _refresh(self):
+        try:
+            if not self.label.winfo_exists():
+                self._after_id = None
+                return
+        except tk.TclError:
+            self._after_id = None
+            return  # Application closed
+        if recorder.enabled:
+            text = "\n".join(recorder.summary_lines(self.rows))
+        else:
+            text = "Profiling is off"
+        self.label.config(text=text)
+        self.label.lift()
+        self._after_id = self.master.after(REFRESH_MS, self._refresh)
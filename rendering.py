@@ -0,0 +1,220 @@
+"""Fast matplotlib rendering helpers for the Tk viewers.
+
+BlitImageRenderer keeps a single AxesImage and title per Axes and, after
+the first full draw, only restores the cached background and redraws
+those two artists into their own region of the canvas.
+
+TiledImageRenderer shows very large images through a TilePyramid,
+fetching only the tiles of the visible region at the level matching the
+zoom.
+"""
+import time
+from collections import deque
+
+import numpy as np
+from matplotlib.image import AxesImage
+from matplotlib.transforms import Bbox
+
+from instrumentation import span
+
+# Shown (fully transparent) while the view is outside the image
+EMPTY_MOSAIC = np.ma.masked_all((1, 1), np.uint8)
+
+
+class FPSCounter:
+    """Rolling frames-per-second and render-time statistics."""
+
+    def __init__(self, window=60):
+        self._timestamps = deque(maxlen=window)
+        self._render_times = deque(maxlen=window)
+
+    def tick(self, render_seconds=None):
+        """Record one displayed frame (and optionally how long it took to render)."""
+        self._timestamps.append(time.perf_counter())
+        if render_seconds is not None:
+            self._render_times.append(render_seconds)
+
+    @property
+    def fps(self):
+        """Achieved display rate over the recent window."""
+        if len(self._timestamps) < 2:
+            return 0.0
+        span = self._timestamps[-1] - self._timestamps[0]
+        return (len(self._timestamps) - 1) / span if span > 0 else 0.0
+
+    @property
+    def render_ms(self):
+        """Average time spent rendering one frame, in milliseconds."""
+        if not self._render_times:
+            return 0.0
+        return 1000.0 * sum(self._render_times) / len(self._render_times)
+
+    @property
+    def max_fps(self):
+        """Frame rate the renderer could sustain if frames arrived back to back."""
+        render_ms = self.render_ms
+        return 1000.0 / render_ms if render_ms > 0 else 0.0
+
+    def reset(self):
+        self._timestamps.clear()
+        self._render_times.clear()
+
+    def __str__(self):
+        return f"{self.fps:.1f} fps ({self.render_ms:.1f} ms/frame, max {self.max_fps:.0f} fps)"
+
+
+class BlitImageRenderer:
+    """Draw successive frames into one Axes by updating a single AxesImage in place."""
+
+    def __init__(self, canvas, ax, cmap='gray', autoscale=True, interpolation='nearest',
+                 vmin=None, vmax=None, **title_kwargs):
+        self.canvas = canvas
+        self.ax = ax
+        self.fig = ax.figure
+        self.cmap = cmap
+        # Fixed display limits (e.g. 0-255 for windowed frames) turn per-frame autoscaling off
+        self.autoscale = autoscale and vmin is None and vmax is None
+        self.vmin = vmin
+        self.vmax = vmax
+        # Nearest-neighbour avoids matplotlib's costly antialiasing resample on every frame
+        self.interpolation = interpolation
+        self.title_kwargs = title_kwargs
+        self.image = None
+        self.title = None
+        self.background = None
+        self._region = None
+        self.fps = FPSCounter()
+        self._draw_cid = canvas.mpl_connect('draw_event', self._on_draw)
+
+    def show(self, frame, title=""):
+        """Display frame with the given title."""
+        start = time.perf_counter()
+        if self.image is None or self.image.get_array().shape != frame.shape:
+            with span("render.full_draw"):
+                self._setup(frame, title)
+        else:
+            self.image.set_data(frame)
+            if self.autoscale and frame.ndim == 2:
+                self.image.autoscale()
+            self.title.set_text(title)
+            if self.background is None:
+                with span("render.full_draw"):
+                    self.canvas.draw()
+            else:
+                with span("render.blit"):
+                    self.canvas.restore_region(self.background)
+                    self._draw_animated()
+                    self.canvas.blit(self._region)
+        self.fps.tick(time.perf_counter() - start)
+
+    def _setup(self, frame, title):
+        """Create the artists and do the one full draw that caches the background."""
+        self.ax.clear()
+        self.image = self.ax.imshow(frame, cmap=self.cmap, interpolation=self.interpolation,
+                                    vmin=self.vmin, vmax=self.vmax, animated=True)
+        self.title = self.ax.set_title(title, animated=True, **self.title_kwargs)
+        self.ax.axis('off')
+        self.background = None
+        self.canvas.draw()
+
+    def _on_draw(self, event):
+        # Any full redraw (first show, window resize) invalidates the cached background.
+        # Only this Axes' own region is saved and restored, so several renderers
+        # can share one canvas (e.g. the MPR planes) without painting over each other.
+        if self.image is None:
+            return
+        self._region = self._blit_bbox()
+        self.background = self.canvas.copy_from_bbox(self._region)
+        self._draw_animated()
+
+    def _draw_animated(self):
+        self.fig.draw_artist(self.image)
+        self.fig.draw_artist(self.title)
+
+    def _blit_bbox(self):
+        """Region of the Axes extended up to cover its title, within the Axes' columns."""
+        renderer = self.canvas.get_renderer()
+        title_bbox = self.title.get_window_extent(renderer)
+        bbox = self.ax.bbox
+        return Bbox([[bbox.x0, bbox.y0], [bbox.x1, max(bbox.y1, title_bbox.y1 + 2)]])
+
+    def disconnect(self):
+        self.canvas.mpl_disconnect(self._draw_cid)
+
+
+class ViewportImage(AxesImage):
+    """AxesImage that lets its owner refresh the data for the final view just before drawing."""
+
+    def __init__(self, ax, before_draw, **kwargs):
+        super().__init__(ax, **kwargs)
+        self.before_draw = before_draw
+
+    def draw(self, renderer):
+        # By now the Axes has applied its aspect, so limits and size are final
+        self.before_draw()
+        super().draw(renderer)
+
+
+class TiledImageRenderer:
+    """Show a TilePyramid in an Axes, drawing only the visible tiles at the level matching the zoom.
+
+    The image holds a mosaic of the tiles that cover the current view and
+    is refreshed as part of every draw, so panning and zooming (toolbar,
+    scroll wheel) fetch new tiles only when the covering tiles or the
+    level change.
+    """
+
+    def __init__(self, canvas, ax, pyramid, cmap='gray', vmin=0, vmax=255, interpolation='nearest',
+                 zoom_step=1.25):
+        self.canvas = canvas
+        self.ax = ax
+        self.pyramid = pyramid
+        self.zoom_step = zoom_step
+        self._view_key = None
+        self.image = ViewportImage(ax, self.update, cmap=cmap, interpolation=interpolation)
+        self.image.set_clim(vmin, vmax)
+        self.image.set_data(EMPTY_MOSAIC)
+        ax.add_image(self.image)
+        ax.set_aspect('equal')
+        # Limits are driven by the view, never by the mosaic being shown
+        ax.set_autoscale_on(False)
+        self.reset_view()
+        self._scroll_cid = canvas.mpl_connect('scroll_event', self._on_scroll)
+
+    def reset_view(self):
+        """Fit the whole image."""
+        self.ax.set_xlim(-0.5, self.pyramid.width - 0.5)
+        self.ax.set_ylim(self.pyramid.height - 0.5, -0.5)
+
+    def update(self, force=False):
+        """Show the tiles of the current view at the resolution of the screen."""
+        # Axes limits are in pixel-centre coordinates; the pyramid works in pixel edges
+        x0, x1 = (x + 0.5 for x in sorted(self.ax.get_xlim()))
+        y0, y1 = (y + 0.5 for y in sorted(self.ax.get_ylim()))
+        screen_width = max(self.ax.get_window_extent().width, 1.0)
+        level = self.pyramid.level_for((x1 - x0) / screen_width)
+        key = (level,) + self.pyramid.tile_range(level, x0, x1, y0, y1)
+        if key == self._view_key and not force:
+            return
+        self._view_key = key
+        mosaic, extent = self.pyramid.region(level, x0, x1, y0, y1)
+        if mosaic is None:
+            self.image.set_data(EMPTY_MOSAIC)
+        else:
+            self.image.set_data(mosaic)
+            self.image.set_extent(extent)
+
+    def _on_scroll(self, event):
+        if event.inaxes is not self.ax or event.xdata is None:
+            return
+        factor = 1 / self.zoom_step if event.button == 'up' else self.zoom_step
+        x0, x1 = self.ax.get_xlim()
+        y0, y1 = self.ax.get_ylim()
+        # Zoom about the cursor, keeping the point under it fixed
+        self.ax.set_xlim(event.xdata + (x0 - event.xdata) * factor, event.xdata + (x1 - event.xdata) * factor)
+        self.ax.set_ylim(event.ydata + (y0 - event.ydata) * factor, event.ydata + (y1 - event.ydata) * factor)
+        self.canvas.draw_idle()
+
+    def disconnect(self):
+        self.canvas.mpl_disconnect(self._scroll_cid)
+        self.pyramid.close()
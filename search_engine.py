@@ -0,0 +1,361 @@
+"""Inverted-index metadata search across loaded files and indexed folders.
+
+Every element of every document (file) is indexed twice:
+
+* its value tokens (and name tokens) point at (document, tag) postings,
+  for free-text and prefix search;
+* its whole value(s) are filed under the element's tag, for exact, prefix
+  and range queries on one attribute.
+
+Queries are whitespace-separated clauses that must all match:
+
+    Modality=CT                     exact value (case-insensitive)
+    StudyDate=20200101..20201231    inclusive range (either end may be empty)
+    StudyDate>=20200101             comparison (>, >=, <, <=)
+    PatientName=SMITH*              value prefix
+    (0018,0050)=1.25                tags may be keywords or (gggg,eeee)
+    contrast                        free text: a token in any name or value
+    head*                           free text prefix
+    *abd*                           free text substring
+    SMITH^JOHN                      free text with punctuation: all its tokens in one element
+
+Usage:
+    python search_engine.py "Modality=CT StudyDate=20200101..20201231" [--db PATH] [--folder DIR]
+"""
+import argparse
+import re
+import sys
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+from pydicom.datadict import tag_for_keyword
+
+from frame_provider import iter_header_elements
+from metadata_index import element_value_text
+
+# VRs compared as numbers in range queries
+NUMERIC_VRS = {"DS", "IS", "FL", "FD", "SL", "SS", "UL", "US", "SV", "UV"}
+# VRs whose values are dates/times; separators are dropped so they compare as strings
+DATE_TIME_VRS = {"DA", "DT", "TM"}
+
+TOKEN_PATTERN = re.compile(r"[^\s\^\\/,;:'\"\[\]()<>=]+")
+CLAUSE_PATTERN = re.compile(r"^(?P<tag>[^=<>]+?)\s*(?P<op>>=|<=|=|>|<)\s*(?P<value>.*)$")
+TAG_PATTERN = re.compile(r"^\(?([0-9a-fA-F]{4}),?([0-9a-fA-F]{4})\)?$")
+
+
+def split_query(query):
+    """(field clauses, remaining free text) of a query."""
+    fields, words = [], []
+    for clause in query.split():
+        match = CLAUSE_PATTERN.match(clause)
+        if match and parse_tag(match.group("tag")) is not None:
+            fields.append(clause)
+        else:
+            words.append(clause)
+    return fields, " ".join(words)
+
+
+def tokenize(text):
+    """Lower-cased search tokens of a value or element name."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def split_values(text):
+    """Individual values of a (possibly multi-valued) value text."""
+    if text.startswith("[") and text.endswith("]"):
+        return [part.strip().strip("'\"") for part in text[1:-1].split(",")]
+    return text.split("\\") if "\\" in text else [text]
+
+
+def normalize_value(vr, text):
+    text = text.strip().lower()
+    if vr in DATE_TIME_VRS:
+        text = text.replace("-", "").replace(":", "")
+        if vr == "DA":
+            text = text.replace(".", "")
+    return text
+
+
+def parse_tag(text):
+    """Tag (as int) from a keyword or (gggg,eeee) text, or None."""
+    text = text.strip()
+    match = TAG_PATTERN.match(text)
+    if match:
+        return int(match.group(1) + match.group(2), 16)
+    return tag_for_keyword(text)
+
+
+def to_number(text):
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+class FieldValues:
+    """Values of one tag across documents, with a lazily sorted view for ranges."""
+
+    def __init__(self, vr):
+        self.vr = vr
+        self.postings = {}  # normalized value -> array of doc ids
+        self._sorted = None
+
+    def add(self, value, doc):
+        docs = self.postings.get(value)
+        if docs is None:
+            docs = self.postings[value] = array("I")
+        docs.append(doc)
+        self._sorted = None
+
+    def sorted_keys(self):
+        """(keys, numbers) sorted for bisecting; numbers is None for non-numeric tags."""
+        if self._sorted is None:
+            if self.vr in NUMERIC_VRS:
+                pairs = sorted((number, key) for key in self.postings
+                               for number in [to_number(key)] if number is not None)
+                self._sorted = ([key for _, key in pairs], [number for number, _ in pairs])
+            else:
+                self._sorted = (sorted(self.postings), None)
+        return self._sorted
+
+
+class SearchResult:
+    """Documents matching a query, with the tags that matched in each."""
+
+    def __init__(self, index, matches, seconds):
+        self.index = index
+        self.matches = matches  # doc id -> set of matching tags
+        self.seconds = seconds
+
+    def __len__(self):
+        return len(self.matches)
+
+    @property
+    def paths(self):
+        return [self.index.paths[doc] for doc in sorted(self.matches)]
+
+    def items(self):
+        """(path, sorted matching tags) per matching document."""
+        for doc in sorted(self.matches):
+            yield self.index.paths[doc], sorted(self.matches[doc])
+
+
+class SearchIndex:
+    """In-memory inverted index over the metadata of many files."""
+
+    def __init__(self):
+        self.paths = []
+        self._doc_ids = {}
+        self._deleted = set()
+        self._tokens = {}   # token -> array of (doc << 32 | tag) postings
+        self._fields = {}   # tag -> FieldValues
+        self._name_tokens = {}  # token -> set of tags whose name contains it
+        self._names = {}    # tag -> element name
+        self._sorted_tokens = None
+
+    def __len__(self):
+        return len(self.paths) - len(self._deleted)
+
+    def add_document(self, path, elements):
+        """Index one document from (tag, keyword, name, vr, value_text) tuples."""
+        if path in self._doc_ids:
+            self._deleted.add(self._doc_ids[path])
+        doc = len(self.paths)
+        self.paths.append(path)
+        self._doc_ids[path] = doc
+
+        tokens = self._tokens
+        for tag, keyword, name, vr, value in elements:
+            tag = int(tag)
+            if tag not in self._names:
+                self._names[tag] = name
+                for token in tokenize(name) + ([keyword.lower()] if keyword else []):
+                    self._name_tokens.setdefault(token, set()).add(tag)
+
+            posting = (doc << 32) | tag
+            for token in set(tokenize(value)):
+                postings = tokens.get(token)
+                if postings is None:
+                    postings = tokens[token] = array("Q")
+                    self._sorted_tokens = None
+                postings.append(posting)
+
+            field = self._fields.get(tag)
+            if field is None:
+                field = self._fields[tag] = FieldValues(vr)
+            for single in split_values(value):
+                field.add(normalize_value(vr, single), doc)
+        return doc
+
+    def add_dataset(self, path, ds):
+        """Index a loaded pydicom dataset (PixelData is skipped, binary values summarized)."""
+        return self.add_document(path, (
+            (int(element.tag), element.keyword, element.name, element.VR, element_value_text(element))
+            for element in iter_header_elements(ds)
+        ))
+
+    def add_metadata_index(self, metadata_index, folder=None):
+        """Index every file stored in a MetadataIndex (optionally only under folder)."""
+        current_path = None
+        elements = []
+        for path, tag, keyword, name, vr, value in metadata_index.iter_elements(folder):
+            if path != current_path:
+                if current_path is not None:
+                    self.add_document(current_path, elements)
+                current_path, elements = path, []
+            elements.append((tag, keyword, name, vr, value or ""))
+        if current_path is not None:
+            self.add_document(current_path, elements)
+
+    # Query evaluation
+
+    def search(self, query, substring=False):
+        """Run a query (see module docstring). Returns a SearchResult.
+
+        With substring, bare words match anywhere inside a name or value
+        token (as if written *word*), like the viewer's original search.
+        """
+        started = time.perf_counter()
+        matches = None
+        for clause in query.split():
+            clause_matches = self._match_clause(clause, substring)
+            if matches is None:
+                matches = clause_matches
+            else:
+                matches = {doc: matches[doc] | tags for doc, tags in clause_matches.items() if doc in matches}
+            if not matches:
+                break
+        matches = {doc: tags for doc, tags in (matches or {}).items() if doc not in self._deleted}
+        return SearchResult(self, matches, time.perf_counter() - started)
+
+    def _match_clause(self, clause, substring=False):
+        match = CLAUSE_PATTERN.match(clause)
+        if match:
+            tag = parse_tag(match.group("tag"))
+            if tag is not None:
+                return self._match_field(tag, match.group("op"), match.group("value"))
+        # Values are split on punctuation, so a word such as PATIENT'S or
+        # SMITH^JOHN matches the elements that hold all of its tokens
+        matches = None
+        for term in TOKEN_PATTERN.findall(clause.lower()):
+            if substring and "*" not in term:
+                term = f"*{term}*"
+            term_matches = self._match_text(term)
+            if matches is None:
+                matches = term_matches
+            else:
+                matches = {doc: tags & term_matches[doc] for doc, tags in matches.items() if doc in term_matches}
+                matches = {doc: tags for doc, tags in matches.items() if tags}
+            if not matches:
+                break
+        return matches or {}
+
+    def _match_field(self, tag, op, value):
+        field = self._fields.get(tag)
+        if field is None:
+            return {}
+        value = value.strip()
+
+        if op == "=" and ".." in value:
+            low, high = value.split("..", 1)
+            keys = self._range(field, normalize_value(field.vr, low) or None,
+                               normalize_value(field.vr, high) or None, True, True)
+        elif op == "=" and value.endswith("*"):
+            prefix = normalize_value(field.vr, value[:-1])
+            sorted_keys, _ = field.sorted_keys()
+            if field.vr in NUMERIC_VRS:
+                keys = [key for key in field.postings if key.startswith(prefix)]
+            else:
+                start = bisect_left(sorted_keys, prefix)
+                stop = bisect_left(sorted_keys, prefix + "￿")
+                keys = sorted_keys[start:stop]
+        elif op == "=":
+            normalized = normalize_value(field.vr, value)
+            keys = [normalized] if normalized in field.postings else []
+            if not keys and field.vr in NUMERIC_VRS and to_number(normalized) is not None:
+                keys = self._range(field, normalized, normalized, True, True)
+        elif op in (">", ">="):
+            keys = self._range(field, normalize_value(field.vr, value), None, op == ">=", True)
+        else:
+            keys = self._range(field, None, normalize_value(field.vr, value), True, op == "<=")
+
+        matches = {}
+        for key in keys:
+            for doc in field.postings[key]:
+                matches.setdefault(doc, set()).add(tag)
+        return matches
+
+    @staticmethod
+    def _range(field, low, high, include_low, include_high):
+        """Keys of field between low and high (None = unbounded)."""
+        keys, numbers = field.sorted_keys()
+        if numbers is not None:
+            sorted_values = numbers
+            low = to_number(low) if low is not None else None
+            high = to_number(high) if high is not None else None
+        else:
+            sorted_values = keys
+        start = 0 if low is None else (bisect_left if include_low else bisect_right)(sorted_values, low)
+        stop = len(keys) if high is None else (bisect_right if include_high else bisect_left)(sorted_values, high)
+        return keys[start:stop]
+
+    def _sorted_token_list(self):
+        if self._sorted_tokens is None:
+            self._sorted_tokens = sorted(self._tokens)
+        return self._sorted_tokens
+
+    def _matching_tokens(self, term):
+        if term.startswith("*") and term.endswith("*") and len(term) > 2:
+            needle = term.strip("*")
+            return [token for token in self._tokens if needle in token], needle
+        if term.endswith("*"):
+            prefix = term[:-1]
+            tokens = self._sorted_token_list()
+            start = bisect_left(tokens, prefix)
+            stop = bisect_left(tokens, prefix + "￿")
+            return tokens[start:stop], prefix
+        return ([term] if term in self._tokens else []), term
+
+    def _match_text(self, term):
+        matches = {}
+        tokens, needle = self._matching_tokens(term)
+        for token in tokens:
+            for posting in self._tokens[token]:
+                matches.setdefault(posting >> 32, set()).add(posting & 0xFFFFFFFF)
+
+        # Element names match every document that has the element
+        for token, tags in self._name_tokens.items():
+            if token == needle or (term.endswith("*") and token.startswith(needle)) or \
+                    (term.startswith("*") and needle in token):
+                for tag in tags:
+                    for docs in self._fields[tag].postings.values():
+                        for doc in docs:
+                            matches.setdefault(doc, set()).add(tag)
+        return matches
+
+
+def main(argv=None):
+    from metadata_index import DEFAULT_INDEX_PATH, MetadataIndex
+
+    parser = argparse.ArgumentParser(description="Search the DICOM metadata index.")
+    parser.add_argument("query", help="Query, e.g. \"Modality=CT StudyDate=20200101..20201231\"")
+    parser.add_argument("--db", default=DEFAULT_INDEX_PATH, help="Index database path")
+    parser.add_argument("--folder", default=None, help="Only search files under this folder")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    index = SearchIndex()
+    with MetadataIndex(args.db) as metadata_index:
+        index.add_metadata_index(metadata_index, args.folder)
+    print(f"Indexed {len(index)} files in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+    result = index.search(args.query)
+    for path in result.paths:
+        print(path)
+    print(f"{len(result)} matches in {result.seconds * 1000:.1f} ms", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
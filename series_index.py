@@ -0,0 +1,208 @@
+"""Index a folder of DICOM files into sorted study/series volumes.
+
+Headers are read in parallel with only the handful of tags needed for
+grouping and sorting, so a 1,000-file CT series is indexed without
+touching any PixelData. Each resulting Series exposes its slices as a
+FrameProvider that reads one file per frame on demand, so it plugs
+straight into show_slices and display_3d_grid.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pydicom
+from pydicom.errors import InvalidDicomError
+
+from frame_provider import FrameProvider, get_frame_provider
+
+# Folders with at least this many files are indexed with worker processes
+PROCESS_POOL_THRESHOLD = 200
+
+# Tags read while indexing; everything else in the header is skipped
+INDEX_TAGS = [
+    "StudyInstanceUID",
+    "SeriesInstanceUID",
+    "SOPInstanceUID",
+    "SeriesDescription",
+    "StudyDescription",
+    "Modality",
+    "InstanceNumber",
+    "ImagePositionPatient",
+    "ImageOrientationPatient",
+    "Rows",
+    "Columns",
+    "NumberOfFrames",
+]
+
+
+class IndexedFile:
+    """The header fields of one file that grouping and sorting need."""
+
+    def __init__(self, path, ds):
+        self.path = path
+        self.study_uid = str(ds.get("StudyInstanceUID", ""))
+        self.series_uid = str(ds.get("SeriesInstanceUID", ""))
+        self.sop_uid = str(ds.get("SOPInstanceUID", ""))
+        self.series_description = str(ds.get("SeriesDescription", ""))
+        self.study_description = str(ds.get("StudyDescription", ""))
+        self.modality = str(ds.get("Modality", ""))
+        self.instance_number = int(ds.get("InstanceNumber", 0) or 0)
+        self.position = self._floats(ds.get("ImagePositionPatient"), 3)
+        self.orientation = self._floats(ds.get("ImageOrientationPatient"), 6)
+        self.rows = int(ds.get("Rows", 0) or 0)
+        self.columns = int(ds.get("Columns", 0) or 0)
+        self.num_frames = int(ds.get("NumberOfFrames", 1) or 1)
+
+    @staticmethod
+    def _floats(value, count):
+        try:
+            values = [float(v) for v in value]
+        except (TypeError, ValueError):
+            return None
+        return values if len(values) == count else None
+
+
+def read_index_entry(path):
+    """Read just the indexing tags of one file; None if it is not DICOM."""
+    try:
+        ds = pydicom.dcmread(path, stop_before_pixels=True, specific_tags=INDEX_TAGS)
+    except (InvalidDicomError, OSError, ValueError):
+        return None
+    if "Rows" not in ds:
+        return None  # No image (structured reports, presentation states, ...)
+    return IndexedFile(path, ds)
+
+
+def iter_files(folder):
+    for dirpath, dirnames, filenames in os.walk(folder):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            yield os.path.join(dirpath, filename)
+
+
+def index_folder(folder, workers=None):
+    """Read the headers of every file under folder in parallel.
+
+    Header parsing is CPU bound, so large folders on multi-core machines
+    are spread over worker processes; small folders use threads to avoid
+    the process start-up cost. Returns a list of IndexedFile (non-DICOM
+    and non-image files are skipped).
+    """
+    paths = list(iter_files(folder))
+    cpus = os.cpu_count() or 1
+    if len(paths) >= PROCESS_POOL_THRESHOLD and cpus > 1:
+        executor = ProcessPoolExecutor(max_workers=workers or cpus)
+        chunksize = max(16, len(paths) // ((workers or cpus) * 4))
+    else:
+        executor = ThreadPoolExecutor(max_workers=workers or min(32, cpus * 4))
+        chunksize = 16
+    with executor:
+        entries = executor.map(read_index_entry, paths, chunksize=chunksize)
+        return [entry for entry in entries if entry is not None]
+
+
+def slice_sort_key(entry, normal):
+    """Sort by distance along the slice normal, then InstanceNumber, then path."""
+    if normal is not None and entry.position is not None:
+        distance = float(np.dot(entry.position, normal))
+    else:
+        distance = float("inf")
+    return (distance, entry.instance_number, entry.path)
+
+
+class Series:
+    """The sorted files of one series that share an image size."""
+
+    def __init__(self, entries):
+        first = entries[0]
+        self.study_uid = first.study_uid
+        self.series_uid = first.series_uid
+        self.description = first.series_description or first.study_description
+        self.modality = first.modality
+        self.rows = first.rows
+        self.columns = first.columns
+
+        normal = None
+        if first.orientation is not None:
+            normal = np.cross(first.orientation[:3], first.orientation[3:])
+        self.files = sorted(entries, key=lambda entry: slice_sort_key(entry, normal))
+
+        # Spacing between consecutive slice centres along the normal, when known
+        self.slice_spacing = None
+        if normal is not None and len(self.files) > 1 and all(f.position is not None for f in self.files):
+            distances = np.array([np.dot(f.position, normal) for f in self.files])
+            steps = np.diff(distances)
+            if len(steps) and np.all(steps > 0):
+                self.slice_spacing = float(np.median(steps))
+
+    def __len__(self):
+        return len(self.files)
+
+    @property
+    def num_frames(self):
+        return sum(entry.num_frames for entry in self.files)
+
+    @property
+    def label(self):
+        return f"{self.modality} {self.description} ({len(self.files)} files, {self.rows}x{self.columns})".strip()
+
+    def first_dataset(self):
+        """Header of the first slice (for the metadata views and window/level)."""
+        return pydicom.dcmread(self.files[0].path, stop_before_pixels=True)
+
+    def frame_provider(self):
+        """Frames of the whole series, one file read per frame on demand."""
+        if len(self.files) == 1:
+            return get_frame_provider(pydicom.dcmread(self.files[0].path, defer_size="256 KB"))
+        provider = SeriesFrameProvider([entry.path for entry in self.files])
+        provider.slice_spacing = self.slice_spacing
+        return provider
+
+
+class SeriesFrameProvider(FrameProvider):
+    """One frame per single-frame file, read when requested."""
+
+    def __init__(self, paths):
+        self.paths = paths
+        first = pydicom.dcmread(paths[0]).pixel_array
+        super().__init__(len(paths), first.shape, first.dtype)
+        self._first = first
+        self.slice_spacing = None  # Distance between slice centres, when known
+
+    def get_frame(self, index):
+        if index == 0 and self._first is not None:
+            return self._first
+        return pydicom.dcmread(self.paths[index]).pixel_array
+
+    def close(self):
+        self._first = None
+
+
+def group_series(entries):
+    """Group indexed files into Series, largest series first.
+
+    Files are grouped by StudyInstanceUID, SeriesInstanceUID and image
+    size; multi-frame files each form their own series.
+    """
+    groups = {}
+    for entry in entries:
+        if entry.num_frames > 1:
+            key = (entry.study_uid, entry.series_uid, entry.sop_uid)
+        else:
+            key = (entry.study_uid, entry.series_uid, entry.rows, entry.columns)
+        groups.setdefault(key, []).append(entry)
+    series = [Series(group) for group in groups.values()]
+    series.sort(key=lambda s: s.num_frames, reverse=True)
+    return series
+
+
+def load_folder(folder, workers=None, index=None):
+    """Index folder and return its Series, largest first.
+
+    With a MetadataIndex, only new or changed files are parsed and the
+    rest of the headers come from the index.
+    """
+    if index is not None:
+        index.update_folder(folder, workers)
+        return group_series(index.indexed_files(folder))
+    return group_series(index_folder(folder, workers))
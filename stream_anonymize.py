@@ -0,0 +1,77 @@
+"""Streaming anonymization that never loads PixelData.
+
+Only the header (everything before PixelData) is parsed and rewritten
+with ``anonymize_dicom``. The pixel payload, and anything stored after
+it, is copied byte for byte from the source file in fixed-size chunks,
+so multi-gigabyte whole-slide and cine objects are anonymized with
+bounded memory at disk speed.
+"""
+import os
+import shutil
+
+import pydicom
+
+from dicom_core import anonymize_dicom
+from frame_provider import get_transfer_syntax
+
+# Bytes copied per read/write while streaming the pixel payload
+CHUNK_SIZE = 4 * 1024 * 1024
+
+DEFLATED_TRANSFER_SYNTAX = "1.2.840.10008.1.2.1.99"
+
+# Tags at which dcmread(stop_before_pixels=True) stops
+PIXEL_DATA_TAGS = (0x7FE00008, 0x7FE00009, 0x7FE00010)
+
+
+def read_header(fp):
+    """Parse the header of an open file; returns (ds, offset of the pixel element).
+
+    The offset is the start of the first pixel data element's tag, or the
+    end of the file if there is none.
+    """
+    ds = pydicom.dcmread(fp, stop_before_pixels=True)
+    offset = fp.tell()
+    tag_bytes = fp.read(4)
+    if tag_bytes:
+        little_endian = get_transfer_syntax(ds) != "1.2.840.10008.1.2.2"
+        group = int.from_bytes(tag_bytes[:2], "little" if little_endian else "big")
+        element = int.from_bytes(tag_bytes[2:], "little" if little_endian else "big")
+        if (group << 16 | element) not in PIXEL_DATA_TAGS:
+            raise ValueError(f"Unexpected element ({group:04X},{element:04X}) after the header")
+    return ds, offset
+
+
+def copy_range(source, destination, offset, chunk_size=CHUNK_SIZE):
+    """Copy source from offset to its end into destination, chunk by chunk."""
+    source.seek(offset)
+    shutil.copyfileobj(source, destination, chunk_size)
+
+
+def anonymize_stream(source, destination, prefix, chunk_size=CHUNK_SIZE, profile=None):
+    """Anonymize source into destination without loading its pixel data.
+
+    The header is rewritten and PixelData copied verbatim. Deflated files
+    cannot be copied piecewise and are anonymized in memory instead.
+    profile is passed on to anonymize_dicom. Returns the size of the
+    written file.
+    """
+    os.makedirs(os.path.dirname(destination) or ".", exist_ok=True)
+    # Write to a temporary name first so an interrupted run never leaves half-written files
+    partial = destination + ".part"
+    try:
+        with open(source, "rb") as src:
+            ds, offset = read_header(src)
+            if get_transfer_syntax(ds) == DEFLATED_TRANSFER_SYNTAX:
+                src.seek(0)
+                anonymize_dicom(pydicom.dcmread(src), prefix, profile).save_as(partial)
+            else:
+                anonymize_dicom(ds, prefix, profile)
+                with open(partial, "wb") as out:
+                    ds.save_as(out)
+                    copy_range(src, out, offset, chunk_size)
+        os.replace(partial, destination)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    return os.path.getsize(destination)
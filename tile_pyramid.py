@@ -0,0 +1,212 @@
+"""Lazily built multi-resolution tile pyramid for very large images.
+
+Mammography, CR and whole-slide images can be tens of thousands of
+pixels per side; windowing and drawing the whole frame at full
+resolution costs gigabytes and makes every pan or zoom redraw all of it.
+A TilePyramid cuts the image into fixed-size tiles at power-of-two
+downsampling levels and builds each tile only when it is first asked
+for, so the viewer touches just the tiles of the visible region, at the
+level whose resolution matches the screen.
+
+Tiles hold display values (the transform, e.g. a WindowLevel, applied)
+and live in a byte-budgeted LRU cache, the same way FrameCache holds
+frames. A level-n tile is built straight from the source by sampling
+every 2**(n-1)th pixel, windowing the sample through the LUT and
+averaging 2x2 blocks, so opening a huge image reads only a small
+fraction of it. An uncompressed source is a memory-mapped frame (see
+frame_provider), so only the sampled rows come off the disk;
+compressed frames are decoded once.
+"""
+import math
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from instrumentation import span, timed
+
+TILE_SIZE = 512
+DEFAULT_CACHE_BYTES = 192 * 1024 * 1024
+# Rings of tiles around the viewport built ahead of panning
+PREFETCH_MARGIN = 1
+
+
+def downsample_2x(pixels):
+    """Average 2x2 blocks of uint8 pixels (odd edges are repeated)."""
+    rows, columns = pixels.shape[:2]
+    if rows % 2 or columns % 2:
+        pad = ((0, rows % 2), (0, columns % 2)) + ((0, 0),) * (pixels.ndim - 2)
+        pixels = np.pad(pixels, pad, mode="edge")
+    total = pixels[0::2, 0::2].astype(np.uint16)
+    total += pixels[1::2, 0::2]
+    total += pixels[0::2, 1::2]
+    total += pixels[1::2, 1::2]
+    total += 2
+    return (total >> 2).astype(np.uint8)
+
+
+class TilePyramid:
+    """Byte-budgeted LRU cache of display tiles of one image at every power-of-two scale.
+
+    Level 0 is full resolution; each level halves the previous one, down
+    to a level that fits in a single tile. transform, if given, maps a
+    block of stored values to display values (e.g. a WindowLevel).
+    """
+
+    def __init__(self, source, transform=None, tile_size=TILE_SIZE, max_bytes=DEFAULT_CACHE_BYTES,
+                 prefetch=True):
+        self.source = source
+        self.height, self.width = source.shape[:2]
+        self.tile_size = tile_size
+        self.max_bytes = max_bytes
+        self.levels = max(1, math.ceil(math.log2(max(self.height, self.width) / tile_size)) + 1)
+        self._transform = transform
+        self._tiles = OrderedDict()
+        self._bytes = 0
+        self._generation = 0
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tile-prefetch") \
+            if prefetch else None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def nbytes(self):
+        return self._bytes
+
+    def level_shape(self, level):
+        scale = 2 ** level
+        return math.ceil(self.height / scale), math.ceil(self.width / scale)
+
+    def grid(self, level):
+        """(rows, columns) of tiles at level."""
+        rows, columns = self.level_shape(level)
+        return math.ceil(rows / self.tile_size), math.ceil(columns / self.tile_size)
+
+    def level_for(self, pixels_per_screen_pixel):
+        """Coarsest level that still has at least one image pixel per screen pixel."""
+        if pixels_per_screen_pixel <= 1:
+            return 0
+        return min(self.levels - 1, int(math.floor(math.log2(pixels_per_screen_pixel))))
+
+    def set_transform(self, transform):
+        """Change the display transform (e.g. a new window); cached tiles are dropped."""
+        with self._lock:
+            self._transform = transform
+            self._generation += 1
+            self._tiles.clear()
+            self._bytes = 0
+
+    def tile(self, level, row, column):
+        """Display values of one tile, built on first use."""
+        key = (level, row, column)
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile is not None:
+                self._tiles.move_to_end(key)
+                self.hits += 1
+                return tile
+            self.misses += 1
+            generation = self._generation
+        tile = self._build(level, row, column)
+        self._store(key, tile, generation)
+        return tile
+
+    def _build(self, level, row, column):
+        scale = 2 ** level
+        extent = self.tile_size * scale
+        y0, x0 = row * extent, column * extent
+        y1, x1 = min(self.height, y0 + extent), min(self.width, x0 + extent)
+        transform = self._transform
+        with span("pyramid.tile", level=level):
+            if level == 0:
+                block = np.asarray(self.source[y0:y1, x0:x1])
+                return transform(block) if transform is not None else block
+            step = scale // 2
+            sample = np.asarray(self.source[y0:y1:step, x0:x1:step])
+            if transform is not None:
+                sample = transform(sample)
+            return downsample_2x(sample)
+
+    def _store(self, key, tile, generation):
+        with self._lock:
+            if generation != self._generation or key in self._tiles:
+                return
+            self._tiles[key] = tile
+            self._bytes += tile.nbytes
+            while self._bytes > self.max_bytes and len(self._tiles) > 1:
+                _, evicted = self._tiles.popitem(last=False)
+                self._bytes -= evicted.nbytes
+
+    def tile_range(self, level, x0, x1, y0, y1, margin=0):
+        """Rows and columns of the tiles at level covering source pixels x0..x1, y0..y1.
+
+        Coordinates are pixel edges (0 to width/height); the region is
+        clipped to the image, so a region outside it covers no tiles.
+        """
+        x0, x1 = max(0.0, x0), min(float(self.width), x1)
+        y0, y1 = max(0.0, y0), min(float(self.height), y1)
+        if x0 >= x1 or y0 >= y1:
+            return range(0), range(0)
+        extent = self.tile_size * 2 ** level
+        rows, columns = self.grid(level)
+        r0 = max(0, int(y0 // extent) - margin)
+        r1 = min(rows - 1, int(max(y0, y1 - 1) // extent) + margin)
+        c0 = max(0, int(x0 // extent) - margin)
+        c1 = min(columns - 1, int(max(x0, x1 - 1) // extent) + margin)
+        return range(r0, r1 + 1), range(c0, c1 + 1)
+
+    @timed("pyramid.region")
+    def region(self, level, x0, x1, y0, y1, prefetch=True):
+        """Mosaic of the tiles covering a source region, and its extent in source pixels.
+
+        The extent is (left, right, bottom, top) in the image's pixel-centre
+        coordinates, as matplotlib's imshow expects it. Returns (None, None)
+        for a region outside the image.
+        """
+        rows, columns = self.tile_range(level, x0, x1, y0, y1)
+        if not rows or not columns:
+            return None, None
+        bands = [np.concatenate([self.tile(level, r, c) for c in columns], axis=1) for r in rows]
+        mosaic = bands[0] if len(bands) == 1 else np.concatenate(bands, axis=0)
+        scale = 2 ** level
+        extent = self.tile_size * scale
+        left, top = columns[0] * extent - 0.5, rows[0] * extent - 0.5
+        if prefetch:
+            self.prefetch(level, x0, x1, y0, y1)
+        return mosaic, (left, left + mosaic.shape[1] * scale, top + mosaic.shape[0] * scale, top)
+
+    def prefetch(self, level, x0, x1, y0, y1, margin=PREFETCH_MARGIN):
+        """Build the tiles just outside the region on a background thread."""
+        if self._executor is None:
+            return
+        rows, columns = self.tile_range(level, x0, x1, y0, y1, margin)
+        with self._lock:
+            generation = self._generation
+            keys = [(level, r, c) for r in rows for c in columns
+                    if (level, r, c) not in self._tiles and (level, r, c) not in self._pending]
+            self._pending.update(keys)
+        for key in keys:
+            self._executor.submit(self._prefetch_one, key, generation)
+
+    def _prefetch_one(self, key, generation):
+        try:
+            if generation == self._generation:
+                self._store(key, self._build(*key), generation)
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._tiles.clear()
+            self._bytes = 0
+
+    def close(self):
+        self.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,98 @@
+"""Persistent original -> replacement UID mapping for de-identification.
+
+Replacement UIDs are derived from the original UID and a secret that is
+created once and stored with the mapping, so every process (and every
+later run) that uses the same store remaps a study's UIDs identically
+without coordinating. Each mapping handed out is also recorded, so an
+anonymized UID can be traced back by whoever holds the store.
+"""
+import hashlib
+import hmac
+import os
+import secrets
+import sqlite3
+import threading
+
+DEFAULT_UID_MAP_PATH = os.path.join(os.path.expanduser("~"), ".dicom_reader", "uid_map.sqlite")
+
+# Remapped UIDs kept in memory per process; the cache is cleared when full
+CACHE_SIZE = 100_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS uid_map (
+    original TEXT PRIMARY KEY,
+    replacement TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS uid_map_replacement ON uid_map (replacement);
+"""
+
+
+class UIDMap:
+    """SQLite-backed, process-safe UID remapping store."""
+
+    def __init__(self, db_path=DEFAULT_UID_MAP_PATH):
+        self.db_path = db_path
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        with self._conn:
+            # The first process to open the store picks the secret; everyone else reads it
+            self._conn.execute("INSERT OR IGNORE INTO settings (key, value) VALUES ('secret', ?)",
+                               (secrets.token_hex(32),))
+        self.secret = self._conn.execute("SELECT value FROM settings WHERE key = 'secret'").fetchone()[0]
+        self._cache = {}
+        self._pending = []
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def remap(self, uid):
+        """Replacement for uid (the same for every caller sharing this store)."""
+        replacement = self._cache.get(uid)
+        if replacement is None:
+            # A 2.25 (UUID-derived) UID from 128 bits of the keyed hash
+            replacement = "2.25." + str(int(self.keyed_hash(uid)[:32], 16))
+            with self._lock:
+                if len(self._cache) >= CACHE_SIZE:
+                    self._cache.clear()
+                self._cache[uid] = replacement
+                self._pending.append((uid, replacement))
+        return replacement
+
+    def keyed_hash(self, text):
+        """Hex HMAC-SHA256 of text under the store's secret."""
+        return hmac.new(self.secret.encode(), text.encode("utf-8", "replace"), hashlib.sha256).hexdigest()
+
+    def flush(self):
+        """Record the mappings handed out since the last flush."""
+        with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, []
+            with self._conn:
+                self._conn.executemany("INSERT OR IGNORE INTO uid_map (original, replacement) VALUES (?, ?)",
+                                       pending)
+
+    def original(self, replacement):
+        """The original UID behind a replacement, or None if unknown."""
+        self.flush()
+        with self._lock:
+            row = self._conn.execute("SELECT original FROM uid_map WHERE replacement = ?",
+                                     (replacement,)).fetchone()
+        return row[0] if row else None
@@ -0,0 +1,486 @@
+"""Streaming export of DICOM volumes and series to chunked array stores.
+
+Every series of a folder (or a single multi-frame file) is written as a
+Zarr version 2 array: a directory with a ``.zarray`` description, one
+zlib-compressed file per chunk and a ``.zattrs`` sidecar holding the
+geometry and header of the source. Any Zarr v2 reader opens the result
+(``zarr.open("series.zarr")``); without zarr, ``read_store`` loads it with
+NumPy alone.
+
+Frames are the same per-frame pixel data the slice viewer shows, with the
+Modality LUT or Rescale Slope/Intercept applied per file, so CT comes out
+in Hounsfield units; colour images are written unchanged with a trailing
+sample axis. The default dtype is the smallest integer type holding the
+rescaled range, or float32 when the rescale is not integral.
+
+The work is cut into blocks of one chunk depth of slices. Worker
+processes read, rescale, compress and write their own blocks, so the
+parent never holds pixel data and memory stays at a few blocks per
+worker whatever the size of the archive. Chunk files are written to a
+temporary name and renamed into place, and ``.zattrs`` is written last,
+so an interrupted export is resumed by running it again: finished series
+and existing chunks are skipped.
+
+Usage:
+    python volume_export.py INPUT OUTPUT [--chunks 16,256,256] [--level 5]
+                            [--dtype auto|float32|int16|...] [--workers N] [--overwrite]
+
+INPUT is a DICOM file (written to the store OUTPUT) or a folder (each
+series written to OUTPUT/<StudyInstanceUID>/<SeriesInstanceUID>.zarr).
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import time
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import product
+
+import numpy as np
+
+from dicom_core import DicomDocument, get_number_of_frames, read_dicom
+from frame_provider import get_frame_provider, get_frame_shape
+from metadata_index import json_value
+from series_index import load_folder
+from windowing import WindowLevel
+
+DEFAULT_CHUNKS = (16, 256, 256)
+DEFAULT_LEVEL = 5
+STORE_SUFFIX = ".zarr"
+# Blocks queued per worker; each holds one chunk depth of slices in memory
+BLOCKS_PER_WORKER = 2
+
+# Candidate output types for integral rescales, smallest first
+INTEGER_DTYPES = ("u1", "i1", "u2", "i2", "u4", "i4", "i8")
+
+# Header attributes copied into the .zattrs sidecar
+SIDECAR_KEYWORDS = (
+    "PatientID", "StudyInstanceUID", "SeriesInstanceUID", "StudyDate", "Modality",
+    "SeriesDescription", "BodyPartExamined", "PhotometricInterpretation",
+    "PixelSpacing", "SliceThickness", "SpacingBetweenSlices", "ImageOrientationPatient",
+    "ImagePositionPatient", "RescaleSlope", "RescaleIntercept", "RescaleType",
+    "WindowCenter", "WindowWidth",
+)
+
+
+class ExportError(Exception):
+    pass
+
+
+def output_dtype(ds):
+    """Smallest dtype holding ds's rescaled values (float32 for non-integral rescales)."""
+    bits = int(ds.get("BitsAllocated", 16) or 16)
+    if int(ds.get("SamplesPerPixel", 1) or 1) > 1 or "ModalityLUTSequence" in ds:
+        return np.dtype("u1" if bits == 8 else "u2")
+    if "FloatPixelData" in ds or "DoubleFloatPixelData" in ds:
+        return np.dtype("f4")
+    slope = float(ds.get("RescaleSlope", 1) or 1)
+    intercept = float(ds.get("RescaleIntercept", 0) or 0)
+    if not (slope.is_integer() and intercept.is_integer()):
+        return np.dtype("f4")
+    stored_bits = int(ds.get("BitsStored", bits) or bits)
+    if int(ds.get("PixelRepresentation", 0) or 0) == 1:
+        low, high = -(2 ** (stored_bits - 1)), 2 ** (stored_bits - 1) - 1
+    else:
+        low, high = 0, 2 ** stored_bits - 1
+    low, high = sorted((int(low * slope + intercept), int(high * slope + intercept)))
+    for dtype in INTEGER_DTYPES:
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return np.dtype(dtype)
+    return np.dtype("f8")
+
+
+class ChunkLayout:
+    """Shape, chunking and encoding of one store (small enough to send to every task)."""
+
+    def __init__(self, store, shape, chunks, dtype, level=DEFAULT_LEVEL):
+        self.store = store
+        self.shape = tuple(shape)
+        # Chunks never exceed the array; trailing sample axes are not chunked
+        chunks = tuple(chunks[:len(shape)]) + tuple(shape[len(chunks):])
+        self.chunks = tuple(max(1, min(c, s)) for c, s in zip(chunks, self.shape))
+        self.dtype = np.dtype(dtype).newbyteorder("<") if np.dtype(dtype).itemsize > 1 else np.dtype(dtype)
+        self.level = level
+
+    @property
+    def grid(self):
+        return tuple(math.ceil(s / c) for s, c in zip(self.shape, self.chunks))
+
+    def zarray(self):
+        return {
+            "zarr_format": 2,
+            "shape": list(self.shape),
+            "chunks": list(self.chunks),
+            "dtype": self.dtype.str,
+            "compressor": {"id": "zlib", "level": self.level},
+            "fill_value": 0,
+            "order": "C",
+            "filters": None,
+            "dimension_separator": ".",
+        }
+
+    def block_keys(self, z):
+        """Keys of the chunks covering slice block z."""
+        return [".".join(map(str, (z,) + rest)) for rest in product(*(range(n) for n in self.grid[1:]))]
+
+    def block_frames(self, z):
+        start = z * self.chunks[0]
+        return start, min(start + self.chunks[0], self.shape[0])
+
+    def block_done(self, z):
+        return all(os.path.exists(os.path.join(self.store, key)) for key in self.block_keys(z))
+
+    def write_block(self, z, block):
+        """Compress block (the slices of block z) into its chunk files; existing chunks are kept.
+
+        Returns (chunks written, chunks skipped, raw bytes, compressed bytes).
+        """
+        written = skipped = raw = size = 0
+        for key in self.block_keys(z):
+            path = os.path.join(self.store, key)
+            if os.path.exists(path):
+                skipped += 1
+                continue
+            index = [int(i) for i in key.split(".")][1:]
+            region = tuple(slice(i * c, (i + 1) * c) for i, c in zip(index, self.chunks[1:]))
+            chunk = block[(slice(None),) + region]
+            raw += chunk.nbytes
+            if chunk.shape != self.chunks:  # Edge chunks are stored padded to full size
+                padded = np.zeros(self.chunks, self.dtype)
+                padded[tuple(slice(0, n) for n in chunk.shape)] = chunk
+                chunk = padded
+            data = zlib.compress(np.ascontiguousarray(chunk, self.dtype).tobytes(), self.level)
+            temporary = f"{path}.{os.getpid()}.tmp"
+            with open(temporary, "wb") as f:
+                f.write(data)
+            os.replace(temporary, path)
+            written += 1
+            size += len(data)
+        return written, skipped, raw, size
+
+
+class ExportJob:
+    """One series (or multi-frame file) and the store it is written to."""
+
+    def __init__(self, layout, sources, attrs):
+        self.layout = layout
+        self.sources = sources  # [(path, number of frames)] in slice order
+        self.attrs = attrs
+        self.pending = 0
+        self.error = None
+
+    @property
+    def store(self):
+        return self.layout.store
+
+    def is_complete(self):
+        """True when the store was finished with the same layout."""
+        try:
+            with open(os.path.join(self.store, ".zarray"), encoding="utf-8") as f:
+                if json.load(f) != self.layout.zarray():
+                    return False
+            with open(os.path.join(self.store, ".zattrs"), encoding="utf-8") as f:
+                return bool(json.load(f).get("export", {}).get("complete"))
+        except (OSError, ValueError):
+            return False
+
+    def prepare(self, overwrite=False):
+        """Create the store, or check that an interrupted one has the same layout."""
+        zarray_path = os.path.join(self.store, ".zarray")
+        zarray = self.layout.zarray()
+        if os.path.exists(zarray_path):
+            with open(zarray_path, encoding="utf-8") as f:
+                existing = json.load(f)
+            if existing == zarray and not overwrite:
+                return
+            if not overwrite:
+                raise ExportError(f"{self.store} holds a different array; use --overwrite to replace it")
+            for name in os.listdir(self.store):
+                os.remove(os.path.join(self.store, name))
+        os.makedirs(self.store, exist_ok=True)
+        write_json(zarray_path, zarray)
+
+    def segments(self, z):
+        """[(path, first frame, count)] of the frames in slice block z."""
+        start, stop = self.layout.block_frames(z)
+        segments = []
+        offset = 0
+        for path, frames in self.sources:
+            first, last = max(start, offset), min(stop, offset + frames)
+            if first < last:
+                segments.append((path, first - offset, last - first))
+            offset += frames
+        return segments
+
+    def finish(self, seconds):
+        attrs = dict(self.attrs)
+        attrs["export"] = {"complete": True, "seconds": round(seconds, 3),
+                           "created": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        write_json(os.path.join(self.store, ".zattrs"), attrs)
+
+
+def write_json(path, value):
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        json.dump(value, f, indent=1)
+    os.replace(temporary, path)
+
+
+def sidecar_attrs(ds, sources, positions=None, slice_spacing=None, axes=("z", "y", "x")):
+    attrs = {
+        "axes": list(axes),
+        "rescaled": "ModalityLUTSequence" in ds or "RescaleSlope" in ds or "RescaleIntercept" in ds,
+        "dicom": {kw: json_value(ds.get(kw)) for kw in SIDECAR_KEYWORDS if ds.get(kw) not in (None, "")},
+        "sources": [path for path, _ in sources],
+        "header": DicomDocument(ds).metadata(),
+    }
+    if positions and all(p is not None for p in positions):
+        attrs["positions"] = [[float(v) for v in p] for p in positions]
+    if slice_spacing is not None:
+        attrs["slice_spacing"] = slice_spacing
+    return attrs
+
+
+def make_job(ds, sources, store, chunks=DEFAULT_CHUNKS, level=DEFAULT_LEVEL, dtype=None,
+             positions=None, slice_spacing=None):
+    frame_shape = get_frame_shape(ds)
+    shape = (sum(frames for _, frames in sources),) + tuple(frame_shape)
+    axes = ("z", "y", "x") + (("c",) if len(frame_shape) == 3 else ())
+    layout = ChunkLayout(store, shape, chunks, dtype or output_dtype(ds), level)
+    return ExportJob(layout, sources, sidecar_attrs(ds, sources, positions, slice_spacing, axes))
+
+
+def file_job(path, store, **options):
+    """Job exporting every frame of one DICOM file."""
+    ds = read_dicom(path, metadata_only=True)
+    position = ds.get("ImagePositionPatient")
+    positions = [position] if position is not None and get_number_of_frames(ds) == 1 else None
+    return make_job(ds, [(path, get_number_of_frames(ds))], store, positions=positions, **options)
+
+
+def folder_jobs(folder, output_dir, workers=None, **options):
+    """Jobs exporting every series of folder to output_dir/<study>/<series>.zarr."""
+    series_list = load_folder(folder, workers)
+    counts = {}
+    for series in series_list:
+        counts[series.series_uid] = counts.get(series.series_uid, 0) + 1
+    jobs = []
+    for series in series_list:
+        name = series.series_uid
+        if counts[name] > 1:  # Several sizes or multi-frame files in one series
+            name = f"{name}_{series.files[0].sop_uid}"
+        store = os.path.join(output_dir, series.study_uid or "unknown", name + STORE_SUFFIX)
+        sources = [(entry.path, entry.num_frames) for entry in series.files]
+        positions = [entry.position for entry in series.files] if series.num_frames == len(series) else None
+        jobs.append(make_job(series.first_dataset(), sources, store, positions=positions,
+                             slice_spacing=series.slice_spacing, **options))
+    return jobs
+
+
+# Worker side
+
+_source = None  # (path, provider, rescale) of the file this worker process read last
+
+
+def open_source(path):
+    global _source
+    if _source is None or _source[0] != path:
+        if _source is not None:
+            _source[1].close()
+        ds = read_dicom(path)
+        window = WindowLevel(ds)
+        identity = window.modality_lut is None and window.slope == 1 and window.intercept == 0
+        _source = (path, get_frame_provider(ds), None if identity or not window.applies else window.modality)
+    return _source[1], _source[2]
+
+
+def write_block(layout, z, segments):
+    """Read, rescale and write slice block z. Runs inside a worker process."""
+    start, stop = layout.block_frames(z)
+    block = np.empty((stop - start,) + layout.shape[1:], layout.dtype)
+    i = 0
+    for path, first, count in segments:
+        provider, rescale = open_source(path)
+        for index in range(first, first + count):
+            frame = provider[index]
+            values = rescale(frame) if rescale is not None else frame
+            block[i] = values
+            if layout.dtype.kind in "iu" and values.dtype.kind == "f" and not np.array_equal(block[i], values):
+                raise ExportError(f"{path}: rescaled values do not fit {layout.dtype}; "
+                                  "export with --dtype float32")
+            i += 1
+    return layout.write_block(z, block)
+
+
+class ExportSummary:
+    """Running totals for an export."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.exported = 0
+        self.skipped = 0
+        self.failures = []
+        self.chunks_written = 0
+        self.chunks_skipped = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def __str__(self):
+        ratio = self.bytes_in / self.bytes_out if self.bytes_out else 0.0
+        return (f"{self.exported} exported, {self.skipped} already complete, {len(self.failures)} failed; "
+                f"{self.chunks_written} chunks written ({self.chunks_skipped} resumed), "
+                f"{self.bytes_out / 1e6:.1f} MB ({ratio:.1f}x compression) in {self.elapsed:.1f}s "
+                f"({self.bytes_in / 1e6 / self.elapsed if self.elapsed > 0 else 0.0:.1f} MB/s)")
+
+
+def run_export(jobs, workers=None, overwrite=False, progress=None):
+    """Write every job's store and return an ExportSummary.
+
+    Blocks of all jobs share one process pool with at most a few blocks
+    per worker queued. progress, if given, is called with (job, summary)
+    when a job is finished, skipped or failed.
+    """
+    workers = workers or os.cpu_count() or 1
+    max_pending = workers * BLOCKS_PER_WORKER
+    summary = ExportSummary()
+    started = {}
+
+    def settle(future, job, z):
+        job.pending -= 1
+        try:
+            written, skipped, raw, size = future.result()
+        except Exception as e:
+            if job.error is None:
+                job.error = f"{type(e).__name__}: {e}"
+                summary.failures.append(job)
+                if progress:
+                    progress(job, summary)
+            return
+        summary.chunks_written += written
+        summary.chunks_skipped += skipped
+        summary.bytes_out += size
+        summary.bytes_in += raw
+        if job.pending == 0 and job.error is None:
+            job.finish(time.perf_counter() - started[id(job)])
+            summary.exported += 1
+            if progress:
+                progress(job, summary)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+        for job in jobs:
+            if not overwrite and job.is_complete():
+                summary.skipped += 1
+                if progress:
+                    progress(job, summary)
+                continue
+            try:
+                job.prepare(overwrite)
+            except (OSError, ExportError) as e:
+                job.error = str(e)
+                summary.failures.append(job)
+                if progress:
+                    progress(job, summary)
+                continue
+            started[id(job)] = time.perf_counter()
+            blocks = [z for z in range(job.layout.grid[0]) if not job.layout.block_done(z)]
+            summary.chunks_skipped += (job.layout.grid[0] - len(blocks)) * len(job.layout.block_keys(0))
+            job.pending = len(blocks) + 1  # Held until every block is submitted
+            for z in blocks:
+                if job.error is not None:
+                    job.pending -= 1
+                    continue
+                future = executor.submit(write_block, job.layout, z, job.segments(z))
+                pending[future] = (job, z)
+                while len(pending) >= max_pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        settle(future, *pending.pop(future))
+            job.pending -= 1
+            if job.pending == 0 and job.error is None:
+                job.finish(time.perf_counter() - started[id(job)])
+                summary.exported += 1
+                if progress:
+                    progress(job, summary)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                settle(future, *pending.pop(future))
+    return summary
+
+
+def read_store(store):
+    """Load a store written by this module (or any zlib-compressed Zarr v2 array) with NumPy."""
+    with open(os.path.join(store, ".zarray"), encoding="utf-8") as f:
+        meta = json.load(f)
+    shape, chunks, dtype = tuple(meta["shape"]), tuple(meta["chunks"]), np.dtype(meta["dtype"])
+    separator = meta.get("dimension_separator", ".")
+    array = np.full(shape, meta.get("fill_value") or 0, dtype)
+    for index in product(*(range(math.ceil(s / c)) for s, c in zip(shape, chunks))):
+        path = os.path.join(store, separator.join(map(str, index)))
+        if not os.path.exists(path):
+            continue
+        with open(path, "rb") as f:
+            chunk = np.frombuffer(zlib.decompress(f.read()), dtype).reshape(chunks)
+        region = tuple(slice(i * c, min((i + 1) * c, s)) for i, c, s in zip(index, chunks, shape))
+        array[region] = chunk[tuple(slice(0, r.stop - r.start) for r in region)]
+    return array
+
+
+def parse_chunks(text):
+    try:
+        chunks = tuple(int(v) for v in text.split(","))
+    except ValueError:
+        raise argparse.ArgumentTypeError("chunks must be comma-separated integers, e.g. 16,256,256") from None
+    if not 1 <= len(chunks) <= 3 or min(chunks) < 1:
+        raise argparse.ArgumentTypeError("chunks needs 1 to 3 positive sizes (slices, rows, columns)")
+    return chunks + DEFAULT_CHUNKS[len(chunks):]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export DICOM volumes and series to chunked Zarr v2 stores.")
+    parser.add_argument("input", help="DICOM file or folder")
+    parser.add_argument("output", help="Store to write (for a file) or directory of stores (for a folder)")
+    parser.add_argument("--chunks", type=parse_chunks, default=DEFAULT_CHUNKS,
+                        help="Chunk size as slices,rows,columns (default: %(default)s)")
+    parser.add_argument("--level", type=int, default=DEFAULT_LEVEL, choices=range(0, 10), metavar="0-9",
+                        help="zlib compression level (default: %(default)s)")
+    parser.add_argument("--dtype", default="auto",
+                        help="Output dtype, e.g. float32 or int16 (default: smallest that fits)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--overwrite", action="store_true", help="Rewrite finished stores instead of skipping them")
+    args = parser.parse_args(argv)
+
+    dtype = None
+    if args.dtype != "auto":
+        try:
+            dtype = np.dtype(args.dtype)
+        except TypeError:
+            parser.error(f"Unknown dtype: {args.dtype}")
+    options = {"chunks": args.chunks, "level": args.level, "dtype": dtype}
+    if os.path.isdir(args.input):
+        jobs = folder_jobs(args.input, args.output, args.workers, **options)
+    elif os.path.isfile(args.input):
+        jobs = [file_job(args.input, args.output, **options)]
+    else:
+        parser.error(f"Input not found: {args.input}")
+
+    def progress(job, summary):
+        status = "failed: " + job.error if job.error else "done"
+        print(f"{job.store}: {status}", file=sys.stderr if job.error else sys.stdout)
+
+    summary = run_export(jobs, args.workers, args.overwrite, progress)
+    print(summary)
+    return 1 if summary.failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
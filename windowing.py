@@ -0,0 +1,181 @@
+"""Modality / VOI / display lookup-table pipeline.
+
+Maps stored pixel values straight to 8-bit display values. For integer
+data of up to 16 bits the whole chain (Rescale Slope/Intercept or
+Modality LUT, Window Center/Width or VOI LUT, MONOCHROME1 inversion) is
+folded into one table indexed by the raw stored value, so a frame costs a
+single np.take. Tables are cached per window setting so window/level
+drags and cine playback only rebuild them when the window changes.
+"""
+from collections import OrderedDict
+
+import numpy as np
+
+from instrumentation import timed
+
+LUT_CACHE_SIZE = 32
+
+
+def first_value(value):
+    """First entry of a possibly multi-valued element (Window Center etc.)."""
+    if isinstance(value, (str, bytes)) or not hasattr(value, "__len__"):
+        return value
+    return value[0] if len(value) else None
+
+
+def lut_sequence_table(item):
+    """Return (first_mapped, data, bits) for a Modality/VOI LUT Sequence item."""
+    descriptor = item.LUTDescriptor
+    entries = int(descriptor[0]) or 65536
+    first_mapped = int(descriptor[1])
+    bits = int(descriptor[2])
+    data = item.LUTData
+    if isinstance(data, (bytes, bytearray)):
+        data = np.frombuffer(data, dtype=np.uint8 if bits <= 8 else np.uint16)
+    data = np.asarray(data, dtype=np.float64)[:entries]
+    return first_mapped, data, bits
+
+
+def apply_lut_table(values, first_mapped, data):
+    index = np.clip(np.rint(values - first_mapped), 0, len(data) - 1).astype(np.intp)
+    return data[index]
+
+
+def window_linear(values, center, width):
+    """DICOM LINEAR window function (PS3.3 C.11.2.1.2.1) scaled to 0..1."""
+    width = max(width, 1.0)
+    if width == 1.0:
+        return (values > center - 0.5).astype(np.float64)
+    return np.clip((values - (center - 0.5)) / (width - 1) + 0.5, 0.0, 1.0)
+
+
+def window_linear_exact(values, center, width):
+    """DICOM LINEAR_EXACT window function scaled to 0..1."""
+    width = max(width, np.finfo(np.float64).eps)
+    return np.clip((values - center) / width + 0.5, 0.0, 1.0)
+
+
+def window_sigmoid(values, center, width):
+    """DICOM SIGMOID window function scaled to 0..1."""
+    width = max(width, np.finfo(np.float64).eps)
+    return 1.0 / (1.0 + np.exp(-4.0 * (values - center) / width))
+
+
+WINDOW_FUNCTIONS = {
+    "LINEAR": window_linear,
+    "LINEAR_EXACT": window_linear_exact,
+    "SIGMOID": window_sigmoid,
+}
+
+
+class WindowLevel:
+    """Stored value -> uint8 display pipeline for one grayscale image or series.
+
+    The initial window comes from Window Center/Width (first value) or
+    the VOI LUT Sequence; without either, it spans the modality values of
+    sample_frame (or the full stored range). Colour images pass through
+    unchanged.
+    """
+
+    def __init__(self, ds, sample_frame=None):
+        photometric = str(ds.get("PhotometricInterpretation", "MONOCHROME2")).upper()
+        self.applies = photometric.startswith("MONOCHROME") and int(ds.get("SamplesPerPixel", 1) or 1) == 1
+        self.invert = photometric == "MONOCHROME1"
+
+        self.bits_allocated = int(ds.get("BitsAllocated", 16) or 16)
+        self.signed = int(ds.get("PixelRepresentation", 0) or 0) == 1
+
+        self.slope = float(ds.get("RescaleSlope", 1) or 1)
+        self.intercept = float(ds.get("RescaleIntercept", 0) or 0)
+        self.modality_lut = None
+        if "ModalityLUTSequence" in ds and len(ds.ModalityLUTSequence):
+            self.modality_lut = lut_sequence_table(ds.ModalityLUTSequence[0])
+
+        self.function = str(ds.get("VOILUTFunction", "LINEAR") or "LINEAR").upper()
+        if self.function not in WINDOW_FUNCTIONS:
+            self.function = "LINEAR"
+
+        self.voi_lut = None
+        center = first_value(ds.get("WindowCenter"))
+        width = first_value(ds.get("WindowWidth"))
+        if center is not None and width is not None and float(width) > 0:
+            self.center, self.width = float(center), float(width)
+        else:
+            if "VOILUTSequence" in ds and len(ds.VOILUTSequence):
+                self.voi_lut = lut_sequence_table(ds.VOILUTSequence[0])
+            self.center, self.width = self.auto_window(sample_frame)
+        self.default_window = (self.center, self.width)
+
+        self._tables = OrderedDict()
+
+    def modality(self, stored):
+        """Stored values -> modality (e.g. Hounsfield) values."""
+        if self.modality_lut is not None:
+            first_mapped, data, _ = self.modality_lut
+            return apply_lut_table(stored, first_mapped, data)
+        return stored * self.slope + self.intercept
+
+    def auto_window(self, sample_frame=None):
+        """Window spanning the sample frame's values, or the whole stored range."""
+        if sample_frame is not None and np.size(sample_frame):
+            values = self.modality(np.asarray(sample_frame, dtype=np.float64))
+            low, high = float(values.min()), float(values.max())
+        else:
+            bits = self.bits_allocated
+            low, high = (-(2 ** (bits - 1)), 2 ** (bits - 1) - 1) if self.signed else (0, 2 ** bits - 1)
+            low, high = sorted((float(self.modality(np.float64(low))), float(self.modality(np.float64(high)))))
+        return (low + high) / 2.0, max(high - low, 1.0)
+
+    def set_window(self, center, width):
+        self.center = float(center)
+        self.width = max(float(width), 1.0)
+
+    def reset_window(self):
+        self.center, self.width = self.default_window
+
+    def to_display(self, values):
+        """Modality values -> float display values in 0..255."""
+        if self.voi_lut is not None and (self.center, self.width) == self.default_window:
+            first_mapped, data, bits = self.voi_lut
+            scaled = apply_lut_table(values, first_mapped, data) / float(2 ** bits - 1)
+        else:
+            scaled = WINDOW_FUNCTIONS[self.function](values, self.center, self.width)
+        if self.invert:
+            scaled = 1.0 - scaled
+        return scaled * 255.0
+
+    def table(self):
+        """Full stored-value -> uint8 table for the current window (cached)."""
+        key = (self.center, self.width, self.function)
+        table = self._tables.get(key)
+        if table is not None:
+            self._tables.move_to_end(key)
+            return table
+
+        # Entry k corresponds to the stored value whose bit pattern is k
+        bits = self.bits_allocated
+        unsigned = np.arange(2 ** bits, dtype=np.uint8 if bits == 8 else np.uint16)
+        stored = unsigned.view(np.int8 if bits == 8 else np.int16) if self.signed else unsigned
+        table = np.rint(self.to_display(self.modality(stored.astype(np.float64)))).astype(np.uint8)
+
+        self._tables[key] = table
+        if len(self._tables) > LUT_CACHE_SIZE:
+            self._tables.popitem(last=False)
+        return table
+
+    @timed("lut.apply")
+    def apply(self, frame):
+        """Map one frame of stored values to uint8 display values."""
+        if not self.applies:
+            return frame
+        frame = np.asarray(frame)
+        if self.bits_allocated in (8, 16) and frame.dtype.kind in "iu" and frame.dtype.itemsize * 8 == self.bits_allocated:
+            if not frame.dtype.isnative:
+                frame = frame.astype(frame.dtype.newbyteorder("="))
+            index = frame.view(np.uint8 if self.bits_allocated == 8 else np.uint16)
+            return np.take(self.table(), index)
+        # Wider or floating point data: evaluate the chain directly
+        values = self.modality(frame.astype(np.float64))
+        return np.rint(self.to_display(values)).astype(np.uint8)
+
+    __call__ = apply